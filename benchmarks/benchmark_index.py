@@ -0,0 +1,80 @@
+"""
+Benchmark comparing the recall and query latency of the approximate IVFIndex against the exact search
+on synthetic face encodings.
+
+Run it from the project directory with:
+
+    python -m benchmarks.benchmark_index
+"""
+import time
+
+import numpy as np
+
+from video_player.IVFIndex import IVFIndex
+
+
+def synthetic_gallery(size, rng):
+    """
+    Creates a gallery of unit-scaled random encodings and queries which are noisy versions of gallery entries,
+    mimicking a second picture of a known person
+
+    :param size: number of identities in the gallery
+    :type size: int
+    :param rng: the random generator to use
+    :type rng: numpy.random.Generator
+    """
+    gallery = rng.normal(scale=0.09, size=(size, 128)).astype(np.float32)
+    targets = rng.integers(0, size, 500)
+    queries = gallery[targets] + rng.normal(scale=0.02, size=(len(targets), 128)).astype(np.float32)
+    return gallery, queries
+
+
+def exact_search(gallery, queries):
+    """
+    Returns the index of the closest gallery entry for each query using the brute force search
+    """
+    squared_norms = np.einsum("ij,ij->i", gallery, gallery)
+    return np.array([np.argmin(squared_norms - 2 * (gallery @ query)) for query in queries])
+
+
+def index_search(index, gallery, queries):
+    """
+    Returns the index of the closest gallery entry for each query using the candidates of the index
+    """
+    results = []
+    for query in queries:
+        candidates = index.candidates(query)
+        results.append(candidates[np.argmin(np.sum((gallery[candidates] - query) ** 2, axis=1))])
+    return np.array(results)
+
+
+def run(sizes=(10_000, 50_000, 100_000), n_probes=(1, 4, 8, 16, 32)):
+    """
+    Prints recall@1 and mean query latency of the index for each gallery size and n_probe value
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'identities':>10} {'method':>12} {'recall@1':>9} {'ms/query':>9}")
+    for size in sizes:
+        gallery, queries = synthetic_gallery(size, rng)
+
+        start = time.perf_counter()
+        expected = exact_search(gallery, queries)
+        exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        print(f"{size:>10} {'exact':>12} {1.0:>9.3f} {exact_ms:>9.3f}")
+
+        start = time.perf_counter()
+        index = IVFIndex()
+        index.build(gallery, [str(i) for i in range(size)])
+        print(f"{size:>10} {'build (s)':>12} {'':>9} {time.perf_counter() - start:>9.3f}")
+
+        for n_probe in n_probes:
+            index.n_probe = n_probe
+            start = time.perf_counter()
+            found = index_search(index, gallery, queries)
+            index_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            recall = np.mean(found == expected)
+            print(f"{size:>10} {f'n_probe={n_probe}':>12} {recall:>9.3f} {index_ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,293 @@
+"""
+Reproducible CPU benchmark of the recognition pipeline. It needs neither a display, a GPU nor VLC: the video frames
+are synthesised from the face in resources/face_detected.jpg pasted onto a seeded background at several resolutions
+and face counts, the galleries are synthetic encodings.
+
+Timed are the face detector backends (speed and recall on the synthesised faces), the face encoding, the matching
+against galleries of 10, 1k and 100k identities and the per frame path of the video player (resize, colour conversion,
+tracking, drawing) with and without a detection pass.
+The dlib detectors and the encoding benchmarks are skipped if face_recognition (dlib) is not installed, the OpenCV
+detectors if their model files are missing.
+
+Run it from the project directory with:
+
+    python -m benchmarks.benchmark_pipeline --output results.json
+
+and compare the JSON files of two commits to approve upgrades and tuning changes.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from video_player.EncodingManager import EncodingManager
+from video_player.EncodingStore import ENCODING_SIZE, EncodingStore
+from video_player.FaceDetectors import DETECTOR_NAMES, create_detector
+from video_player.FaceDrawing import draw_face_rectangles
+from video_player.FaceTracker import FaceTracker
+
+RESOURCE_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resources", "face_detected.jpg")
+
+
+def load_face(face_recognition):
+    """
+    Returns the BGR crop of the face in the resource image with a margin around it. Without face_recognition the
+    face location cannot be determined, then the central part of the image is used.
+    """
+    image = cv2.imread(RESOURCE_IMAGE)
+    height, width = image.shape[:2]
+    top, right, bottom, left = height // 4, width * 3 // 4, height * 3 // 4, width // 4
+    if face_recognition is not None:
+        locations = face_recognition.face_locations(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        if locations:
+            top, right, bottom, left = locations[0]
+    margin = (bottom - top) // 2
+    return image[max(0, top - margin):bottom + margin, max(0, left - margin):right + margin].copy()
+
+
+def synthesise_frame(resolution, face, face_count, rng):
+    """
+    Creates a BGR frame of the given resolution with face_count copies of the face on a noisy gradient background,
+    each copy is scaled to a fifth of the frame height
+
+    :param resolution: width and height of the frame
+    :type resolution: tuple
+    :param face: BGR image of the face
+    :type face: numpy.ndarray
+    :param face_count: number of faces in the frame
+    :type face_count: int
+    :param rng: the random generator to use
+    :type rng: numpy.random.Generator
+    :return: tuple (frame, list of the face locations (top, right, bottom, left))
+    """
+    width, height = resolution
+    gradient = np.linspace(40, 160, width, dtype=np.float32)[None, :, None]
+    frame = (gradient + rng.normal(scale=10, size=(height, width, 3))).clip(0, 255).astype(np.uint8)
+
+    face_height = height // 5
+    face_width = face_height * face.shape[1] // face.shape[0]
+    scaled_face = cv2.resize(face, (face_width, face_height), interpolation=cv2.INTER_AREA)
+    columns = max(1, width // (face_width + 10))
+    locations = []
+    for face_nr in range(face_count):
+        row, column = divmod(face_nr, columns)
+        top, left = 10 + row * (face_height + 10), 10 + column * (face_width + 10)
+        if top + face_height > height:
+            break
+        frame[top:top + face_height, left:left + face_width] = scaled_face
+        locations.append((top, left + face_width, top + face_height, left))
+    return frame, locations
+
+
+def synthetic_encoding_manager(directory, gallery_size, rng):
+    """
+    Creates an EncodingManager on an encoding store with gallery_size identities of random encodings
+    """
+    names = [f"person_{identity_nr}" for identity_nr in range(gallery_size)]
+    encodings = rng.normal(scale=0.09, size=(gallery_size, ENCODING_SIZE)).astype(np.float32)
+    EncodingStore(directory).append(names, encodings)
+    return EncodingManager(logging.getLogger(), directory)
+
+
+def detection_recall(expected_locations, found_locations):
+    """
+    Returns the share of the expected faces whose centre lies within a found face location, the backends differ in how
+    tightly their boxes enclose a face, hence the intersection over union is not used
+    """
+    if len(expected_locations) == 0:
+        return 1.0
+    found = 0
+    for top, right, bottom, left in expected_locations:
+        center_y, center_x = (top + bottom) / 2, (left + right) / 2
+        found += any(found_top <= center_y <= found_bottom and found_left <= center_x <= found_right
+                     for found_top, found_right, found_bottom, found_left in found_locations)
+    return found / len(expected_locations)
+
+
+def create_detectors(names):
+    """
+    Creates the detector backends which are available, the others are reported and skipped
+
+    :return: dictionary from backend name to detector
+    """
+    detectors = {}
+    for name in names:
+        try:
+            detectors[name] = create_detector(name)
+        except (ImportError, IOError, ValueError) as error:
+            print(f"Detector {name} is not available and skipped: {error}")
+    return detectors
+
+
+def time_runs(function, repeats, warmup=1):
+    """
+    Calls the function warmup times without and repeats times with timing
+
+    :return: dictionary with the keys runs, mean_ms, median_ms, p95_ms and min_ms
+    """
+    for _ in range(warmup):
+        function()
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    durations = np.array(durations)
+    return {"runs": repeats, "mean_ms": float(durations.mean()), "median_ms": float(np.median(durations)),
+            "p95_ms": float(np.percentile(durations, 95)), "min_ms": float(durations.min())}
+
+
+def frame_path(frame_bgra, tracker, display_size, buffers, faces, recognizer=None):
+    """
+    Runs the per frame path of the video player on a BGRA frame as it is received from vlc: resize into the display
+    buffer, tracking, drawing and conversion into the displayed channel order. With a recognizer the colour
+    conversion of the full frame and a synchronous detection pass are added.
+    """
+    display_bgra, display_rgbx, rgb_frame = buffers
+    cv2.resize(frame_bgra, display_size, dst=display_bgra, interpolation=cv2.INTER_LINEAR)
+    tracker.track(frame_bgra)
+    if recognizer is not None:
+        faces = recognizer.recognize(cv2.cvtColor(frame_bgra, cv2.COLOR_BGRA2RGB, dst=rgb_frame))
+    scale = display_size[0] / frame_bgra.shape[1]
+    draw_face_rectangles(display_bgra, [(tuple(int(coordinate * scale) for coordinate in location), name, distance)
+                                        for location, name, distance in faces])
+    cv2.cvtColor(display_bgra, cv2.COLOR_BGRA2RGBA, dst=display_rgbx)
+
+
+def git_commit():
+    """
+    Returns the hash of the checked out commit, None outside of a git repository
+    """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(resolutions=((640, 360), (1280, 720), (1920, 1080)), face_counts=(1, 4, 8),
+        gallery_sizes=(10, 1_000, 100_000), repeats=10, model="hog", detection_max_size=640, seed=0,
+        detector_names=DETECTOR_NAMES):
+    """
+    Runs all benchmarks and returns the results
+
+    :return: dictionary with the keys environment and results, the results are a list of dictionaries with the
+    benchmark name, its parameters and the timings
+    """
+    try:
+        import face_recognition
+    except ImportError:
+        face_recognition = None
+
+    rng = np.random.default_rng(seed)
+    cv2.setRNGSeed(seed)
+    face = load_face(face_recognition)
+    results = []
+
+    def add(benchmark, parameters, timings):
+        results.append({"benchmark": benchmark, **parameters, **timings})
+        print(f"{benchmark:<22} {json.dumps(parameters):<60} median {timings['median_ms']:9.3f}ms", flush=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # matching does not need dlib, it works on synthetic encodings
+        managers = {size: synthetic_encoding_manager(os.path.join(directory, str(size)), size, rng)
+                    for size in gallery_sizes}
+        for gallery_size, manager in managers.items():
+            for face_count in face_counts:
+                queries = rng.normal(scale=0.09, size=(face_count, ENCODING_SIZE)).astype(np.float32)
+                add("matching", {"gallery_size": gallery_size, "faces": face_count},
+                    time_runs(lambda: manager.match(queries), repeats * 10))
+
+        detectors = create_detectors(detector_names)
+        recognizer = None
+        if face_recognition is not None:
+            from video_player.FaceRecognizer import FaceRecognizer
+            recognizer = FaceRecognizer(managers[min(gallery_sizes)], model, detection_max_size)
+
+        for resolution in resolutions:
+            for face_count in face_counts:
+                frame, locations = synthesise_frame(resolution, face, face_count, rng)
+                parameters = {"resolution": f"{resolution[0]}x{resolution[1]}", "faces": len(locations)}
+                frame_bgra = cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+                display_size = (960, resolution[1] * 960 // resolution[0])
+                buffers = (np.empty((display_size[1], display_size[0], 4), dtype=np.uint8),
+                           np.empty((display_size[1], display_size[0], 4), dtype=np.uint8),
+                           np.empty((resolution[1], resolution[0], 3), dtype=np.uint8))
+                faces = [(location, "person", 0.4) for location in locations]
+                tracker = FaceTracker()
+                tracker.associate(locations, lambda new_locations: [("person", 0.4)] * len(new_locations))
+                add("frame_path", parameters,
+                    time_runs(lambda: frame_path(frame_bgra, tracker, display_size, buffers, faces), repeats * 5))
+
+                # the detectors run on the frame downscaled to detection_max_size as in the FaceRecognizer
+                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                scale = min(1, (detection_max_size or max(resolution)) / max(resolution))
+                detection_rgb = cv2.resize(rgb, (int(resolution[0] * scale), int(resolution[1] * scale)),
+                                           interpolation=cv2.INTER_AREA)
+                scaled_locations = [tuple(coordinate * scale for coordinate in location) for location in locations]
+                for detector_name, detector in detectors.items():
+                    timings = time_runs(lambda: detector.locate(detection_rgb), repeats)
+                    timings["recall"] = detection_recall(scaled_locations, detector.locate(detection_rgb))
+                    add("detection", {**parameters, "detector": detector_name,
+                                      "detection_max_size": detection_max_size}, timings)
+
+                if recognizer is None:
+                    continue
+                detection_parameters = {**parameters, "model": model, "detection_max_size": detection_max_size}
+                found = recognizer.locate(rgb)
+                add("encoding", {**parameters, "detected_faces": len(found)},
+                    time_runs(lambda: recognizer.encode(rgb, found), repeats))
+                add("frame_path_detection", detection_parameters,
+                    time_runs(lambda: frame_path(frame_bgra, tracker, display_size, buffers, faces, recognizer),
+                              repeats))
+
+    if face_recognition is None:
+        print("face_recognition is not installed, the encoding and full frame detection benchmarks were skipped")
+
+    environment = {"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+                   "processor": platform.processor(), "cpu_count": os.cpu_count(), "numpy": np.__version__,
+                   "opencv": cv2.__version__, "dlib_available": face_recognition is not None, "seed": seed,
+                   "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    return {"environment": environment, "results": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CPU benchmark of the recognition pipeline")
+    parser.add_argument("-o", "--output", help="JSON file the results are written to")
+    parser.add_argument("--resolutions", default="640x360,1280x720,1920x1080",
+                        help="comma separated frame resolutions WIDTHxHEIGHT")
+    parser.add_argument("--faces", default="1,4,8", help="comma separated numbers of faces per frame")
+    parser.add_argument("--galleries", default="10,1000,100000", help="comma separated numbers of known identities")
+    parser.add_argument("--repeats", type=int, default=10, help="timed runs of the slowest benchmarks")
+    parser.add_argument("--model", choices=DETECTOR_NAMES, default="hog",
+                        help="face detector backend of the encoding and full frame benchmarks")
+    parser.add_argument("--detectors", default=",".join(DETECTOR_NAMES),
+                        help="comma separated face detector backends to compare")
+    parser.add_argument("--detection-max-size", type=int, default=640,
+                        help="maximal long edge the face detection runs on, 0 for the full resolution")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic frames and galleries")
+    args = parser.parse_args(argv)
+
+    report = run(resolutions=[tuple(int(size) for size in resolution.split("x"))
+                              for resolution in args.resolutions.split(",")],
+                 face_counts=[int(count) for count in args.faces.split(",")],
+                 gallery_sizes=[int(size) for size in args.galleries.split(",")],
+                 repeats=max(1, args.repeats), model=args.model,
+                 detection_max_size=args.detection_max_size or None, seed=args.seed,
+                 detector_names=args.detectors.split(","))
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
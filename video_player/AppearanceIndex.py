@@ -0,0 +1,450 @@
+"""
+A script to maintain a persistent index of which persons appear in which video files at which times. The face
+encodings found in the videos are stored in a SQLite database, such that new identities of the encoding manager are
+matched against them without decoding the videos again.
+"""
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import sys
+
+import cv2
+import numpy as np
+
+from video_player.DetectionCache import DetectionCache
+from video_player.EncodingStore import ENCODING_SIZE
+from video_player.VideoAnalyzer import get_video_info, seek_frame, split_into_segments
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".avi", ".mov", ".webm", ".m4v", ".mpg", ".mpeg", ".ts", ".wmv", ".flv")
+"""File extensions of the videos which are indexed when a directory is added, compared case-insensitively"""
+
+_recognizer = None
+"""Face recognizer of an indexing process, created once per process by _init_worker"""
+
+
+def _init_worker(settings):
+    """
+    Creates the face recognizer of an indexing process, such that the face models are loaded once per process instead
+    of once per segment
+    """
+    # the face stack is only imported by the indexing processes
+    from video_player.FaceRecognizer import FaceRecognizer
+
+    global _recognizer
+    # the faces are only encoded here, the index matches them against the known encodings
+    _recognizer = FaceRecognizer(None, settings["face_recognition_model"], settings["detection_max_size"],
+                                 settings["number_of_times_to_upsample"])
+
+
+def find_videos(paths):
+    """
+    Returns the video files of the given files and directory trees
+
+    :param paths: paths of video files or directories
+    :type paths: list
+    :return: sorted list of paths
+    """
+    videos = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                videos.update(os.path.join(root, file_name) for file_name in files
+                              if file_name.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            videos.add(path)
+    return sorted(videos)
+
+
+def detect_segment(source, first_frame, end_frame, step_frames, settings):
+    """
+    Detects and encodes the faces on every step_frames-th frame of [first_frame, end_frame) of the video file
+
+    :param source: path to the video file
+    :type source: str
+    :param first_frame: number of the first frame of the segment
+    :type first_frame: int
+    :param end_frame: number of the first frame after the segment
+    :type end_frame: int
+    :param step_frames: number of frames between two detected frames
+    :type step_frames: int
+    :param settings: dictionary with the keys face_recognition_model, detection_max_size and
+    number_of_times_to_upsample
+    :type settings: dict
+    :return: list of tuples (time in milliseconds, face encodings) of the frames with faces
+    """
+    if _recognizer is None:
+        _init_worker(settings)
+
+    capture = cv2.VideoCapture(source)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25
+    position = seek_frame(capture, first_frame)
+
+    detections = []
+    for frame_nr in range(position, end_frame):
+        if frame_nr % step_frames != 0:
+            if not capture.grab():
+                break
+            continue
+        success, frame = capture.read()
+        if not success:
+            break
+        _, face_encodings = _recognizer.detect(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        if len(face_encodings):
+            # the timestamp of the decoded frame, the frame number only approximates it for a variable frame rate
+            time_ms = int(capture.get(cv2.CAP_PROP_POS_MSEC) or frame_nr / fps * 1000)
+            detections.append((time_ms, np.asarray(face_encodings, dtype=np.float32)))
+    capture.release()
+    return detections
+
+
+def _detect_segment(arguments):
+    """
+    Unpacks the arguments of detect_segment, used as target of the process pool
+    """
+    return detect_segment(*arguments)
+
+
+class AppearanceIndex:
+
+    def __init__(self, logger, path=None, tolerance=0.6, max_gap_ms=2000):
+        """
+        Constructor of the AppearanceIndex
+
+        Stores the face encodings found in video files together with their time and closest identity, and the segments
+        in which each identity appears in each file. The segments are keyed by the name of the identity, such that a
+        query does not depend on the size of the library.
+
+        :param logger: object used to perform logging
+        :type logger: logging.Logger
+
+        :param path: path of the SQLite database file, None to use appearance_index.sqlite3 in the project directory
+        :type path: str
+
+        :param tolerance: maximal distance between two encodings to count as a match
+        :type tolerance: float
+
+        :param max_gap_ms: maximal time between two sightings of a person to belong to the same segment
+        :type max_gap_ms: int
+        """
+        if path is None:
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "appearance_index.sqlite3")
+        self.path = path
+        """Path of the SQLite database file"""
+        self.__logger = logger
+        self.__tolerance = tolerance
+        self.__max_gap_ms = max_gap_ms
+
+        self.__connection = sqlite3.connect(path)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                media TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                duration_ms INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS faces (
+                media TEXT NOT NULL,
+                time_ms INTEGER NOT NULL,
+                encoding BLOB NOT NULL,
+                name TEXT NOT NULL,
+                distance REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS faces_by_media ON faces (media, time_ms);
+            CREATE TABLE IF NOT EXISTS appearances (
+                name TEXT NOT NULL,
+                media TEXT NOT NULL,
+                start_ms INTEGER NOT NULL,
+                end_ms INTEGER NOT NULL,
+                distance REAL NOT NULL,
+                sightings INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS appearances_by_name ON appearances (name, media, start_ms);
+            CREATE INDEX IF NOT EXISTS appearances_by_media ON appearances (media);
+            CREATE TABLE IF NOT EXISTS gallery (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """)
+        self.__connection.commit()
+        self.__logger_info(f"Opened appearance index {path}")
+
+    def add_files(self, paths, enc_manager, step_ms=500, processes=None, face_recognition_model="hog",
+                  detection_max_size=640, number_of_times_to_upsample=1):
+        """
+        Indexes the video files which are not indexed yet, files are recognized by their content such that moved or
+        renamed files are not decoded again. The faces of indexed files are matched against identities added to the
+        encoding manager since the last update before.
+
+        :param paths: paths of video files or directories containing video files
+        :type paths: list
+
+        :param enc_manager: the encoding manager the faces are matched against
+        :type enc_manager: video_player.EncodingManager.EncodingManager
+
+        :param step_ms: time between two analysed frames in milliseconds
+        :type step_ms: int
+
+        :param processes: number of processes decoding and detecting in parallel, None to use all cores
+        :type processes: int
+
+        :param face_recognition_model: The face detector backend, one of video_player.FaceDetectors.DETECTOR_NAMES
+        :type face_recognition_model: str
+
+        :param detection_max_size: Maximal length of the longer image edge the face detection runs on
+        :type detection_max_size: int
+
+        :param number_of_times_to_upsample: How many times the detection image is upsampled to find smaller faces
+        :type number_of_times_to_upsample: int
+
+        :return: number of newly indexed files
+        """
+        self.update_identities(enc_manager)
+        settings = {"face_recognition_model": face_recognition_model, "detection_max_size": detection_max_size,
+                    "number_of_times_to_upsample": number_of_times_to_upsample}
+        processes = processes or multiprocessing.cpu_count()
+
+        indexed = 0
+        videos = find_videos(paths)
+        for video_nr, path in enumerate(videos):
+            media = DetectionCache.media_key(path)
+            row = self.__connection.execute("SELECT path FROM files WHERE media = ?", (media,)).fetchone()
+            if row is not None:
+                if row[0] != os.path.abspath(path):
+                    self.__connection.execute("UPDATE files SET path = ? WHERE media = ?",
+                                              (os.path.abspath(path), media))
+                    self.__connection.commit()
+                continue
+
+            frame_count, fps = get_video_info(path)
+            step_frames = max(1, round(step_ms / 1000 * fps))
+            segment_bounds = split_into_segments(frame_count, 4 * processes) if frame_count > 0 \
+                else [(0, sys.maxsize)]
+            tasks = [(path, first_frame, end_frame, step_frames, settings) for first_frame, end_frame in segment_bounds]
+            with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(settings,)) as pool:
+                detections = [detection for segment in pool.imap(_detect_segment, tasks) for detection in segment]
+
+            settings_key = DetectionCache.settings_key(face_recognition_model, detection_max_size,
+                                                       number_of_times_to_upsample)
+            self.add_detections(media, path, detections, enc_manager, settings_key, int(frame_count / fps * 1000))
+            indexed += 1
+            self.__logger_info(f"Indexed {path} ({video_nr + 1}/{len(videos)}) with "
+                               f"{sum(len(encodings) for _, encodings in detections)} faces")
+        return indexed
+
+    def add_detections(self, media, path, detections, enc_manager, settings="", duration_ms=0):
+        """
+        Adds the faces found in a video file and replaces the previous faces of the file
+
+        :param media: content hash of the video file, see DetectionCache.media_key
+        :type media: str
+        :param path: path of the video file
+        :type path: str
+        :param detections: list of tuples (time in milliseconds, face encodings)
+        :type detections: list
+        :param enc_manager: the encoding manager the faces are matched against
+        :type enc_manager: video_player.EncodingManager.EncodingManager
+        :param settings: description of the detection settings, see DetectionCache.settings_key
+        :type settings: str
+        :param duration_ms: duration of the video file
+        :type duration_ms: int
+        """
+        times = [time_ms for time_ms, encodings in detections for _ in range(len(encodings))]
+        encodings = np.concatenate([np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+                                    for _, encodings in detections]) if detections else \
+            np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        names, distances = self.__match(encodings, enc_manager)
+
+        with self.__connection:
+            self.__connection.execute("DELETE FROM faces WHERE media = ?", (media,))
+            self.__connection.executemany(
+                "INSERT INTO faces VALUES (?, ?, ?, ?, ?)",
+                ((media, time_ms, encoding.tobytes(), name, float(distance))
+                 for time_ms, encoding, name, distance in zip(times, encodings, names, distances)))
+            self.__connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                      (media, os.path.abspath(path), settings, duration_ms))
+            self.__update_appearances(media)
+            if self.__get_gallery_state() is None:
+                self.__set_gallery_state(enc_manager)
+
+    def update_identities(self, enc_manager, batch_size=50_000):
+        """
+        Matches the stored faces against the encodings which were added to the encoding manager since the last update.
+        As the encoding manager only appends encodings, each face is only compared to the new encodings and keeps its
+        identity unless a new encoding is closer. If encodings were removed (e.g. pruned), all faces are matched again.
+        Only the segments of the files with changed identities are rebuilt.
+
+        :param enc_manager: the encoding manager the faces are matched against
+        :type enc_manager: video_player.EncodingManager.EncodingManager
+        :param batch_size: number of stored faces matched at once
+        :type batch_size: int
+        :return: number of faces whose identity changed
+        """
+        names = list(enc_manager.known_face_names)
+        state = self.__get_gallery_state()
+        if state is not None and state[0] == len(names) and state[1] == self.__names_hash(names):
+            return 0
+
+        is_appended = state is not None and state[0] < len(names) and state[1] == self.__names_hash(names[:state[0]])
+        first_row = state[0] if is_appended else 0
+        new_encodings = np.asarray(enc_manager.known_face_encodings[first_row:len(names)], dtype=np.float32)
+        new_names = names[first_row:]
+
+        changed, changed_media = 0, set()
+        last_rowid = 0
+        while True:
+            rows = self.__connection.execute(
+                "SELECT rowid, media, encoding, distance FROM faces WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, batch_size)).fetchall()
+            if len(rows) == 0:
+                break
+            last_rowid = rows[-1][0]
+            encodings = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.float32).reshape(-1, ENCODING_SIZE)
+            if is_appended:
+                best_names, best_distances = self.__nearest(encodings, new_encodings, new_names)
+                is_closer = best_distances < np.array([row[3] for row in rows])
+            else:
+                best_names, best_distances = self.__match(encodings, enc_manager)
+                is_closer = np.ones(len(rows), dtype=bool)
+            updates = [(best_names[row_nr], float(best_distances[row_nr]), rows[row_nr][0])
+                       for row_nr in np.flatnonzero(is_closer)]
+            self.__connection.executemany("UPDATE faces SET name = ?, distance = ? WHERE rowid = ?", updates)
+            changed += len(updates)
+            changed_media.update(rows[row_nr][1] for row_nr in np.flatnonzero(is_closer))
+
+        with self.__connection:
+            for media in changed_media:
+                self.__update_appearances(media)
+            self.__set_gallery_state(enc_manager)
+        self.__logger_info(f"Matched the stored faces against {len(new_names)} {'new ' if is_appended else ''}"
+                           f"encodings, {changed} faces in {len(changed_media)} files changed")
+        return changed
+
+    def find(self, name, min_confidence=0.0):
+        """
+        Returns the segments in which the person appears over all indexed files
+
+        :param name: name of the person
+        :type name: str
+        :param min_confidence: minimal confidence (1 - distance of the closest face of the segment) of the returned
+        segments
+        :type min_confidence: float
+        :return: list of dictionaries with the keys path, start_ms, end_ms, confidence and sightings (number of frames
+        the person was seen in), sorted by path and start
+        """
+        rows = self.__connection.execute(
+            "SELECT files.path, start_ms, end_ms, 1 - distance, sightings FROM appearances "
+            "JOIN files ON files.media = appearances.media WHERE name = ? AND 1 - distance >= ? "
+            "ORDER BY files.path, start_ms", (name, min_confidence)).fetchall()
+        return [{"path": path, "start_ms": start_ms, "end_ms": end_ms, "confidence": round(confidence, 4),
+                 "sightings": sightings} for path, start_ms, end_ms, confidence, sightings in rows]
+
+    def get_names(self):
+        """
+        Returns the persons appearing in the indexed files
+
+        :return: list of tuples (name, number of files, total duration of the segments in milliseconds) sorted by name
+        """
+        return self.__connection.execute(
+            "SELECT name, COUNT(DISTINCT media), SUM(end_ms - start_ms) FROM appearances GROUP BY name "
+            "ORDER BY name").fetchall()
+
+    def get_files(self):
+        """
+        Returns the paths of the indexed files
+
+        :rtype: list
+        """
+        return [row[0] for row in self.__connection.execute("SELECT path FROM files ORDER BY path")]
+
+    def close(self):
+        """
+        Closes the database
+        """
+        self.__connection.commit()
+        self.__connection.close()
+        self.__logger_info("Closed appearance index")
+
+    def __match(self, encodings, enc_manager):
+        """
+        Returns the name and distance of the closest identity of each encoding, also if it is further away than the
+        tolerance, such that it can be compared with identities added later
+        """
+        if len(encodings) == 0 or len(enc_manager.identity_names) == 0:
+            return ["unknown"] * len(encodings), np.full(len(encodings), np.inf)
+        _, _, top_k_indices, top_k_distances, identity_names = enc_manager.match(encodings, self.__tolerance)
+        return [identity_names[index] for index in top_k_indices[:, 0]], top_k_distances[:, 0]
+
+    @staticmethod
+    def __nearest(encodings, known_encodings, known_names):
+        """
+        Returns the name and distance of the closest of the known encodings for each encoding
+        """
+        if len(known_encodings) == 0:
+            return ["unknown"] * len(encodings), np.full(len(encodings), np.inf)
+        # ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b for all pairs at once
+        squared_distances = encodings @ known_encodings.T
+        squared_distances *= -2
+        squared_distances += np.einsum("ij,ij->i", encodings, encodings)[:, np.newaxis]
+        squared_distances += np.einsum("ij,ij->i", known_encodings, known_encodings)[np.newaxis, :]
+        nearest = np.argmin(squared_distances, axis=1)
+        distances = np.sqrt(np.maximum(squared_distances[np.arange(len(encodings)), nearest], 0))
+        return [known_names[index] for index in nearest], distances
+
+    def __update_appearances(self, media):
+        """
+        Rebuilds the segments of the file from its faces, faces further away than the tolerance are ignored
+        """
+        rows = self.__connection.execute(
+            "SELECT name, time_ms, distance FROM faces WHERE media = ? AND distance <= ? ORDER BY name, time_ms",
+            (media, self.__tolerance)).fetchall()
+        segments = []
+        for name, time_ms, distance in rows:
+            segment = segments[-1] if segments else None
+            if segment is not None and segment[0] == name and time_ms - segment[3] <= self.__max_gap_ms:
+                # several faces of the same frame count as one sighting
+                segment[5] += 1 if time_ms != segment[3] else 0
+                segment[3] = time_ms
+                segment[4] = min(segment[4], distance)
+            else:
+                segments.append([name, media, time_ms, time_ms, distance, 1])
+        self.__connection.execute("DELETE FROM appearances WHERE media = ?", (media,))
+        self.__connection.executemany("INSERT INTO appearances VALUES (?, ?, ?, ?, ?, ?)", segments)
+
+    def __get_gallery_state(self):
+        """
+        Returns the tuple (number of encodings, hash of their names) of the gallery the faces were matched against
+        last, None if they were never matched
+        """
+        rows = dict(self.__connection.execute("SELECT key, value FROM gallery").fetchall())
+        if "size" not in rows:
+            return None
+        return int(rows["size"]), rows["names_hash"]
+
+    def __set_gallery_state(self, enc_manager):
+        """
+        Records the gallery of the encoding manager as the one the faces were matched against
+        """
+        names = enc_manager.known_face_names
+        self.__connection.executemany("INSERT OR REPLACE INTO gallery VALUES (?, ?)",
+                                      [("size", str(len(names))), ("names_hash", self.__names_hash(names))])
+
+    @staticmethod
+    def __names_hash(names):
+        """
+        Returns a hash of the names of the known encodings, it changes if encodings are removed or reordered
+        """
+        sha1 = hashlib.sha1()
+        for name in names:
+            sha1.update(name.encode("utf-8") + b"\n")
+        return sha1.hexdigest()
+
+    def __logger_info(self, msg):
+        """
+        Adds a log info entry starting with AppearanceIndex
+
+        :param msg: the message to write
+        :type msg: str
+        """
+        self.__logger.info(f"AppearanceIndex: {msg}")
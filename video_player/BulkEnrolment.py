@@ -0,0 +1,181 @@
+"""
+Script to enrol the face encodings of a whole directory tree of pictures. The pictures are encoded in parallel
+processes and written into the encoding store in batches. Pictures whose content was enrolled before are skipped, such
+that an interrupted enrolment can simply be started again.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+
+import face_recognition as fr
+
+from video_player.FaceDetectors import create_detector
+
+PICTURE_EXTENSIONS = (".jpeg", ".jpg", ".gif", ".png")
+"""File extensions of the pictures which are enrolled, compared case-insensitively"""
+
+
+def find_pictures(directory):
+    """
+    Returns the pictures in the directory tree together with the name of the person they show. Pictures directly in
+    the directory are named after their file name (as in the GUI), pictures in a sub directory after the top-level sub
+    directory, e.g. directory/Joaquin Phoenix/premiere/1.jpg belongs to Joaquin Phoenix.
+
+    :param directory: root of the directory tree
+    :type directory: str
+    :return: sorted list of tuples (path, name)
+    """
+    pictures = []
+    for root, directories, files in os.walk(directory):
+        directories.sort()
+        relative_root = os.path.relpath(root, directory)
+        for file_name in sorted(files):
+            if not file_name.lower().endswith(PICTURE_EXTENSIONS):
+                continue
+            if relative_root == os.curdir:
+                name = os.path.splitext(file_name)[0]
+            else:
+                name = relative_root.split(os.sep)[0]
+            pictures.append((os.path.join(root, file_name), name))
+    return pictures
+
+
+def content_hash(path):
+    """
+    Returns the SHA-1 hash of the content of the file
+
+    :param path: path of the file
+    :type path: str
+    :rtype: str
+    """
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as picture_file:
+        for chunk in iter(lambda: picture_file.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+_enrolled_hashes = set()
+"""Content hashes which were enrolled before, set in each worker process by _init_worker"""
+_settings = {}
+_detector = None
+
+
+def _init_worker(enrolled_hashes, settings):
+    """
+    Stores the already enrolled hashes and the encoding settings in the worker process and creates its face detector
+    """
+    global _enrolled_hashes, _settings, _detector
+    _enrolled_hashes, _settings = enrolled_hashes, settings
+    _detector = create_detector(settings["face_recognition_model"])
+
+
+def encode_picture(task):
+    """
+    Detects the face in the picture and calculates its encoding
+
+    :param task: tuple (path, name) as returned by find_pictures
+    :type task: tuple
+    :return: tuple (path, name, content hash, status, encoding) with the status being one of "enrolled", "skipped"
+    (content was enrolled before), "no_face", "multiple_faces" or "error", the encoding is None unless it is "enrolled"
+    """
+    path, name = task
+    try:
+        picture_hash = content_hash(path)
+        if picture_hash in _enrolled_hashes:
+            return path, name, picture_hash, "skipped", None
+        img = fr.load_image_file(path)
+        face_locations = _detector.locate(img)
+        if len(face_locations) != 1:
+            return path, name, picture_hash, "no_face" if len(face_locations) == 0 else "multiple_faces", None
+        encoding = fr.face_encodings(img, face_locations, num_jitters=_settings["num_jitters"], model="large")[0]
+        return path, name, picture_hash, "enrolled", encoding
+    except Exception as error:
+        return path, name, None, f"error: {error}", None
+
+
+def enrol_directory(directory, enc_manager, logger, processes=None, num_jitters=20, face_recognition_model="hog",
+                    batch_size=100, report_path=None):
+    """
+    Enrols the faces of all pictures in the directory tree, see find_pictures for how the pictures are named.
+    Every picture has to show exactly one face, pictures without or with several faces are reported and not enrolled.
+
+    :param directory: root of the directory tree
+    :type directory: str
+
+    :param enc_manager: the encoding manager the encodings are added to
+    :type enc_manager: video_player.EncodingManager.EncodingManager
+
+    :param logger: object used to perform logging
+    :type logger: logging.Logger
+
+    :param processes: number of processes encoding in parallel, None to use all cores
+    :type processes: int
+
+    :param num_jitters: How many times to re-sample the face when calculating encoding
+    :type num_jitters: int
+
+    :param face_recognition_model: The face detector backend used to locate the face, one of
+    video_player.FaceDetectors.DETECTOR_NAMES
+    :type face_recognition_model: str
+
+    :param batch_size: number of encodings written into the encoding store at once
+    :type batch_size: int
+
+    :param report_path: JSON file the pictures which were not enrolled are written to, None to only log them
+    :type report_path: str
+
+    :return: dictionary with the number of pictures per status and the lists of paths with no_face, multiple_faces
+    and error
+    """
+    pictures = find_pictures(directory)
+    processes = processes or multiprocessing.cpu_count()
+    enrolled_hashes = enc_manager.get_enrolled_hashes()
+    logger.info(f"BulkEnrolment: Encoding {len(pictures)} pictures of {directory} with {processes} processes, "
+                f"{len(enrolled_hashes)} pictures were enrolled before")
+
+    report = {"enrolled": 0, "skipped": 0, "no_face": [], "multiple_faces": [], "error": []}
+    batch_names, batch_encodings, batch_hashes = [], [], []
+    batch_size = max(1, batch_size)
+    settings = {"num_jitters": num_jitters, "face_recognition_model": face_recognition_model}
+
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(enrolled_hashes, settings)) as pool:
+        tasks = pool.imap_unordered(encode_picture, pictures, chunksize=4)
+        for picture_nr, (path, name, picture_hash, status, encoding) in enumerate(tasks):
+            if status == "enrolled":
+                # identical pictures within the tree are only enrolled once
+                if picture_hash in enrolled_hashes:
+                    status = "skipped"
+                else:
+                    enrolled_hashes.add(picture_hash)
+                    batch_names.append(name)
+                    batch_encodings.append(encoding)
+                    batch_hashes.append(picture_hash)
+
+            if status in ("enrolled", "skipped"):
+                report[status] += 1
+            elif status.startswith("error"):
+                report["error"].append(f"{path} ({status[len('error: '):]})")
+            else:
+                report[status].append(path)
+
+            if len(batch_names) >= batch_size:
+                enc_manager.add_encodings(batch_names, batch_encodings, batch_hashes)
+                batch_names, batch_encodings, batch_hashes = [], [], []
+            if (picture_nr + 1) % 100 == 0:
+                logger.info(f"BulkEnrolment: Processed {picture_nr + 1}/{len(pictures)} pictures")
+
+    enc_manager.add_encodings(batch_names, batch_encodings, batch_hashes)
+    enc_manager.save_index()
+
+    logger.info(f"BulkEnrolment: Enrolled {report['enrolled']} pictures, skipped {report['skipped']} enrolled before, "
+                f"{len(report['no_face'])} without a face, {len(report['multiple_faces'])} with several faces and "
+                f"{len(report['error'])} unreadable")
+    for status in ("no_face", "multiple_faces", "error"):
+        for path in report[status]:
+            logger.warning(f"BulkEnrolment: Not enrolled ({status}): {path}")
+    if report_path is not None:
+        with open(report_path, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+    return report
@@ -0,0 +1,92 @@
+"""
+This script contains a class deciding how often frames are handed over to the face detection, either at a fixed
+cadence or adapted to the measured detection time
+"""
+import math
+
+
+class CadenceController:
+
+    def __init__(self, frames_to_skip=None, detection_cpu_share=0.5, max_cadence=60, smoothing=0.2):
+        """
+        Constructor of the CadenceController
+
+        The cadence is the number of frames between two frames handed over to the face detection. With a fixed
+        frames_to_skip it is constant, otherwise it is adapted such that the detection takes at most
+        detection_cpu_share of the time between the frames: cadence = detection time / (frame interval * share)
+
+        :param frames_to_skip: fixed number of frames to skip between detections, None to adapt the cadence
+        :type frames_to_skip: int
+        :param detection_cpu_share: share of a CPU core the detection should use in the adaptive mode
+        :type detection_cpu_share: float
+        :param max_cadence: maximal number of frames between two detections in the adaptive mode
+        :type max_cadence: int
+        :param smoothing: weight of a new detection time in the exponential moving average
+        :type smoothing: float
+        """
+        self.is_adaptive = frames_to_skip is None
+        self.__detection_cpu_share = detection_cpu_share
+        self.__max_cadence = max_cadence
+        self.__smoothing = smoothing
+
+        self.cadence = 1 if self.is_adaptive else frames_to_skip + 1
+        """Current number of frames between two frames handed over to the face detection"""
+        self.detection_time = None
+        """Exponential moving average of the duration of a detection pass in seconds"""
+        self.__frame_interval = 1 / 25
+        self.__frames_since_detection = None
+
+    def set_fps(self, fps):
+        """
+        Sets the frame rate of the video, invalid values (e.g. 0 before the media is parsed) are ignored
+
+        :param fps: frames per second of the video
+        :type fps: float
+        """
+        if fps and fps > 0:
+            self.__frame_interval = 1 / fps
+            self.__update_cadence()
+
+    def set_detection_cpu_share(self, detection_cpu_share):
+        """
+        Sets the share of a CPU core the detection should use in the adaptive mode, e.g. when several streams share
+        the detection threads
+
+        :param detection_cpu_share: share of a CPU core
+        :type detection_cpu_share: float
+        """
+        if detection_cpu_share > 0 and detection_cpu_share != self.__detection_cpu_share:
+            self.__detection_cpu_share = detection_cpu_share
+            self.__update_cadence()
+
+    def add_detection_time(self, seconds):
+        """
+        Adds the measured duration of a detection pass and adapts the cadence
+
+        :param seconds: duration of the detection pass
+        :type seconds: float
+        """
+        if self.detection_time is None:
+            self.detection_time = seconds
+        else:
+            self.detection_time += self.__smoothing * (seconds - self.detection_time)
+        self.__update_cadence()
+
+    def is_detection_due(self):
+        """
+        Counts a new frame and returns whether it should be handed over to the face detection
+        """
+        if self.__frames_since_detection is None or self.__frames_since_detection + 1 >= self.cadence:
+            self.__frames_since_detection = 0
+            return True
+        self.__frames_since_detection += 1
+        return False
+
+    def __update_cadence(self):
+        """
+        Recalculates the cadence from the detection time and the frame interval in the adaptive mode
+        """
+        if not self.is_adaptive or self.detection_time is None:
+            return
+        budget = self.__frame_interval * self.__detection_cpu_share
+        self.cadence = max(1, min(self.__max_cadence, math.ceil(self.detection_time / budget)))
@@ -0,0 +1,209 @@
+"""
+A script to persist the face detection results of video frames in a SQLite database, such that replaying or seeking
+in an already analysed video does not need to run the face detection again
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from video_player.EncodingStore import ENCODING_SIZE
+
+
+class DetectionCache:
+
+    def __init__(self, logger, path=None, commit_interval=50, busy_timeout_ms=5000):
+        """
+        Constructor of the DetectionCache
+
+        Stores per video frame the face locations, face encodings and identified names keyed by the content hash of
+        the media file, the detection settings and the playback time. Several processes (e.g. the player and the
+        background analysis) can share the database: stored frames are collected in memory and written in one short
+        transaction, such that no connection holds the write lock between two writes.
+
+        :param logger: object used to perform logging
+        :type logger: logging.Logger
+
+        :param path: path of the SQLite database file, None to use detection_cache.sqlite3 in the project directory
+        :type path: str
+
+        :param commit_interval: number of stored frames after which they are written to disk
+        :type commit_interval: int
+
+        :param busy_timeout_ms: time a write waits for the write lock of another connection before it is retried
+        with the next write
+        :type busy_timeout_ms: int
+        """
+        if path is None:
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "detection_cache.sqlite3")
+        self.path = path
+        """Path of the SQLite database file"""
+        self.__logger = logger
+        self.__commit_interval = commit_interval
+        self.__pending = {}
+        """Stored frames which are not written yet, keyed by (media, settings, time_ms)"""
+
+        self.__lock = threading.Lock()
+        """The connection is shared by the GUI and the detection thread"""
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self.__connection.execute("PRAGMA table_info(frames)")]
+        if "gallery_size" in columns:
+            # identities of earlier versions were keyed by the number of known encodings, they are detected again
+            self.__connection.execute("DROP TABLE frames")
+            self.__logger_info("Dropped the cached frames of an earlier version")
+        self.__connection.execute("""
+            CREATE TABLE IF NOT EXISTS frames (
+                media TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                time_ms INTEGER NOT NULL,
+                locations TEXT NOT NULL,
+                encodings BLOB NOT NULL,
+                identities TEXT NOT NULL,
+                gallery TEXT NOT NULL,
+                PRIMARY KEY (media, settings, time_ms)
+            )""")
+        self.__connection.commit()
+        self.__logger_info(f"Opened detection cache {path}")
+
+    @staticmethod
+    def settings_key(face_recognition_model, detection_max_size, number_of_times_to_upsample):
+        """
+        Returns the description of the detection settings used to key the cached results
+
+        :rtype: str
+        """
+        return f"{face_recognition_model}/{detection_max_size}/{number_of_times_to_upsample}"
+
+    @staticmethod
+    def media_key(media_path, sample_size=1 << 20, samples=8):
+        """
+        Returns a content hash of the media file. To stay fast for large files, only the file size and a number of
+        evenly distributed chunks are hashed.
+
+        :param media_path: path of the media file
+        :type media_path: str
+        :param sample_size: number of bytes per hashed chunk
+        :type sample_size: int
+        :param samples: number of hashed chunks
+        :type samples: int
+        :rtype: str
+        """
+        size = os.path.getsize(media_path)
+        sha1 = hashlib.sha1(str(size).encode())
+        with open(media_path, "rb") as media_file:
+            for sample_nr in range(samples):
+                media_file.seek(max(0, size - sample_size) * sample_nr // max(1, samples - 1))
+                sha1.update(media_file.read(sample_size))
+        return sha1.hexdigest()
+
+    def lookup(self, media, settings, time_ms, tolerance_ms=20):
+        """
+        Returns the cached detection of the frame closest to time_ms
+
+        :param media: content hash of the media file, see DetectionCache.media_key
+        :type media: str
+        :param settings: description of the detection settings the results were created with
+        :type settings: str
+        :param time_ms: playback time of the frame in milliseconds
+        :type time_ms: int
+        :param tolerance_ms: maximal difference between time_ms and the time of the cached frame
+        :type tolerance_ms: int
+        :return: tuple (time of the cached frame, face locations, face encodings, identities, gallery key) with the
+        identities being a list of tuples (name, distance), or None if no frame is cached within the tolerance
+        """
+        with self.__lock:
+            pending = [pending_row[2:] for key, pending_row in self.__pending.items()
+                       if key[:2] == (media, settings) and abs(key[2] - time_ms) <= tolerance_ms]
+            try:
+                row = self.__connection.execute(
+                    "SELECT time_ms, locations, encodings, identities, gallery FROM frames "
+                    "WHERE media = ? AND settings = ? AND time_ms BETWEEN ? AND ? ORDER BY ABS(time_ms - ?) LIMIT 1",
+                    (media, settings, time_ms - tolerance_ms, time_ms + tolerance_ms, time_ms)).fetchone()
+            except sqlite3.OperationalError as error:
+                self.__logger.warning(f"DetectionCache: Reading the cached frames failed: {error}")
+                row = None
+        rows = pending + ([row] if row is not None else [])
+        if len(rows) == 0:
+            return None
+        row = min(rows, key=lambda candidate: abs(candidate[0] - time_ms))
+        locations = [tuple(location) for location in json.loads(row[1])]
+        encodings = np.frombuffer(row[2], dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        identities = [tuple(identity) for identity in json.loads(row[3])]
+        return row[0], locations, encodings, identities, row[4]
+
+    def store(self, media, settings, time_ms, locations, encodings, identities, gallery_key):
+        """
+        Stores (or replaces) the detection of a frame
+
+        :param media: content hash of the media file, see DetectionCache.media_key
+        :type media: str
+        :param settings: description of the detection settings the results were created with
+        :type settings: str
+        :param time_ms: playback time of the frame in milliseconds
+        :type time_ms: int
+        :param locations: face locations (top, right, bottom, left) in video frame coordinates
+        :type locations: list
+        :param encodings: face encodings of the faces
+        :param identities: list of tuples (name, distance) of the faces
+        :type identities: list
+        :param gallery_key: key of the known encodings the identities were matched against, cached identities are
+        matched again if it changed (see video_player.EncodingManager.EncodingManager.gallery_key)
+        :type gallery_key: str
+        """
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self.__lock:
+            self.__pending[(media, settings, int(time_ms))] = (
+                media, settings, int(time_ms), json.dumps([list(map(int, location)) for location in locations]),
+                encodings.tobytes(), json.dumps(identities), gallery_key)
+            if len(self.__pending) >= self.__commit_interval:
+                self.__write_pending()
+
+    def commit(self):
+        """
+        Writes all stored frames to disk
+        """
+        with self.__lock:
+            self.__write_pending()
+
+    def close(self):
+        """
+        Writes all stored frames to disk and closes the database
+        """
+        with self.__lock:
+            self.__write_pending()
+            self.__connection.close()
+        self.__logger_info("Closed detection cache")
+
+    def __write_pending(self):
+        """
+        Writes the stored frames in one transaction, it is called while the connection is locked. If another
+        connection holds the write lock longer than the busy timeout, the frames are kept and written with the next
+        write. Frames exceeding ten times the commit interval are dropped, they are detected again when needed.
+        """
+        if len(self.__pending) == 0:
+            return
+        try:
+            with self.__connection:
+                self.__connection.executemany("INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                              list(self.__pending.values()))
+            self.__pending.clear()
+        except sqlite3.OperationalError as error:
+            self.__logger.warning(f"DetectionCache: Writing {len(self.__pending)} frames failed, they are retried "
+                                  f"with the next write: {error}")
+            if len(self.__pending) >= 10 * self.__commit_interval:
+                self.__pending.clear()
+
+    def __logger_info(self, msg):
+        """
+        Adds a log info entry starting with DetectionCache
+
+        :param msg: the message to write
+        :type msg: str
+        """
+        self.__logger.info(f"DetectionCache: {msg}")
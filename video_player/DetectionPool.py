@@ -0,0 +1,193 @@
+"""
+This script contains a pool of detection threads shared by several video streams. Each stream keeps only its latest
+frame, the threads serve the streams in turn such that a busy stream cannot starve the others.
+"""
+import collections
+import threading
+
+
+class DetectionStream:
+
+    def __init__(self, pool, detect_command):
+        """
+        Constructor of the DetectionStream
+
+        Handle of a single stream of a DetectionPool, it offers the same interface as the DetectionWorker such that
+        the FrameHandler can use both
+
+        :param pool: the pool running the detections
+        :type pool: DetectionPool
+        :param detect_command: function called with a submitted frame
+        """
+        self.pool = pool
+        self.detect_command = detect_command
+        self.pending_frame = None
+        """Latest submitted frame which was not processed yet, guarded by the condition of the pool"""
+        self.is_processing = False
+        """Whether a thread of the pool runs the detection of this stream, a stream is never processed in parallel"""
+        self.is_running = True
+
+        self.submitted_frames = 0
+        """Number of frames submitted to the stream"""
+        self.dropped_frames = 0
+        """Number of submitted frames replaced by a newer one before they were processed"""
+        self.processed_frames = 0
+        """Number of frames the detect_command was run on"""
+        self.failed_frames = 0
+        """Number of frames the detect_command raised an error on"""
+
+    def submit(self, frame):
+        """
+        Hands over a frame to the pool, a frame of this stream which is still waiting to be processed is dropped
+
+        The pool keeps a reference to the frame, therefore the caller must not modify it afterwards
+
+        :param frame: the frame to perform the detection on
+        """
+        self.pool.submit(self, frame)
+
+    def stop(self):
+        """
+        Removes the stream from the pool, a running detection pass of the stream finishes
+        """
+        self.pool.unregister(self)
+
+
+class DetectionPool:
+
+    def __init__(self, logger, workers=2, detection_cpu_share=0.5):
+        """
+        Constructor of the DetectionPool
+
+        Runs the detections of several streams on a fixed number of threads, such that adding a stream does not add
+        detection threads. Streams with a pending frame are served in the order they became ready (round robin), the
+        share of the detection time each stream may use shrinks with the number of streams.
+
+        :param logger: object used to perform logging
+        :type logger: logging.Logger
+        :param workers: number of detection threads
+        :type workers: int
+        :param detection_cpu_share: share of a CPU core each thread should use for the detection, the streams split
+        workers * detection_cpu_share among each other
+        :type detection_cpu_share: float
+        """
+        self.__logger = logger
+        self.__workers = workers
+        self.__detection_cpu_share = detection_cpu_share
+        self.__condition = threading.Condition()
+        self.__streams = []
+        self.__ready = collections.deque()
+        """Streams with a pending frame which are not processed, in the order they are served"""
+        self.__is_running = True
+
+        self.__threads = [threading.Thread(target=self.__run, daemon=True) for _ in range(workers)]
+        for thread in self.__threads:
+            thread.start()
+
+    def register(self, detect_command):
+        """
+        Adds a stream to the pool
+
+        :param detect_command: function called with a submitted frame of the stream
+        :return: the handle to submit the frames of the stream with
+        :rtype: DetectionStream
+        """
+        stream = DetectionStream(self, detect_command)
+        with self.__condition:
+            self.__streams.append(stream)
+        return stream
+
+    def unregister(self, stream):
+        """
+        Removes the stream from the pool, its pending frame is dropped
+
+        :param stream: the handle returned by register
+        :type stream: DetectionStream
+        """
+        with self.__condition:
+            stream.is_running = False
+            stream.pending_frame = None
+            if stream in self.__streams:
+                self.__streams.remove(stream)
+            if stream in self.__ready:
+                self.__ready.remove(stream)
+
+    def submit(self, stream, frame):
+        """
+        Sets the pending frame of the stream, see DetectionStream.submit
+        """
+        with self.__condition:
+            if not stream.is_running:
+                return
+            if stream.pending_frame is not None:
+                stream.dropped_frames += 1
+            elif not stream.is_processing:
+                self.__ready.append(stream)
+                self.__condition.notify()
+            stream.pending_frame = frame
+            stream.submitted_frames += 1
+
+    def get_detection_cpu_share(self, maximal_share):
+        """
+        Returns the share of a CPU core the detection of a single stream should use, such that all streams together
+        use at most workers * detection_cpu_share
+
+        :param maximal_share: the share a stream uses if it has the pool on its own
+        :type maximal_share: float
+        :rtype: float
+        """
+        with self.__condition:
+            stream_count = max(1, len(self.__streams))
+        return min(maximal_share, self.__workers * self.__detection_cpu_share / stream_count)
+
+    def get_stats(self):
+        """
+        Returns the number of streams and the submitted, dropped and processed frames over all streams
+
+        :rtype: dict
+        """
+        with self.__condition:
+            streams = list(self.__streams)
+        return {"streams": len(streams), "workers": self.__workers,
+                "submitted_frames": sum(stream.submitted_frames for stream in streams),
+                "dropped_frames": sum(stream.dropped_frames for stream in streams),
+                "processed_frames": sum(stream.processed_frames for stream in streams),
+                "failed_frames": sum(stream.failed_frames for stream in streams)}
+
+    def stop(self):
+        """
+        Stops all threads after their running detection passes finished
+        """
+        with self.__condition:
+            self.__is_running = False
+            self.__ready.clear()
+            self.__condition.notify_all()
+
+    def __run(self):
+        """
+        Takes the stream which is waiting the longest and performs the detection on its latest frame, the stream is
+        queued again at the end if a new frame arrived in the meantime. A failing detection is logged, it neither ends
+        the thread nor keeps the stream from being served again.
+        """
+        while True:
+            with self.__condition:
+                while self.__is_running and len(self.__ready) == 0:
+                    self.__condition.wait()
+                if not self.__is_running:
+                    return
+                stream = self.__ready.popleft()
+                frame, stream.pending_frame = stream.pending_frame, None
+                stream.is_processing = True
+
+            try:
+                stream.detect_command(frame)
+            except Exception:
+                stream.failed_frames += 1
+                self.__logger.exception("DetectionPool: The detection of a frame failed")
+            finally:
+                with self.__condition:
+                    stream.is_processing = False
+                    stream.processed_frames += 1
+                    if stream.is_running and stream.pending_frame is not None:
+                        self.__ready.append(stream)
+                        self.__condition.notify()
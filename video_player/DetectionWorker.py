@@ -0,0 +1,89 @@
+"""
+This script contains a class to run the face detection on a separate thread such that the
+vlc video callback is never blocked by the (slow) face recognition
+"""
+import threading
+
+
+class DetectionWorker:
+
+    def __init__(self, logger, detect_command):
+        """
+        Constructor of the DetectionWorker
+
+        Runs the detect_command on its own thread for the most recently submitted frame. Frames submitted while the
+        worker is busy replace each other, such that only the latest frame is processed and stale frames are dropped
+        instead of queued.
+
+        :param logger: object used to perform logging
+        :type logger: logging.Logger
+
+        :param detect_command: function called with a submitted frame
+        """
+        self.__logger = logger
+        self.__detect_command = detect_command
+
+        self.__condition = threading.Condition()
+        """Condition guarding the pending frame and the running state"""
+        self.__pending_frame = None
+        """Latest submitted frame which was not processed yet"""
+        self.__is_running = True
+
+        self.submitted_frames = 0
+        """Number of frames submitted to the worker"""
+        self.dropped_frames = 0
+        """Number of submitted frames replaced by a newer one before they were processed"""
+        self.processed_frames = 0
+        """Number of frames the detect_command was run on"""
+        self.failed_frames = 0
+        """Number of frames the detect_command raised an error on"""
+
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def submit(self, frame):
+        """
+        Hands over a frame to the worker, a frame which is still waiting to be processed is dropped
+
+        The worker keeps a reference to the frame, therefore the caller must not modify it afterwards
+
+        :param frame: the frame to perform the detection on
+        :type frame: numpy.ndarray
+        """
+        with self.__condition:
+            if self.__pending_frame is not None:
+                self.dropped_frames += 1
+            self.__pending_frame = frame
+            self.submitted_frames += 1
+            self.__condition.notify()
+
+    def stop(self):
+        """
+        Stops the worker thread after the currently running detection pass finished
+        """
+        with self.__condition:
+            self.__is_running = False
+            self.__pending_frame = None
+            self.__condition.notify()
+
+    def __run(self):
+        """
+        Waits for submitted frames and performs the detection on the latest one, a failing detection is logged and
+        does not end the thread
+        """
+        while True:
+            with self.__condition:
+                while self.__is_running and self.__pending_frame is None:
+                    self.__condition.wait()
+                if not self.__is_running:
+                    return
+                frame, self.__pending_frame = self.__pending_frame, None
+
+            try:
+                self.__detect_command(frame)
+            except Exception:
+                self.failed_frames += 1
+                self.__logger.exception("DetectionWorker: The detection of a frame failed")
+
+            with self.__condition:
+                self.processed_frames += 1
@@ -1,57 +1,560 @@
 """
-A script to handle read/writes of face encodings from/into files of type .encoding
+A script to handle read/writes of face encodings from/into the encoding store of the encodings directory
 """
+import hashlib
 import os
-import pickle
 import logging
+import threading
+
+import numpy as np
+
+from video_player.EncodingStore import EncodingStore, ENCODING_SIZE
+from video_player.IVFIndex import IVFIndex
+
+ENCODINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "encodings")
+"""Default directory of the encoding store, the encodings directory of the project"""
+
+INDEX_MIN_SIZE = 20_000
+"""Number of known encodings from which on the approximate index is used instead of the exact search"""
+INDEX_SAVE_SHARE = 0.25
+"""The index is persisted once the encodings inserted since the last save exceed this share of the saved ones, such
+that persisting the index costs amortised constant time per inserted encoding"""
+
+
+def migrate_pickles(logger, encodings_path=None):
+    """
+    Moves legacy .encoding pickle files into the encoding store, see EncodingStore.migrate_pickles. A process starting
+    workers calls it once before, the workers open their EncodingManager with migrate_pickles=False.
+
+    :param logger: object used to perform logging
+    :type logger: logging.Logger
+    :param encodings_path: directory containing the encoding store, None to use the encodings directory of the project
+    :type encodings_path: str
+    :return: number of migrated encodings
+    """
+    return EncodingStore(encodings_path or ENCODINGS_PATH).migrate_pickles(logger)
 
 
 class EncodingManager:
 
-    def __init__(self, logger):
+    def __init__(self, logger, encodings_path=None, use_index=False, index_n_probe=8, max_encodings_per_identity=None,
+                 migrate_pickles=True):
         """
         Constructor of the EncodingManager
 
-        Manages the known face encodings and names, provides functionality to read and persist them
+        Manages the known face encodings and names, provides functionality to read and persist them.
+        Each identity (name) can hold several encodings, e.g. from pictures with different poses or lighting.
 
         :param logger: object used to perform logging
         :type logger: logging.Logger
+
+        :param encodings_path: directory containing the encoding store, None to use the encodings directory of the
+        project
+        :type encodings_path: str
+
+        :param use_index: whether large galleries are searched with an approximate inverted file index
+        :type use_index: bool
+
+        :param index_n_probe: number of index partitions searched per face, higher values increase the recall but
+        slow down the matching
+        :type index_n_probe: int
+
+        :param max_encodings_per_identity: if set, identities exceeding this number of encodings are pruned to as many
+        representative encodings whenever an encoding is added
+        :type max_encodings_per_identity: int
+
+        :param migrate_pickles: whether legacy .encoding pickle files are moved into the store when it is opened and
+        reloaded, False for worker processes whose parent migrated them (see the module function migrate_pickles)
+        :type migrate_pickles: bool
         """
-        self.__encodings_path = os.path.join(os.path.abspath(__file__), "..", "..", "encodings")
-        self.known_face_names = []
-        self.known_face_encodings = []
+        self.__encodings_path = encodings_path or ENCODINGS_PATH
+        self.__migrate_pickles = migrate_pickles
+
+        self.__max_encodings_per_identity = max_encodings_per_identity
+
+        self.__use_index = use_index
+        self.__index_n_probe = index_n_probe
+        self.__index = None
+        """Approximate index over the known encodings, only set once use_index is True and the gallery is large"""
+        self.__index_path = os.path.normpath(self.__encodings_path) + "_index.npz"
+        """Path the index is persisted to, next to the encodings directory"""
+        self.__index_saved_size = 0
+        """Number of encodings of the index when it was persisted last"""
 
         self.__logger = logger
 
-        self.__logger_info(f"Searching {self.__encodings_path} for face encodings")
+        self.__lock = threading.RLock()
+        """Guards the gallery, such that encodings reloaded by the watching thread are swapped in between two matches"""
+        self.__stop_event = threading.Event()
+        self.__watch_thread = None
 
-        count = 0
-        with os.scandir(self.__encodings_path) as entries:
-            for entry in entries:
-                file_name, ending = entry.name.split(".")
-                if entry.is_file() and ending == "encoding":
-                    with open(entry.path, 'rb') as encoding_file:
-                        count = count + 1
-                        encoding = pickle.load(encoding_file)
-                        self.known_face_encodings.append(encoding)
-                        self.known_face_names.append(file_name)
-        self.__logger_info(f"{count} face encodings were found with names {self.known_face_names}")
+        self.__logger_info(f"Opening the encoding store in {self.__encodings_path}")
+        self.__store = EncodingStore(self.__encodings_path)
+        if migrate_pickles:
+            self.__store.migrate_pickles(self.__logger)
+
+        self.known_face_names = []
+        """Name of the identity of each known encoding"""
+        self.identity_names = []
+        """Names of the distinct identities, match returns indices into this list"""
+        self.__identity_lookup = {}
+        """Maps each identity name to its index in self.identity_names"""
+        self.__identity_ids = []
+        """Index of the identity of each known encoding"""
+        self.__identity_groups = None
+        """Cached tuple (count, identity ids, order, starts) sorting the encodings by identity for the aggregation"""
+        self.__encodings = None
+        """Matrix of the known face encodings, only the first len(known_face_names) rows are used. Initially it is the
+        read-only memory map of the store, it is copied into a growing in-memory matrix once encodings are added"""
+        self.__squared_norms = None
+        """Cached squared euclidean norms of the rows of self.__encodings, computed on the first match. Like the
+        encoding matrix it doubles its capacity, only the first self.__squared_norm_count entries are valid"""
+        self.__squared_norm_count = 0
+        self.__store_rows = 0
+        """Number of rows of the encoding store which are in the gallery"""
+        self.__names_offset = 0
+        """End of the names of these rows in the names file of the store"""
+        self.__store_signature = None
+        """Signature of the store files when they were read last, see EncodingStore.get_signature"""
+        self.__load_store()
+        self.__logger_info(f"{len(self.known_face_names)} face encodings of {len(self.identity_names)} identities "
+                           f"were found")
+
+        if self.__use_index:
+            self.__load_index()
+            self.__update_index()
 
     def add_encoding(self, name, encoding):
         """
-        Adds an encoding to the encoding manager and writes in back into a "name".encoding file
+        Adds an encoding to the identity with the given name and appends it to the encoding store, the identity is
+        created if it does not exist yet
+        """
+        self.add_encodings([name], [encoding])
+        return True
+
+    def add_encodings(self, names, encodings, content_hashes=None):
+        """
+        Adds a batch of encodings to the identities with the given names with a single write to the encoding store,
+        identities are created if they do not exist yet
+
+        :param names: the names of the identities, one per encoding
+        :type names: list
+        :param encodings: the face encodings of shape (len(names), 128)
+        :param content_hashes: content hashes of the images the encodings were created from, they are recorded such
+        that the images are not enrolled again (see get_enrolled_hashes)
+        :type content_hashes: list
+        """
+        if len(names) == 0:
+            return
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self.__lock:
+            self.__store.append(names, encodings)
+            if content_hashes:
+                self.__store.append_enrolled_hashes(content_hashes)
+            # the appended rows are read back together with rows other processes appended in the meantime, such that
+            # the gallery keeps the order of the store
+            self.__load_changes()
+            if self.__max_encodings_per_identity is not None:
+                self.prune(self.__max_encodings_per_identity)
+            self.__update_index()
+
+    def get_enrolled_hashes(self):
+        """
+        Returns the content hashes of the images which were enrolled with add_encodings
+
+        :rtype: set
+        """
+        return self.__store.load_enrolled_hashes()
+
+    def save_index(self):
+        """
+        Persists the approximate index if encodings were inserted since it was persisted last. Inserts only persist
+        the index from time to time, hence it should be called once the encodings were added, e.g. when closing.
+        Encodings missing in a persisted index are inserted when it is loaded.
+        """
+        with self.__lock:
+            if self.__index is not None and len(self.__index) != self.__index_saved_size:
+                self.__index.save(self.__index_path)
+                self.__index_saved_size = len(self.__index)
+
+    def reload(self):
+        """
+        Loads the encodings which other tools or processes (e.g. a bulk enrolment or another machine writing to a shared
+        encodings directory) added to the encoding store since it was read. The store is only read if the inode,
+        modification time or size of its files changed. Appended rows are read on their own and added to the encoding
+        matrix, the cached norms and the index incrementally, only a rewritten store (e.g. after prune) is loaded
+        completely. Matches running on other threads either use the previous or the reloaded gallery.
+
+        :return: number of encodings which were loaded
+        :rtype: int
+        """
+        if self.__migrate_pickles:
+            self.__store.migrate_pickles(self.__logger)
+        with self.__lock:
+            return self.__load_changes()
+
+    def start_watching(self, interval=2.0):
+        """
+        Starts a thread calling reload every interval seconds
+
+        :param interval: seconds between two checks of the encoding store
+        :type interval: float
+        """
+        def _reload_periodically():
+            while not self.__stop_event.wait(interval):
+                try:
+                    self.reload()
+                except Exception as error:
+                    # e.g. a legacy pickle file which is still being written, it is read on the next check
+                    self.__logger.warning(f"EncodingManager: Reloading the encodings failed: {error}")
+
+        if self.__watch_thread is not None:
+            return
+        self.__stop_event.clear()
+        self.__watch_thread = threading.Thread(target=_reload_periodically, daemon=True)
+        self.__watch_thread.start()
+        self.__logger_info(f"Watching {self.__encodings_path} for new encodings every {interval}s")
+
+    def stop_watching(self):
+        """
+        Stops the watching thread
+        """
+        if self.__watch_thread is not None:
+            self.__stop_event.set()
+            self.__watch_thread.join()
+            self.__watch_thread = None
+
+    def prune(self, max_encodings_per_identity):
+        """
+        Reduces every identity with more encodings than max_encodings_per_identity to as many representative
+        encodings and rewrites the encoding store. The representatives are chosen by farthest point sampling starting
+        at the encoding closest to the centroid of the identity, such that different poses and lighting are kept.
+
+        :param max_encodings_per_identity: maximal number of encodings kept per identity, at least 1
+        :type max_encodings_per_identity: int
+        :return: number of removed encodings
+        """
+        with self.__lock:
+            return self.__prune(max_encodings_per_identity)
+
+    def __prune(self, max_encodings_per_identity):
+        """
+        Performs prune while the gallery is locked
+        """
+        count = len(self.known_face_names)
+        identity_ids = np.array(self.__identity_ids, dtype=np.int64)
+        counts = np.bincount(identity_ids, minlength=len(self.identity_names))
+        if count == 0 or counts.max() <= max_encodings_per_identity:
+            return 0
+
+        keep = np.ones(count, dtype=bool)
+        for identity_id in np.flatnonzero(counts > max_encodings_per_identity):
+            rows = np.flatnonzero(identity_ids == identity_id)
+            keep[rows] = False
+            keep[rows[self.__representatives(self.__encodings[rows], max_encodings_per_identity)]] = True
+
+        kept_rows = np.flatnonzero(keep)
+        self.__store.rewrite([self.known_face_names[row] for row in kept_rows], self.__encodings[kept_rows])
+        self.__load_store()
+
+        if self.__index is not None:
+            self.__index = None
+            self.__update_index()
+
+        removed = count - len(kept_rows)
+        self.__logger_info(f"Pruned {removed} encodings to keep at most {max_encodings_per_identity} per identity")
+        return removed
+
+    @property
+    def known_face_encodings(self):
+        """
+        The known face encodings as float32 matrix of shape (N, 128), the rows match self.known_face_names
+
+        :rtype: numpy.ndarray
+        """
+        with self.__lock:
+            return self.__encodings[:len(self.known_face_names)]
+
+    @property
+    def gallery_key(self):
+        """
+        Identifies the content of the gallery, it changes whenever encodings are added, reloaded or pruned. It is
+        derived from the signature of the encoding store the gallery was read from, such that processes reading the
+        same store get the same key, also if a prune and an append leave the number of encodings unchanged.
+
+        :rtype: str
+        """
+        with self.__lock:
+            return hashlib.sha1(repr(self.__store_signature).encode()).hexdigest()
+
+    def match(self, face_encodings, tolerance=0.6, top_k=1):
+        """
+        Matches all given face encodings against the known identities in a single batched matrix operation. The
+        distance to an identity is the minimal distance to any of its encodings.
+        If the approximate index is active, each face is only compared to the candidates the index returns.
+
+        :param face_encodings: the encodings of the detected faces, shape (M, 128)
+        :param tolerance: maximal distance between two encodings to count as a match
+        :type tolerance: float
+        :param top_k: number of closest identities returned per face
+        :type top_k: int
+        :return: tuple (best_indices, best_distances, top_k_indices, top_k_distances, identity_names) of indices into
+        identity_names with best_indices of shape (M,) being -1 where the closest identity is further away than
+        the tolerance, and the top_k arrays of shape (M, min(top_k, number of identities)) sorted by increasing
+        distance and padded with -1/inf if the index found fewer candidates. identity_names is the list of identity
+        names the indices refer to, a reload running after the match replaces self.identity_names but not this list
+        """
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self.__lock:
+            # appended identities extend the list, a reloaded store replaces it, hence the indices stay valid for it
+            return (*self.__match(queries, tolerance, top_k), self.identity_names)
+
+    def __match(self, queries, tolerance, top_k):
+        """
+        Performs match while the gallery is locked, see match for the parameters
+        """
+        count = len(self.known_face_names)
+        top_k = min(top_k, len(self.identity_names))
+        if count == 0 or len(queries) == 0:
+            empty = np.empty((len(queries), top_k))
+            return np.full(len(queries), -1), np.full(len(queries), np.inf), empty.astype(int), empty
+
+        self.__update_squared_norms()
+        if self.__index is None:
+            _, _, order, starts = self.__get_identity_groups()
+            distances = self.__distances(queries, slice(0, count))
+            identity_distances = np.minimum.reduceat(distances[:, order], starts, axis=1)
+            top_k_indices, top_k_distances = self.__smallest(identity_distances, top_k)
+        else:
+            _, identity_ids, _, _ = self.__get_identity_groups()
+            top_k_indices = np.full((len(queries), top_k), -1)
+            top_k_distances = np.full((len(queries), top_k), np.inf)
+            for query_nr, query in enumerate(queries):
+                candidates = self.__index.candidates(query)
+                distances = self.__distances(query[np.newaxis], candidates)[0]
+                order = np.argsort(distances)
+                # the first occurrence of an identity in the sorted candidates is its minimal distance
+                candidate_ids, first = np.unique(identity_ids[candidates[order]], return_index=True)
+                first_sorted = np.argsort(first)[:top_k]
+                top_k_indices[query_nr, :len(first_sorted)] = candidate_ids[first_sorted]
+                top_k_distances[query_nr, :len(first_sorted)] = distances[order[first[first_sorted]]]
+
+        best_distances = top_k_distances[:, 0]
+        best_indices = np.where(best_distances <= tolerance, top_k_indices[:, 0], -1)
+        return best_indices, best_distances, top_k_indices, top_k_distances
+
+    def __distances(self, queries, rows):
         """
-        file_name = name+".encoding"
-        path = os.path.join(self.__encodings_path, file_name)
-        if os.path.exists(path):
-            self.__logger.warning(f"EncodingManager: file {path} already exists")
-            return False
+        Computes the euclidean distances between the queries and the selected rows of the encoding matrix
+
+        :param queries: float32 matrix of shape (M, 128)
+        :param rows: a slice or an index array selecting the known encodings to compare against
+        :return: matrix of shape (M, number of selected rows)
+        """
+        # ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b for all pairs at once
+        squared_distances = self.__encodings[rows] @ queries.T
+        squared_distances *= -2
+        squared_distances += self.__squared_norms[rows, np.newaxis]
+        squared_distances += np.einsum("ij,ij->i", queries, queries)[np.newaxis, :]
+        return np.sqrt(np.maximum(squared_distances.T, 0))
+
+    @staticmethod
+    def __smallest(distances, top_k):
+        """
+        Returns the column indices and values of the top_k smallest distances per row sorted by increasing distance
+
+        :param distances: matrix of shape (M, N)
+        :param top_k: number of columns to select, at most N
+        :type top_k: int
+        """
+        if top_k < distances.shape[1]:
+            indices = np.argpartition(distances, top_k - 1, axis=1)[:, :top_k]
+        else:
+            indices = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+        values = np.take_along_axis(distances, indices, axis=1)
+        order = np.argsort(values, axis=1)
+        return np.take_along_axis(indices, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+    def __load_index(self):
+        """
+        Loads the persisted index if it was built for the currently known encodings
+        """
+        if not os.path.exists(self.__index_path):
+            return
+        index = IVFIndex.load(self.__index_path)
+        if index.names != self.known_face_names[:len(index)]:
+            self.__logger_info(f"Persisted index {self.__index_path} does not match the encodings, it is ignored")
+            return
+        # encodings added since the index was persisted are inserted by self.__update_index
+        index.n_probe = self.__index_n_probe
+        self.__index = index
+        self.__index_saved_size = len(index)
+        self.__logger_info(f"Loaded index with {len(index.centroids)} partitions from {self.__index_path}")
+
+    def __update_index(self):
+        """
+        Builds the index once the gallery is large enough, rebuilds it when the gallery doubled in size since the
+        last build such that the partitions stay balanced and otherwise inserts new encodings incrementally. A built
+        index is persisted immediately, inserts only once INDEX_SAVE_SHARE is exceeded (see save_index).
+        """
+        if not self.__use_index:
+            return
+        count = len(self.known_face_names)
+        if self.__index is None and count < INDEX_MIN_SIZE:
+            return
+
+        if self.__index is None or count >= 2 * len(self.__index.centroids) ** 2:
+            self.__index = IVFIndex(n_probe=self.__index_n_probe)
+            self.__index.build(self.known_face_encodings, self.known_face_names)
+            self.__logger_info(f"Built index with {len(self.__index.centroids)} partitions for {count} encodings")
+            self.__index_saved_size = 0
+        elif len(self.__index) == count:
+            return
         else:
-            with open(path, "wb") as encoding_file:
-                pickle.dump(encoding, encoding_file)
-            self.known_face_names.append(name)
-            self.known_face_encodings.append(encoding)
-            return True
+            indexed = len(self.__index)
+            self.__index.add_batch(self.__encodings[indexed:count], self.known_face_names[indexed:count])
+            if count - self.__index_saved_size <= INDEX_SAVE_SHARE * self.__index_saved_size:
+                return
+        self.__index.save(self.__index_path)
+        self.__index_saved_size = count
+
+    def __load_store(self):
+        """
+        Reads all encodings of the encoding store into the gallery, replacing the current gallery. It is called while
+        the gallery is locked. The new gallery is built aside and replaces the lists instead of refilling them, such
+        that a caller holding the identity names of a previous match (see match) keeps a consistent list.
+        """
+        signature = self.__store.get_signature()
+        names, encodings, names_offset = self.__store.load()
+        identity_lookup = {}
+        for name in names:
+            identity_lookup.setdefault(name, len(identity_lookup))
+        identity_ids = [identity_lookup[name] for name in names]
+
+        self.__store_signature, self.__names_offset, self.__store_rows = signature, names_offset, len(names)
+        self.identity_names = list(identity_lookup)
+        self.__identity_lookup = identity_lookup
+        self.__identity_ids = identity_ids
+        self.__identity_groups = None
+        self.__encodings = encodings
+        self.__squared_norms = None
+        self.__squared_norm_count = 0
+        self.known_face_names = names
+
+    def __load_changes(self):
+        """
+        Adds the rows appended to the encoding store since it was read last, see reload
+
+        :return: number of encodings which were loaded
+        """
+        signature = self.__store.get_signature()
+        if signature == self.__store_signature:
+            return 0
+
+        tail = None
+        # os.replace gives a rewritten file a new inode, appending keeps it
+        is_rewritten = any(previous is not None and current is not None and previous[0] != current[0]
+                           for previous, current in zip(self.__store_signature, signature))
+        if not is_rewritten:
+            tail = self.__store.load_tail(self.__store_rows, self.__names_offset)
+        if tail is None:
+            self.__load_store()
+            self.__index = None
+            if self.__use_index:
+                self.__load_index()
+                self.__update_index()
+            self.__logger_info(f"Reloaded the rewritten encoding store with {len(self.known_face_names)} encodings")
+            return len(self.known_face_names)
+
+        names, encodings, self.__names_offset = tail
+        for name, encoding in zip(names, encodings):
+            self.__append_encoding(name, encoding)
+        self.__store_rows += len(names)
+        self.__store_signature = signature
+        self.__update_index()
+        if len(names):
+            self.__logger_info(f"Loaded {len(names)} encodings appended to the encoding store")
+        return len(names)
+
+    def __append_encoding(self, name, encoding):
+        """
+        Appends the encoding to the encoding matrix, which doubles its capacity whenever it is full
+
+        :param name: name of the person the encoding belongs to
+        :type name: str
+        :param encoding: the face encoding of length 128
+        """
+        count = len(self.known_face_names)
+        if count == len(self.__encodings):
+            encodings = np.empty((max(16, 2 * count), ENCODING_SIZE), dtype=np.float32)
+            encodings[:count] = self.__encodings[:count]
+            self.__encodings = encodings
+        self.__encodings[count] = encoding
+        self.__identity_ids.append(self.__get_identity_id(name))
+        self.known_face_names.append(name)
+
+    def __get_identity_id(self, name):
+        """
+        Returns the index of the identity with the given name, a new identity is created if it does not exist
+
+        :param name: name of the identity
+        :type name: str
+        """
+        identity_id = self.__identity_lookup.get(name)
+        if identity_id is None:
+            identity_id = len(self.identity_names)
+            self.__identity_lookup[name] = identity_id
+            self.identity_names.append(name)
+        return identity_id
+
+    def __get_identity_groups(self):
+        """
+        Returns the identity ids of the known encodings as array, the order sorting the known encodings by identity
+        and the start of each identity within this order, the result is cached until encodings are added
+        """
+        count = len(self.known_face_names)
+        if self.__identity_groups is None or self.__identity_groups[0] != count:
+            identity_ids = np.asarray(self.__identity_ids[:count])
+            order = np.argsort(identity_ids, kind="stable")
+            starts = np.searchsorted(identity_ids[order], np.arange(len(self.identity_names)))
+            self.__identity_groups = (count, identity_ids, order, starts)
+        return self.__identity_groups
+
+    @staticmethod
+    def __representatives(encodings, number):
+        """
+        Selects representative encodings by farthest point sampling
+
+        :param encodings: the encodings of one identity, shape (N, 128)
+        :param number: number of encodings to select, smaller than N
+        :type number: int
+        :return: indices of the selected encodings
+        """
+        encodings = np.asarray(encodings, dtype=np.float32)
+        centroid = encodings.mean(axis=0)
+        selected = [int(np.argmin(np.sum((encodings - centroid) ** 2, axis=1)))]
+        min_distances = np.sum((encodings - encodings[selected[0]]) ** 2, axis=1)
+        while len(selected) < number:
+            farthest = int(np.argmax(min_distances))
+            selected.append(farthest)
+            min_distances = np.minimum(min_distances, np.sum((encodings - encodings[farthest]) ** 2, axis=1))
+        return np.array(selected)
+
+    def __update_squared_norms(self):
+        """
+        Computes the squared norms of all encodings which were added since the last call
+        """
+        count = len(self.known_face_names)
+        known = self.__squared_norm_count
+        if known < count:
+            if self.__squared_norms is None or len(self.__squared_norms) < count:
+                squared_norms = np.empty(max(16, 2 * count), dtype=np.float32)
+                if known:
+                    squared_norms[:known] = self.__squared_norms[:known]
+                self.__squared_norms = squared_norms
+            self.__squared_norms[known:count] = np.einsum("ij,ij->i", self.__encodings[known:count],
+                                                          self.__encodings[known:count])
+            self.__squared_norm_count = count
 
     def __logger_info(self, msg):
         """
@@ -0,0 +1,309 @@
+"""
+A script to persist face encodings in a single memory-mappable file with a separate index of names
+"""
+import contextlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+ENCODING_SIZE = 128
+"""Number of dimensions of a face encoding"""
+
+ROW_BYTES = ENCODING_SIZE * np.dtype(np.float32).itemsize
+"""Number of bytes a single encoding occupies in the encodings file"""
+
+
+class EncodingStore:
+    encodings_file_name = "encodings.f32"
+    """Raw float32 matrix of shape (N, 128) in C order without header, such that rows can be appended"""
+    names_file_name = "names.jsonl"
+    """One JSON encoded name per line, the n-th line belongs to the n-th row of the encodings file"""
+    enrolled_file_name = "enrolled.txt"
+    """One content hash per line of the images whose encodings are in the store"""
+    lock_file_name = "store.lock"
+    """Empty file which is locked exclusively while a process writes to the store"""
+
+    def __init__(self, directory):
+        """
+        Constructor of the EncodingStore
+
+        Stores all face encodings of a directory in one append-only file which is opened with memory mapping, such that
+        opening a gallery does not depend on its size. Writers of several processes are serialised by a lock file, each
+        store remembers the end of the files it wrote such that an append does not read the store again.
+
+        :param directory: the directory containing the store files, it is created if it does not exist
+        :type directory: str
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.__directory = directory
+        self.__encodings_path = os.path.join(directory, EncodingStore.encodings_file_name)
+        self.__names_path = os.path.join(directory, EncodingStore.names_file_name)
+        self.__enrolled_path = os.path.join(directory, EncodingStore.enrolled_file_name)
+        self.__lock_path = os.path.join(directory, EncodingStore.lock_file_name)
+        self.__rows = None
+        """Number of complete rows when this store wrote to the files last, None until the first write"""
+        self.__names_offset = 0
+        """Size of the names file when this store wrote to the files last"""
+        self.__inodes = None
+        """Inodes of the encodings and the names file when this store wrote to them last, a rewrite replaces them"""
+
+    def load(self):
+        """
+        Opens the stored encodings
+
+        Rows without a name (e.g. due to an interrupted append) are ignored
+
+        :return: tuple (names, encodings, names offset) with encodings being a read-only memory map of shape
+        (len(names), 128) and the names offset being the end of the read names in the names file (see load_tail)
+        """
+        names, names_offset = self.__read_names(0, self.__count_rows())
+        if len(names) == 0:
+            return [], np.empty((0, ENCODING_SIZE), dtype=np.float32), names_offset
+
+        encodings = np.memmap(self.__encodings_path, dtype=np.float32, mode="r", shape=(len(names), ENCODING_SIZE))
+        return names, encodings, names_offset
+
+    def load_tail(self, rows, names_offset):
+        """
+        Reads the encodings which were appended after the first rows, e.g. by another process
+
+        :param rows: number of rows which were read before
+        :type rows: int
+        :param names_offset: end of the names of these rows in the names file, as returned by load or load_tail
+        :type names_offset: int
+        :return: tuple (names, encodings, names offset) of the appended rows, None if the store was shortened since
+        (e.g. rewritten by prune) such that it has to be loaded completely
+        """
+        total_rows = self.__count_rows()
+        names_size = os.path.getsize(self.__names_path) if os.path.exists(self.__names_path) else 0
+        if total_rows < rows or names_size < names_offset:
+            return None
+
+        names, names_offset = self.__read_names(names_offset, total_rows - rows)
+        encodings = np.fromfile(self.__encodings_path, dtype=np.float32, count=len(names) * ENCODING_SIZE,
+                                offset=rows * ROW_BYTES) if len(names) else np.empty(0, dtype=np.float32)
+        return names, encodings.reshape(-1, ENCODING_SIZE), names_offset
+
+    def get_signature(self):
+        """
+        Returns the inode, modification time and size of the encodings and the names file (None for a missing file),
+        it changes whenever the store is written to
+
+        :rtype: tuple
+        """
+        signature = []
+        for path in (self.__encodings_path, self.__names_path):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def append(self, names, encodings):
+        """
+        Appends encodings and their names to the store, the encodings are written before the names such that an
+        interrupted append never leaves a name without an encoding
+
+        :param names: the names of the encodings
+        :type names: list
+        :param encodings: the encodings of shape (len(names), 128)
+        """
+        with self.__locked():
+            self.__append(names, encodings)
+
+    def load_enrolled_hashes(self):
+        """
+        Returns the content hashes of the images whose encodings were appended
+
+        :rtype: set
+        """
+        if not os.path.exists(self.__enrolled_path):
+            return set()
+        with open(self.__enrolled_path, "r", encoding="utf-8") as enrolled_file:
+            return {line.strip() for line in enrolled_file if line.endswith("\n")}
+
+    def append_enrolled_hashes(self, content_hashes):
+        """
+        Records the content hashes of images whose encodings were appended, it is called after append such that an
+        interrupted enrolment enrols the image again instead of losing it
+
+        :param content_hashes: content hashes of the images
+        :type content_hashes: list
+        """
+        with open(self.__enrolled_path, "a", encoding="utf-8") as enrolled_file:
+            enrolled_file.writelines(content_hash + "\n" for content_hash in content_hashes)
+
+    def rewrite(self, names, encodings):
+        """
+        Replaces the content of the store, e.g. after encodings were removed
+
+        :param names: the names of the encodings
+        :type names: list
+        :param encodings: the encodings of shape (len(names), 128)
+        """
+        encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        names_data = self.__encode_names(names)
+        with self.__locked():
+            with open(self.__encodings_path + ".tmp", "wb") as encodings_file:
+                encodings_file.write(encodings.tobytes())
+            with open(self.__names_path + ".tmp", "wb") as names_file:
+                names_file.write(names_data)
+            os.replace(self.__encodings_path + ".tmp", self.__encodings_path)
+            os.replace(self.__names_path + ".tmp", self.__names_path)
+            self.__rows, self.__names_offset = len(encodings), len(names_data)
+            self.__inodes = self.__get_inodes()
+
+    def migrate_pickles(self, logger):
+        """
+        Moves the encodings of legacy "name".encoding pickle files into the store. Migrated files are renamed to
+        "name".encoding.migrated such that they are read only once. The files are read and renamed while the store is
+        locked, such that processes migrating at the same time neither migrate a file twice nor miss a renamed one.
+
+        :param logger: object used to perform logging
+        :type logger: logging.Logger
+        :return: number of migrated encodings
+        """
+        if len(self.__find_pickles()) == 0:
+            return 0
+
+        with self.__locked():
+            # another process may have migrated the files while this one waited for the lock
+            paths = self.__find_pickles()
+            if len(paths) == 0:
+                return 0
+            names, encodings = [], []
+            for path in sorted(paths):
+                with open(path, "rb") as encoding_file:
+                    encodings.append(pickle.load(encoding_file))
+                names.append(os.path.splitext(os.path.basename(path))[0])
+            self.__append(names, np.array(encodings))
+
+            for path in paths:
+                os.replace(path, path + ".migrated")
+        logger.info(f"EncodingStore: migrated {len(names)} .encoding files into {self.__encodings_path}")
+        return len(names)
+
+    def __find_pickles(self):
+        """
+        Returns the paths of the legacy .encoding pickle files of the directory
+        """
+        with os.scandir(self.__directory) as entries:
+            return [entry.path for entry in entries if entry.is_file() and entry.name.endswith(".encoding")]
+
+    @contextlib.contextmanager
+    def __locked(self):
+        """
+        Holds an exclusive lock on the lock file of the store while the block runs, it waits for other processes
+        holding it
+        """
+        with open(self.__lock_path, "a+b") as lock_file:
+            if os.name == "nt":
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            else:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if os.name == "nt":
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def __append(self, names, encodings):
+        """
+        Performs append while the store is locked
+        """
+        encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        names_data = self.__encode_names(names)
+        self.__repair_end()
+        with open(self.__encodings_path, "ab") as encodings_file:
+            encodings_file.write(encodings.tobytes())
+        with open(self.__names_path, "ab") as names_file:
+            names_file.write(names_data)
+        self.__rows += len(encodings)
+        self.__names_offset += len(names_data)
+        self.__inodes = self.__get_inodes()
+
+    def __repair_end(self):
+        """
+        Makes the ends of both files consistent before an append, it is called while the store is locked. If only
+        this store wrote since its last write, the sizes of the files match the remembered ones and nothing is read.
+        If other processes appended, only their names are read, the store is read completely if it is written for the
+        first time or it was rewritten since. As no other process writes while the store is locked, rows without a
+        name and a partially written name are left over from an interrupted append and are cut off.
+        """
+        encodings_size = os.path.getsize(self.__encodings_path) if os.path.exists(self.__encodings_path) else 0
+        names_size = os.path.getsize(self.__names_path) if os.path.exists(self.__names_path) else 0
+        is_known = self.__rows is not None and self.__get_inodes() == self.__inodes
+        if is_known and encodings_size == self.__rows * ROW_BYTES and names_size == self.__names_offset:
+            return
+
+        if is_known and encodings_size >= self.__rows * ROW_BYTES and names_size >= self.__names_offset:
+            names, names_offset = self.__read_names(self.__names_offset, encodings_size // ROW_BYTES - self.__rows)
+            rows = self.__rows + len(names)
+        else:
+            names, names_offset = self.__read_names(0, encodings_size // ROW_BYTES)
+            rows = len(names)
+
+        if encodings_size != rows * ROW_BYTES:
+            with open(self.__encodings_path, "r+b") as encodings_file:
+                encodings_file.truncate(rows * ROW_BYTES)
+        if names_size != names_offset:
+            with open(self.__names_path, "r+b") as names_file:
+                names_file.truncate(names_offset)
+        self.__rows, self.__names_offset = rows, names_offset
+
+    def __get_inodes(self):
+        """
+        Returns the inodes of the encodings and the names file, None for a missing file
+        """
+        return tuple(None if entry is None else entry[0] for entry in self.get_signature())
+
+    @staticmethod
+    def __encode_names(names):
+        """
+        Returns the lines of the names file for the names as UTF-8 bytes
+        """
+        return "".join(json.dumps(name) + "\n" for name in names).encode("utf-8")
+
+    def __count_rows(self):
+        """
+        Returns the number of complete rows in the encodings file
+        """
+        if not os.path.exists(self.__encodings_path):
+            return 0
+        return os.path.getsize(self.__encodings_path) // ROW_BYTES
+
+    def __read_names(self, offset, max_count):
+        """
+        Reads the complete lines of the names file starting at the byte offset
+
+        :param offset: byte offset of the first name to read
+        :type offset: int
+        :param max_count: maximal number of names to read, names of rows which were not written yet are not read
+        :type max_count: int
+        :return: tuple (names, byte offset after the last read name)
+        """
+        names = []
+        if max_count <= 0 or not os.path.exists(self.__names_path):
+            return names, offset
+        with open(self.__names_path, "rb") as names_file:
+            names_file.seek(offset)
+            for line in names_file:
+                if not line.endswith(b"\n"):
+                    break
+                names.append(json.loads(line))
+                offset += len(line)
+                if len(names) == max_count:
+                    break
+        return names, offset
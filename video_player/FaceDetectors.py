@@ -0,0 +1,148 @@
+"""
+This script contains the face detector backends the FaceRecognizer can locate faces with. All detectors take an RGB
+image and return the face locations as (top, right, bottom, left) tuples in coordinates of the image.
+"""
+import os
+
+import cv2
+import numpy as np
+
+DETECTOR_NAMES = ["hog", "cnn", "haar", "dnn"]
+"""Names of the available detector backends, see create_detector"""
+
+MODELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models")
+"""Directory the model files of the OpenCV detectors are loaded from by default"""
+
+
+class DlibDetector:
+
+    def __init__(self, model="hog", number_of_times_to_upsample=1):
+        """
+        Constructor of the DlibDetector
+
+        Locates faces with dlib through face_recognition, either with the HOG model which runs on the CPU or with the
+        CNN model which is accurate but impractical without a GPU
+
+        :param model: either "hog" or "cnn"
+        :type model: str
+        :param number_of_times_to_upsample: How many times the image is upsampled to find smaller faces
+        :type number_of_times_to_upsample: int
+        """
+        import face_recognition
+
+        self.__face_locations = face_recognition.face_locations
+        self.name = model
+        self.__number_of_times_to_upsample = number_of_times_to_upsample
+
+    def locate(self, img):
+        """
+        Returns the face locations (top, right, bottom, left) in the RGB image
+        """
+        return self.__face_locations(img, model=self.name,
+                                     number_of_times_to_upsample=self.__number_of_times_to_upsample)
+
+
+class HaarCascadeDetector:
+
+    def __init__(self, cascade_path=None, scale_factor=1.2, min_neighbors=5, min_size=24):
+        """
+        Constructor of the HaarCascadeDetector
+
+        Locates frontal faces with an OpenCV Haar cascade, which is several times faster than the dlib HOG model on
+        the CPU at the cost of more false positives and missed profile faces
+
+        :param cascade_path: path to the cascade XML file, None to use models/haarcascade_frontalface_default.xml or
+        the cascade shipped with opencv-python
+        :type cascade_path: str
+        :param scale_factor: factor between two scales of the image pyramid
+        :type scale_factor: float
+        :param min_neighbors: number of overlapping candidates required for a detection
+        :type min_neighbors: int
+        :param min_size: minimal edge length of a face in pixels
+        :type min_size: int
+        """
+        if cascade_path is None:
+            file_name = "haarcascade_frontalface_default.xml"
+            cascade_path = os.path.join(MODELS_PATH, file_name)
+            if not os.path.exists(cascade_path) and hasattr(cv2, "data"):
+                cascade_path = os.path.join(cv2.data.haarcascades, file_name)
+        if not os.path.exists(cascade_path):
+            raise IOError(f"Haar cascade {cascade_path} does not exist")
+        self.__cascade = cv2.CascadeClassifier(cascade_path)
+        self.name = "haar"
+        self.__scale_factor = scale_factor
+        self.__min_neighbors = min_neighbors
+        self.__min_size = (min_size, min_size)
+
+    def locate(self, img):
+        """
+        Returns the face locations (top, right, bottom, left) in the RGB image
+        """
+        gray = cv2.equalizeHist(cv2.cvtColor(img, cv2.COLOR_RGB2GRAY))
+        faces = self.__cascade.detectMultiScale(gray, scaleFactor=self.__scale_factor,
+                                                minNeighbors=self.__min_neighbors, minSize=self.__min_size)
+        return [(int(y), int(x + w), int(y + h), int(x)) for x, y, w, h in faces]
+
+
+class DnnDetector:
+
+    def __init__(self, model_path=None, config_path=None, confidence=0.5, input_size=300):
+        """
+        Constructor of the DnnDetector
+
+        Locates faces with a single shot detector loaded by cv2.dnn from a local file, e.g. the ResNet-10 SSD of the
+        OpenCV face detector sample (res10_300x300_ssd_iter_140000.caffemodel with deploy.prototxt)
+
+        :param model_path: path to the model weights, None to use models/face_detector.caffemodel
+        :type model_path: str
+        :param config_path: path to the network description, None to use models/face_detector.prototxt if it exists
+        :type config_path: str
+        :param confidence: minimal confidence of a detection
+        :type confidence: float
+        :param input_size: edge length of the square network input
+        :type input_size: int
+        """
+        if model_path is None:
+            model_path = os.path.join(MODELS_PATH, "face_detector.caffemodel")
+        if config_path is None and os.path.exists(os.path.join(MODELS_PATH, "face_detector.prototxt")):
+            config_path = os.path.join(MODELS_PATH, "face_detector.prototxt")
+        if not os.path.exists(model_path):
+            raise IOError(f"Face detector model {model_path} does not exist")
+        self.__net = cv2.dnn.readNet(model_path, config_path or "")
+        self.name = "dnn"
+        self.__confidence = confidence
+        self.__input_size = (input_size, input_size)
+
+    def locate(self, img):
+        """
+        Returns the face locations (top, right, bottom, left) in the RGB image
+        """
+        height, width = img.shape[:2]
+        # the network expects BGR input with the mean of its training data subtracted
+        blob = cv2.dnn.blobFromImage(img, 1.0, self.__input_size, (104.0, 177.0, 123.0), swapRB=True)
+        self.__net.setInput(blob)
+        detections = self.__net.forward().reshape(-1, 7)
+        detections = detections[detections[:, 2] >= self.__confidence]
+
+        boxes = np.clip(detections[:, 3:7], 0, 1) * np.array([width, height, width, height])
+        return [(int(top), int(right), int(bottom), int(left)) for left, top, right, bottom in boxes
+                if right > left and bottom > top]
+
+
+def create_detector(name, number_of_times_to_upsample=1):
+    """
+    Creates the detector backend with the given name
+
+    :param name: one of DETECTOR_NAMES: "hog" and "cnn" (dlib), "haar" (OpenCV Haar cascade) or "dnn" (OpenCV
+    single shot detector loaded from the models directory)
+    :type name: str
+    :param number_of_times_to_upsample: How many times the image is upsampled to find smaller faces, only used by dlib
+    :type number_of_times_to_upsample: int
+    """
+    if name in ("hog", "cnn"):
+        return DlibDetector(name, number_of_times_to_upsample)
+    if name == "haar":
+        return HaarCascadeDetector()
+    if name == "dnn":
+        return DnnDetector()
+    raise ValueError(f"Unknown face detector {name}, expected one of {', '.join(DETECTOR_NAMES)}")
@@ -0,0 +1,26 @@
+"""
+This script contains the drawing of the recognized faces, shared by the video player and the benchmarks, such that
+every place marks faces the same way
+"""
+import cv2
+
+
+def draw_face_rectangles(img, faces):
+    """
+    Draws on the input image around the discovered faces a red box with a label on the bottom
+
+    :param img: BGR or BGRA image, it is drawn on in place
+    :type img: numpy.ndarray
+    :param faces: list of tuples (face location, name, distance) as returned by the face recognition
+    """
+    for (top, right, bottom, left), name, _ in faces:
+        # Draw a box around the face
+        img = cv2.rectangle(img, (left, top), (right, bottom), (0, 0, 255), 2)
+
+        # Draw a label with a name below the face
+        (text_width, text_height), baseline = cv2.getTextSize(name, cv2.FONT_HERSHEY_PLAIN, 1, 2)
+        img = cv2.rectangle(img, (left, bottom - text_height), (right, bottom), (0, 0, 255), -1)
+        img = cv2.putText(img, name, (left + 6, bottom), cv2.FONT_HERSHEY_PLAIN, 1,
+                          (255, 255, 255), 2)
+
+    return img
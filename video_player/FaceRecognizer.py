@@ -0,0 +1,150 @@
+"""
+This script contains a class performing the face detection and recognition on single images, independent of how
+the images are obtained (vlc video callback, OpenCV decoding, ...)
+"""
+import cv2
+import face_recognition as fr
+
+from video_player.FaceDetectors import create_detector
+
+
+class FaceRecognizer:
+
+    def __init__(self, encoding_manager, face_recognition_model="hog", detection_max_size=640,
+                 number_of_times_to_upsample=1, tolerance=0.6, detector=None):
+        """
+        Constructor of the FaceRecognizer
+
+        Detects faces in RGB images, calculates their encodings and matches them against the known face encodings
+
+        :param encoding_manager: a unit managing available encodings
+        :type encoding_manager: video_player.EncodingManager.EncodingManager
+
+        :param face_recognition_model: The face detector backend, either "cnn" which is accurate, slower and used GPU,
+        "hog" which is faster but not as precise, "haar" (OpenCV Haar cascade) which is several times faster than "hog"
+        on the CPU or "dnn" (OpenCV single shot detector from the models directory)
+        :type face_recognition_model: str
+
+        :param detection_max_size: Maximal length of the longer image edge the face detection runs on, larger images
+        are downscaled, None or 0 to detect on the full resolution
+        :type detection_max_size: int
+
+        :param number_of_times_to_upsample: How many times the detection image is upsampled to find smaller faces
+        :type number_of_times_to_upsample: int
+
+        :param tolerance: maximal distance between two encodings to count as a match
+        :type tolerance: float
+
+        :param detector: an already created backend of face_recognition_model (e.g. prepared by video_player.WarmUp),
+        None to create it
+        """
+        self.enc_manager = encoding_manager
+        self.__detection_max_size = detection_max_size
+        self.__number_of_times_to_upsample = number_of_times_to_upsample
+        if detector is None:
+            detector = create_detector(face_recognition_model, number_of_times_to_upsample)
+        self.detector = detector
+        """The backend locating the faces, see video_player.FaceDetectors"""
+        self.__tolerance = tolerance
+
+        self.encoded_faces = 0
+        """Number of faces the (expensive) encoding was calculated for"""
+
+    def set_detector(self, face_recognition_model, detector=None):
+        """
+        Replaces the face detector backend, e.g. when it was selected in the GUI. A detection running on another thread
+        finishes with the previous backend.
+
+        :param face_recognition_model: name of the backend, one of video_player.FaceDetectors.DETECTOR_NAMES
+        :type face_recognition_model: str
+        :param detector: an already created backend of face_recognition_model, None to create it
+        """
+        if detector is None:
+            detector = create_detector(face_recognition_model, self.__number_of_times_to_upsample)
+        self.detector = detector
+
+    def locate(self, img):
+        """
+        Detects face locators in the input img. The detection runs on a downscaled copy of img, if img is larger than
+        detection_max_size.
+
+        :param img: RGB image to perform face detection on
+        :type img: numpy.ndarray
+        :return: list of face locations (top, right, bottom, left) in coordinates of img
+        """
+        height, width = img.shape[:2]
+        long_edge = max(width, height)
+        scale = 1
+        if self.__detection_max_size and long_edge > self.__detection_max_size:
+            scale = self.__detection_max_size / long_edge
+            img = cv2.resize(img, (max(1, int(width * scale)), max(1, int(height * scale))),
+                             interpolation=cv2.INTER_AREA)
+
+        face_locations = self.detector.locate(img)
+
+        if scale != 1:
+            face_locations = [tuple(int(coordinate / scale) for coordinate in location)
+                              for location in face_locations]
+        return face_locations
+
+    def encode(self, img, face_locations):
+        """
+        Calculates the face encodings of the faces at the given locations
+
+        :param img: RGB image containing the faces
+        :type img: numpy.ndarray
+        :param face_locations: list of face locations (top, right, bottom, left) in coordinates of img
+        :type face_locations: list
+        :return: list of face encodings
+        """
+        if len(face_locations) == 0:
+            return []
+        self.encoded_faces += len(face_locations)
+        return fr.face_encodings(img, face_locations)
+
+    def identify(self, face_encodings):
+        """
+        Matches the face encodings against the known face encodings
+
+        :param face_encodings: list of face encodings
+        :return: list of tuples (name, distance) for each encoding, the name is "unknown" if no known face is close
+        enough
+        """
+        # Use known face with the smallest distance to the new face, if it is close enough to be a match
+        best_indices, best_distances, _, _, identity_names = self.enc_manager.match(face_encodings,
+                                                                                   tolerance=self.__tolerance)
+
+        identities = []
+        for best_match_index, distance in zip(best_indices, best_distances):
+            name = "unknown"
+            if best_match_index >= 0:
+                name = identity_names[best_match_index]
+            identities.append((name, float(distance)))
+        return identities
+
+    def detect(self, img):
+        """
+        Detects face locators in the input img and uses the discovered face locators (potentially for multiple faces)
+        an calculates the face encodings
+
+        :param img: RGB image to perform face detection on
+        :type img: numpy.ndarray
+        :return: tuple (face locations, face encodings) with the locations (top, right, bottom, left) in coordinates
+        of img
+        """
+        face_locations = self.locate(img)
+        return face_locations, self.encode(img, face_locations)
+
+    def recognize(self, img):
+        """
+        Performs the face detection on the input img and matches the discovered faces against the known face
+        encodings
+
+        :param img: RGB image to perform face recognition on
+        :type img: numpy.ndarray
+        :return: list of tuples (face location, name, distance) for each discovered face in coordinates of img, the
+        name is "unknown" if no known face is close enough
+        """
+        face_locations, face_encodings = self.detect(img)
+        identities = self.identify(face_encodings)
+        return [(face_location, name, distance) for face_location, (name, distance) in zip(face_locations, identities)]
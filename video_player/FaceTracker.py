@@ -0,0 +1,210 @@
+"""
+This script contains a class to track faces between detection passes, such that boxes follow moving faces and the
+identity of a face is carried forward instead of encoding the face again on every detection pass
+"""
+import threading
+
+import cv2
+import numpy as np
+
+
+class Track:
+
+    def __init__(self, box, name, distance):
+        """
+        Constructor of the Track
+
+        A face followed over several frames
+
+        :param box: face location (top, right, bottom, left) in video frame coordinates
+        :param name: name of the identified person or "unknown"
+        :type name: str
+        :param distance: distance of the face encoding to the closest known encoding
+        :type distance: float
+        """
+        self.box = np.array(box, dtype=np.float32)
+        self.name = name
+        self.distance = distance
+        self.lost_passes = 0
+        """Number of consecutive detection passes which did not find the face"""
+        self.passes_since_encoding = 0
+        """Number of detection passes since the identity of the face was verified with its encoding"""
+        self.motion = np.zeros(2, dtype=np.float32)
+        """Sum of the shifts (dy, dx) the optical flow moved the box by since the track was started"""
+
+
+def intersection_over_union(box, other):
+    """
+    Returns the intersection over union of two face locations (top, right, bottom, left)
+    """
+    top, right = max(box[0], other[0]), min(box[1], other[1])
+    bottom, left = min(box[2], other[2]), max(box[3], other[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    area = (box[1] - box[3]) * (box[2] - box[0])
+    other_area = (other[1] - other[3]) * (other[2] - other[0])
+    union = area + other_area - intersection
+    return intersection / union if union > 0 else 0
+
+
+class FaceTracker:
+
+    def __init__(self, iou_threshold=0.3, max_lost_passes=2, reverify_passes=10, tracking_max_size=320):
+        """
+        Constructor of the FaceTracker
+
+        Moves the boxes of the tracked faces on every frame with the sparse optical flow of points within the boxes.
+        On detection passes the found faces are associated with the tracks by their intersection over union, only
+        faces of new tracks and of tracks due for re-verification are encoded.
+
+        :param iou_threshold: minimal intersection over union of a detected face and a track to be associated
+        :type iou_threshold: float
+        :param max_lost_passes: number of consecutive detection passes without the face after which a track is removed
+        :type max_lost_passes: int
+        :param reverify_passes: number of detection passes after which the identity of a track is verified again
+        :type reverify_passes: int
+        :param tracking_max_size: maximal length of the longer edge of the grayscale image the optical flow runs on
+        :type tracking_max_size: int
+        """
+        self.__iou_threshold = iou_threshold
+        self.__max_lost_passes = max_lost_passes
+        self.__reverify_passes = reverify_passes
+        self.__tracking_max_size = tracking_max_size
+
+        self.__lock = threading.Lock()
+        """Guards the tracks, which are moved by the video thread and associated by the detection thread"""
+        self.__tracks = []
+        self.__previous_gray = None
+        """Downscaled grayscale version of the previous frame"""
+
+    def track(self, frame):
+        """
+        Moves the boxes of all tracks by the optical flow between the previous and the given frame
+
+        :param frame: the current RGB or BGRA video frame, it is downscaled before it is converted to grayscale such
+        that full resolution frames are not converted as a whole
+        :type frame: numpy.ndarray
+        """
+        height, width = frame.shape[:2]
+        scale = min(1, self.__tracking_max_size / max(width, height))
+        # rows and columns are skipped down to twice the tracking size, the area filter of the remaining image is
+        # several times cheaper than of a 4K frame
+        step = max(1, int(1 / scale) // 2)
+        small = cv2.resize(frame[::step, ::step], (int(width * scale), int(height * scale)),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGRA2GRAY if small.shape[2] == 4 else cv2.COLOR_RGB2GRAY)
+
+        with self.__lock:
+            previous_gray, self.__previous_gray = self.__previous_gray, gray
+            if previous_gray is None or previous_gray.shape != gray.shape or len(self.__tracks) == 0:
+                return
+
+            # a grid of 4x4 points in the inner part of each box is followed
+            grid = np.linspace(0.25, 0.75, 4, dtype=np.float32)
+            points = []
+            for track in self.__tracks:
+                top, right, bottom, left = track.box * scale
+                xs, ys = np.meshgrid(left + grid * (right - left), top + grid * (bottom - top))
+                points.append(np.stack([xs.ravel(), ys.ravel()], axis=1))
+            points = np.concatenate(points).reshape(-1, 1, 2)
+
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(previous_gray, gray, points, None, winSize=(15, 15),
+                                                        maxLevel=2)
+            shifts = (moved - points).reshape(len(self.__tracks), -1, 2)
+            status = status.reshape(len(self.__tracks), -1).astype(bool)
+            for track, track_shifts, track_status in zip(self.__tracks, shifts, status):
+                if track_status.any():
+                    dx, dy = np.median(track_shifts[track_status], axis=0) / scale
+                    track.box += np.array([dy, dx, dy, dx], dtype=np.float32)
+                    track.motion += np.array([dy, dx], dtype=np.float32)
+
+    def mark(self):
+        """
+        Returns the motion of the tracks up to the current frame. The mark is handed to associate together with the
+        faces detected on this frame, such that the motion of the tracks while the detection was running is kept.
+
+        :return: dictionary of the tracks and their motion
+        """
+        with self.__lock:
+            return {track: track.motion.copy() for track in self.__tracks}
+
+    def associate(self, face_locations, identify_command, mark=None):
+        """
+        Associates the faces found by a detection pass with the tracks. Matched tracks take over the detected box moved
+        by the motion of the track since the detected frame, unmatched faces start new tracks and tracks which were not
+        found for too long are removed.
+
+        :param face_locations: list of face locations (top, right, bottom, left) in video frame coordinates
+        :type face_locations: list
+        :param identify_command: function called with a list of face locations which need to be encoded, it returns a
+        list of tuples (name, distance) for these faces
+        :param mark: motion of the tracks when the detected frame was shown as returned by mark, None if the tracks were
+        not moved since then
+        :type mark: dict
+        """
+        with self.__lock:
+            pairs = []
+            for track in self.__tracks:
+                # the detected faces are moved by the motion of the track since the detected frame, such that a stale
+                # detection does not pull the box back
+                dy, dx = track.motion - mark[track] if mark is not None and track in mark else (0, 0)
+                shift = np.array([dy, dx, dy, dx], dtype=np.float32)
+                for location_nr, location in enumerate(face_locations):
+                    moved_location = np.array(location, dtype=np.float32) + shift
+                    iou = intersection_over_union(moved_location, track.box)
+                    if iou >= self.__iou_threshold:
+                        pairs.append((iou, location_nr, track, moved_location))
+
+            # greedy association starting with the pairs overlapping the most
+            matched_locations, matched_tracks = set(), set()
+            to_identify = []
+            for _, location_nr, track, moved_location in sorted(pairs, key=lambda pair: pair[0], reverse=True):
+                if location_nr in matched_locations or id(track) in matched_tracks:
+                    continue
+                matched_locations.add(location_nr)
+                matched_tracks.add(id(track))
+                track.box = moved_location
+                track.lost_passes = 0
+                track.passes_since_encoding += 1
+                if track.passes_since_encoding >= self.__reverify_passes:
+                    to_identify.append((face_locations[location_nr], track))
+
+            for track in self.__tracks:
+                if id(track) not in matched_tracks:
+                    track.lost_passes += 1
+            self.__tracks = [track for track in self.__tracks if track.lost_passes <= self.__max_lost_passes]
+
+            for location_nr, location in enumerate(face_locations):
+                if location_nr not in matched_locations:
+                    to_identify.append((location, None))
+
+        if len(to_identify) == 0:
+            return
+
+        # the encoding is expensive, hence it runs without blocking the video thread
+        identities = identify_command([location for location, _ in to_identify])
+
+        with self.__lock:
+            for (location, track), (name, distance) in zip(to_identify, identities):
+                if track is None:
+                    self.__tracks.append(Track(location, name, distance))
+                else:
+                    track.name, track.distance = name, distance
+                    track.passes_since_encoding = 0
+
+    def get_faces(self):
+        """
+        Returns the currently tracked faces
+
+        :return: list of tuples (face location, name, distance) in video frame coordinates
+        """
+        with self.__lock:
+            return [(tuple(int(coordinate) for coordinate in track.box), track.name, track.distance)
+                    for track in self.__tracks]
+
+    def reset(self):
+        """
+        Removes all tracks, e.g. once the detection was deactivated
+        """
+        with self.__lock:
+            self.__tracks = []
+            self.__previous_gray = None
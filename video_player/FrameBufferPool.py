@@ -0,0 +1,177 @@
+"""
+This script contains a class managing a pool of frame buffers vlc decodes into, such that decoding, detection and
+display can overlap without vlc writing into a frame which is still read
+"""
+import ctypes
+import threading
+
+import numpy as np
+
+FREE, DECODING, DECODED, READY, READING = range(5)
+"""States of a buffer: free to decode into, locked by vlc, unlocked by vlc, displayable and taken by a reader"""
+
+
+class FrameBufferPool:
+
+    def __init__(self, count=4):
+        """
+        Constructor of the FrameBufferPool
+
+        Each buffer is owned by exactly one party at a time. vlc locks a free buffer and decodes into it (lock
+        callback), hands it back (unlock callback) and marks it as due for display (display callback). A reader takes
+        the latest displayable buffer and releases it once it is done with it. Displayable buffers which were not taken
+        before a newer one is displayed become free again.
+
+        The buffers are kept across media files and only reallocated if a frame does not fit into them.
+
+        :param count: initial number of buffers, the pool grows if vlc locks more buffers at the same time
+        :type count: int
+        """
+        self.__lock = threading.Lock()
+        self.__count = count
+        self.__buffers = []
+        """ctypes arrays vlc decodes into"""
+        self.__pointers = []
+        self.__views = []
+        """BGRA NumPy views on the buffers for the current frame size"""
+        self.__states = []
+        self.__retired = set()
+        """Indices of the buffers which were locked or taken when the pool was configured, they are not displayed and
+        are only freed once they are handed back"""
+        self.__ready = None
+        """Index of the latest displayable buffer, None if there is none"""
+        self.__capacity = 0
+        self.width, self.height = 0, 0
+
+        self.allocations = 0
+        """Number of buffers allocated so far"""
+        self.dropped_frames = 0
+        """Number of displayable frames which became free before they were taken"""
+
+    def configure(self, width, height):
+        """
+        Prepares the pool for frames of the given size, e.g. when a new media file is opened. The unused buffers are
+        freed and only reallocated if they are too small. Buffers vlc decodes into or a reader still holds are retired
+        instead, they are freed or reallocated once they are handed back.
+
+        :param width: width of the frames in pixels
+        :type width: int
+        :param height: height of the frames in pixels
+        :type height: int
+        """
+        with self.__lock:
+            self.__capacity = max(self.__capacity, width * height * 4)
+            self.width, self.height = width, height
+            while len(self.__buffers) < self.__count:
+                self.__allocate()
+                self.__views.append(None)
+                self.__states.append(FREE)
+            for index, state in enumerate(self.__states):
+                if state in (DECODING, READING):
+                    self.__retired.add(index)
+                else:
+                    self.__free(index)
+            self.__ready = None
+
+    def lock(self):
+        """
+        Hands a free buffer to vlc to decode into, called by the vlc lock callback
+
+        :return: tuple (buffer index, pointer to the buffer)
+        """
+        with self.__lock:
+            if FREE not in self.__states:
+                self.__allocate()
+                self.__views.append(self.__view(self.__buffers[-1]))
+                self.__states.append(FREE)
+            index = self.__states.index(FREE)
+            self.__states[index] = DECODING
+            return index, self.__pointers[index]
+
+    def unlock(self, index):
+        """
+        Marks the buffer as decoded, called by the vlc unlock callback
+
+        :param index: index of the buffer as returned by lock
+        :type index: int
+        """
+        with self.__lock:
+            if index in self.__retired:
+                # the frame was decoded for the previous configuration
+                self.__free(index)
+            elif index < len(self.__states) and self.__states[index] == DECODING:
+                self.__states[index] = DECODED
+
+    def display(self, index):
+        """
+        Marks the buffer as the latest displayable frame, called by the vlc display callback. A previous displayable
+        frame which was not taken is dropped.
+
+        :param index: index of the buffer as returned by lock
+        :type index: int
+        """
+        with self.__lock:
+            if index >= len(self.__states) or self.__states[index] != DECODED:
+                return
+            if self.__ready is not None:
+                self.__states[self.__ready] = FREE
+                self.dropped_frames += 1
+            self.__states[index] = READY
+            self.__ready = index
+
+    def take(self):
+        """
+        Takes the ownership of the latest displayable frame, vlc does not decode into it until it is released
+
+        :return: tuple (buffer index, BGRA frame of shape (height, width, 4)) or None if no new frame is displayable
+        """
+        with self.__lock:
+            index, self.__ready = self.__ready, None
+            if index is None:
+                return None
+            self.__states[index] = READING
+            return index, self.__views[index]
+
+    def release(self, index):
+        """
+        Hands a taken buffer back to the pool
+
+        :param index: index of the buffer as returned by take
+        :type index: int
+        """
+        with self.__lock:
+            if index in self.__retired:
+                self.__free(index)
+            elif index < len(self.__states) and self.__states[index] == READING:
+                self.__states[index] = FREE
+
+    def __allocate(self, index=None):
+        """
+        Allocates a buffer of the current capacity, it replaces the buffer of the given index or is appended if the
+        index is None
+        """
+        buffer = (ctypes.c_ubyte * self.__capacity)()
+        pointer = ctypes.cast(buffer, ctypes.c_void_p).value
+        if index is None:
+            self.__buffers.append(buffer)
+            self.__pointers.append(pointer)
+        else:
+            self.__buffers[index], self.__pointers[index] = buffer, pointer
+        self.allocations += 1
+
+    def __free(self, index):
+        """
+        Marks the buffer as free for the current frame size and reallocates it if the frames do not fit into it
+        """
+        self.__retired.discard(index)
+        if ctypes.sizeof(self.__buffers[index]) < self.__capacity:
+            self.__allocate(index)
+        self.__views[index] = self.__view(self.__buffers[index])
+        self.__states[index] = FREE
+
+    def __view(self, buffer):
+        """
+        Returns a BGRA NumPy view on the first frame sized part of the buffer, no data is copied
+        """
+        frame_size = self.width * self.height * 4
+        return np.frombuffer(buffer, dtype=np.uint8, count=frame_size).reshape(self.height, self.width, 4)
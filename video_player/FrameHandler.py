@@ -2,21 +2,39 @@
 This script contains a class to access the video callback of a vlc player and use the frames to perform
 face recognition and marking
 """
+import collections
 import ctypes
+import time
 
 import cv2
-import face_recognition as fr
 import numpy as np
 import vlc
 from PIL import Image, ImageTk
 
+from video_player.CadenceController import CadenceController
+from video_player.DetectionWorker import DetectionWorker
+from video_player.FaceDrawing import draw_face_rectangles
+from video_player.FrameBufferPool import FrameBufferPool
+from video_player.FaceTracker import FaceTracker
+from video_player.SceneGate import DETECT, REFRESH, REUSE
+
 CorrectVideoLockCb = ctypes.CFUNCTYPE(ctypes.c_void_p, ctypes.c_void_p, ctypes.POINTER(ctypes.c_void_p))
 
+# python-vlc passes the chroma to the format callback as a copied bytes object, hence it is declared as a pointer such
+# that the callback can write into it and the function setting the callback is declared accordingly
+CorrectVideoFormatCb = ctypes.CFUNCTYPE(ctypes.c_uint, ctypes.POINTER(ctypes.c_void_p), ctypes.c_void_p,
+                                        ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint),
+                                        ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint))
+libvlc_video_set_format_callbacks = ctypes.CFUNCTYPE(None, ctypes.c_void_p, CorrectVideoFormatCb, ctypes.c_void_p)(
+    ("libvlc_video_set_format_callbacks", vlc.dll))
+
 
 class FrameHandler:
 
     def __init__(self, vlc_player, label, is_detection_activated, encoding_manager, frames_to_skip,
-                 face_recognition_model):
+                 face_recognition_model, detection_max_size, number_of_times_to_upsample, detection_cpu_share=0.5,
+                 detection_cache=None, media_path=None, buffer_pool=None, pipeline_stats=None, detection_pool=None,
+                 scene_gate=None, face_detector=None, is_cache_only=False):
         """
         Constructor of the FrameHandler
 
@@ -28,17 +46,56 @@ class FrameHandler:
 
         :param is_detection_activated: a tkinter.BoolVar checking whether the face recognition is activated or not
 
-        :param encoding_manager: a unit managing available encodings
+        :param encoding_manager: a unit managing available encodings, None while the encodings are still loaded (see
+        set_encoding_manager)
         :type encoding_manager: video_player.EncodingManager.EncodingManager
 
-        :param frames_to_skip: Number of frames to skip, meaning if frames_to_skip=3 only every fourth frame is shown
+        :param frames_to_skip: Number of frames to skip, meaning if frames_to_skip=3 only every fourth frame is handed
+        over to the face detection, None to adapt the number to the measured detection time
         :type frames_to_skip: int
 
-        :param face_recognition_model: The model used for face recognition, either "cnn" which is accurate, slower and
-        used GPU or "hog" which is faster but not as precise
+        :param face_recognition_model: The face detector backend, either "cnn" which is accurate, slower and used GPU,
+        "hog" which is faster but not as precise, "haar" or "dnn" (OpenCV detectors, see video_player.FaceDetectors)
         :type face_recognition_model: str
+
+        :param detection_max_size: Maximal length of the longer image edge the face detection runs on, larger frames
+        are downscaled independently of the window size, None or 0 to detect on the full resolution
+        :type detection_max_size: int
+
+        :param number_of_times_to_upsample: How many times the detection image is upsampled to find smaller faces
+        :type number_of_times_to_upsample: int
+
+        :param detection_cpu_share: If frames_to_skip is None, the frames handed over to the face detection are chosen
+        such that the detection uses this share of the time between two frames
+        :type detection_cpu_share: float
+
+        :param detection_cache: cache of the detection results of previously analysed frames, None to always detect
+        :type detection_cache: video_player.DetectionCache.DetectionCache
+
+        :param media_path: path of the played media file, required to use the detection cache
+        :type media_path: str
+
+        :param buffer_pool: pool of the frame buffers vlc decodes into, reused across media files, None to create one
+        :type buffer_pool: video_player.FrameBufferPool.FrameBufferPool
+
+        :param pipeline_stats: collects the durations of the stages of the frame processing, None to not measure them
+        :type pipeline_stats: video_player.PipelineStats.PipelineStats
+
+        :param detection_pool: detection threads shared with other streams, None to run the detection on an own thread
+        :type detection_pool: video_player.DetectionPool.DetectionPool
+
+        :param scene_gate: decides whether a frame due for detection shows a changed scene, None to detect every due
+        frame
+        :type scene_gate: video_player.SceneGate.SceneGate
+
+        :param face_detector: an already created backend of face_recognition_model (e.g. prepared by the warm-up) the
+        face recognizer uses, None to create it with the face recognizer
+
+        :param is_cache_only: whether the faces are only taken from the detection cache, e.g. while a background
+        analysis fills it, such that the playback does not run the face detection
+        :type is_cache_only: bool
         """
-        self.__face_recognition_model = face_recognition_model
+        self.__stats = pipeline_stats
 
         self.vlc_player = vlc_player.get_player()
 
@@ -46,111 +103,451 @@ class FrameHandler:
         frame_name = label.winfo_parent()
         self.frame = label._nametowidget(frame_name)
 
-        self.width, self.height = vlc.libvlc_video_get_size(self.vlc_player, 0)
-
-        self.buffer_size = self.width * self.height * 4
-        self.buf = (ctypes.c_ubyte * self.buffer_size)()
-        self.buf_p = ctypes.cast(self.buf, ctypes.c_void_p)
+        # the media is parsed in the background, hence the size of the video is set by the format callback once vlc
+        # knows it, 0 until then
+        self.width, self.height = 0, 0
+        self.__target_size = self.frame.winfo_width(), self.frame.winfo_height()
+        """Size of the frame the video is shown in, updated on its <Configure> events by set_target_size"""
+
+        # vlc decodes into the buffers of the pool, the frames are read through BGRA views without copying, the frames
+        # of the previous media file are dropped
+        self.__buffer_pool = buffer_pool if buffer_pool is not None else FrameBufferPool()
+        self.__buffer_pool.configure(0, 0)
+
+        # buffers reused across frames, the display buffers are reallocated if the display size changes
+        self.__display_size = None
+        self.__display_bgra = None
+        """Resized frame the faces are drawn on"""
+        self.__display_rgbx = None
+        """Resized frame in the channel order of the displayed image"""
+        self.__display_image = None
+        """PIL image sharing the memory of __display_rgbx"""
+        self.__photo_image = None
+
+        self.displayed_frames = 0
+        """Number of frames presented in the label so far"""
+        self.__presentation_times = collections.deque(maxlen=120)
+        """Times of the latest presented frames to measure the display frame rate"""
+        self.frame_allocations = 0
+        """Number of frame sized buffers allocated by the display callback so far"""
+        self.last_frame_allocations = 0
+        """Number of frame sized buffers allocated while displaying the last frame"""
 
         self.enc_manager = encoding_manager
 
-        self.vlc_player.video_set_format("RV32", self.width, self.height, self.width * 4)
+        # the face stack (face_recognition, dlib) is only imported by the detection thread once it is needed, such
+        # that the playback does not wait for it
+        self.__recognizer = None
+        self.__face_recognition_model = face_recognition_model
+        self.__face_detector = face_detector
+
+        self.__detection_max_size = detection_max_size
+        self.__number_of_times_to_upsample = number_of_times_to_upsample
+        self.__detection_cache = detection_cache if media_path is not None else None
+        if self.__detection_cache is not None:
+            try:
+                self.__media_key = detection_cache.media_key(media_path)
+            except OSError as error:
+                # streams and URLs have no content to hash, their detections are not cached
+                vlc_player.get_logger().info(f"FrameHandler: Detections of {media_path} are not cached: {error}")
+                self.__detection_cache = None
+        self.__is_cache_only = is_cache_only and self.__detection_cache is not None
+        if self.__detection_cache is not None:
+            self.__detection_settings = detection_cache.settings_key(face_recognition_model, detection_max_size,
+                                                                     number_of_times_to_upsample)
 
         self.__lockcb = self.__lock()
+        self.__unlockcb = self.__unlock()
         self.__displaycb = self.__display()
+        self.__formatcb = self.__format()
 
-        vlc.libvlc_video_set_callbacks(self.vlc_player, self.__lockcb, None, self.__displaycb, None)
+        vlc.libvlc_video_set_callbacks(self.vlc_player, self.__lockcb, self.__unlockcb, self.__displaycb, None)
+        libvlc_video_set_format_callbacks(self.vlc_player, self.__formatcb, None)
 
         self.__is_detection_activated = is_detection_activated
 
-        # number of frame shown to allow skipping of certain ones
-        self.__frame_nr = 0
+        # decides which frames are handed over to the face detection
+        self.__cadence_controller = CadenceController(frames_to_skip, detection_cpu_share)
+
+        # faces are tracked on every frame, the detection only corrects the tracks and identifies new faces
+        self.__tracker = FaceTracker()
+
+        # frames of a static scene keep the tracked faces instead of being detected again
+        self.__scene_gate = scene_gate
+        if scene_gate is not None:
+            scene_gate.reset()
 
-        # how many frame are shown/skipped
-        self.__frame_to_show = frames_to_skip + 1
+        # face detection runs on its own thread (or on the threads shared by several streams), only the latest
+        # submitted frame is processed
+        self.__detection_cpu_share = detection_cpu_share
+        self.__detection_pool = detection_pool
+        if detection_pool is not None:
+            self.__detection_worker = detection_pool.register(self.__detect_and_track)
+        else:
+            self.__detection_worker = DetectionWorker(vlc_player.get_logger(), self.__detect_and_track)
 
-        # Face encodings/locations of last checked frame
-        self.__face_locations = []
-        self.__face_encodings = []
+        # the frames are rendered by the Tk main loop, vlc only marks them as displayable
+        self.__render_job = None
+        self.__render()
+
+    def __format(self):
+        """
+        Configures the frame buffers for the size of the video, vlc calls it before the first frame of the media file
+        is decoded and whenever the size changes. The frames are decoded as RV32 (BGRA) in their original size.
+        """
+        @CorrectVideoFormatCb
+        def _formatcb(opaque, chroma, width, height, pitches, lines):
+            ctypes.memmove(chroma, b"RV32", 4)
+            pitches[0], lines[0] = width[0] * 4, height[0]
+            self.__buffer_pool.configure(width[0], height[0])
+            self.width, self.height = width[0], height[0]
+            # number of picture buffers, 0 would indicate a failure
+            return 1
+
+        return _formatcb
 
     def __lock(self):
+        """
+        Hands a free buffer of the pool to vlc to decode the next frame into
+        """
         @CorrectVideoLockCb
         def _lockcb(opaque, planes):
-            planes[0] = self.buf_p
+            index, pointer = self.__buffer_pool.lock()
+            planes[0] = pointer
+            # the picture identifier passed to the unlock and display callbacks must not be NULL
+            return index + 1
 
         return _lockcb
 
+    def __unlock(self):
+        """
+        Marks the buffer vlc decoded into as complete
+        """
+        @vlc.CallbackDecorators.VideoUnlockCb
+        def _unlockcb(opaque, picture, planes):
+            self.__buffer_pool.unlock(picture - 1)
+
+        return _unlockcb
+
     def __display(self):
         """
-        Displays the processed frames received by the vlc media player
+        Marks the frames received by the vlc media player as displayable, they are rendered by the Tk main loop
         """
         @vlc.CallbackDecorators.VideoDisplayCb
         def _display(opaque, picture):
-            img = Image.frombuffer("RGBA", (self.width, self.height),
-                                   self.buf, "raw", "BGRA", 0, 1)
-            cv2_image = cv2.cvtColor(np.array(img), cv2.COLOR_BGRA2RGB)
-            cv2_image = cv2.resize(cv2_image, self.__get_resize_size())
+            self.__buffer_pool.display(picture - 1)
 
-            if self.__frame_nr % self.__frame_to_show == 0 or not self.__is_detection_activated.get():
-                if self.__is_detection_activated.get() and len(self.enc_manager.known_face_names):
-                    self.__face_locations, self.__face_encodings = self.__perform_face_detection(cv2_image)
-                    if len(self.__face_locations) > 0:
-                        cv2_image = self.__draw_face_rectangle(cv2_image)
+        return _display
 
-                cv2_image = cv2.cvtColor(np.array(cv2_image), cv2.COLOR_BGRA2RGB)
-                img = Image.fromarray(cv2_image)
-                ph = ImageTk.PhotoImage(img)
-                self.label.config(image=ph)
-                self.label.image = ph
+    def __render(self):
+        """
+        Renders the newest displayable frame, if there is one, and schedules itself on the Tk main loop twice per frame
+        interval. Frames which were superseded before they were rendered are dropped.
+        """
+        taken = self.__buffer_pool.take()
+        if taken is not None:
+            start = time.perf_counter()
+            index, frame_view = taken
+            try:
+                self.__display_frame(frame_view)
+            finally:
+                self.__buffer_pool.release(index)
+            self.__presentation_times.append(time.perf_counter())
+            if self.__stats is not None:
+                self.__stats.add("frame", self.__presentation_times[-1] - start)
+
+        fps = self.vlc_player.get_fps()
+        interval = int(500 / fps) if fps and fps > 0 else 20
+        self.__render_job = self.label.after(max(1, interval), self.__render)
+
+    def set_target_size(self, width, height):
+        """
+        Sets the size of the frame the video is shown in, called on its <Configure> events
 
-            self.__frame_nr += 1
+        :param width: width of the frame in pixels
+        :type width: int
+        :param height: height of the frame in pixels
+        :type height: int
+        """
+        self.__target_size = width, height
 
-        return _display
+    def __display_frame(self, frame_view):
+        """
+        Draws the tracked faces on the frame and shows it in the label
 
-    def __get_resize_size(self):
+        :param frame_view: BGRA view on the buffer the frame was decoded into, it must not be modified
+        :type frame_view: numpy.ndarray
         """
-        Get the resize size of the image such that it is centered in the root frame
+        stats = self.__stats
+        lap = stats.now() if stats is not None else 0
+        allocations = self.__prepare_display_buffers(self.__get_resize_size())
+        display_bgra = self.__display_bgra
+        cv2.resize(frame_view, self.__display_size, dst=display_bgra, interpolation=cv2.INTER_LINEAR)
+        if stats is not None:
+            lap = stats.lap("resize", lap)
+
+        if self.__is_detection_activated.get() and self.enc_manager is not None and \
+                len(self.enc_manager.known_face_names):
+            is_detection_due = self.__cadence_controller.is_detection_due()
+            decision = DETECT if is_detection_due else REUSE
+            if self.__scene_gate is not None:
+                decision = self.__scene_gate.decide(display_bgra, is_detection_due)
+                if stats is not None:
+                    lap = stats.lap("gating", lap)
+            if decision == REFRESH:
+                # the tracked faces belong to the previous shot
+                self.__tracker.reset()
+            detection_frame = None
+            if decision != REUSE:
+                time_ms = self.vlc_player.get_time()
+                cached = None
+                if self.__detection_cache is not None:
+                    # a cached frame needs neither the conversion nor the detection
+                    cached = self.__detection_cache.lookup(self.__media_key, self.__detection_settings, time_ms, 100)
+                    if stats is not None:
+                        lap = stats.lap("cache_lookup", lap)
+                if cached is not None:
+                    detection_frame = None, time_ms, cached
+                elif not self.__is_cache_only:
+                    # the full resolution frame is only converted for the detection, the worker keeps it, hence it
+                    # gets its own buffer
+                    allocations += 1
+                    detection_frame = cv2.cvtColor(frame_view, cv2.COLOR_BGRA2RGB), time_ms, None
+                    if stats is not None:
+                        lap = stats.lap("color_conversion", lap)
+            # the tracker downscales the frame before converting it to grayscale
+            self.__tracker.track(frame_view)
+            if detection_frame is not None:
+                # the motion of the tracks from this frame on is applied to the faces detected on it
+                self.__detection_worker.submit((*detection_frame, self.__tracker.mark()))
+            faces = self.__tracker.get_faces()
+            if stats is not None:
+                lap = stats.lap("tracking", lap)
+            if faces:
+                faces = self.__scale_faces(faces, self.__display_size)
+                draw_face_rectangles(display_bgra, faces)
+                if stats is not None:
+                    lap = stats.lap("drawing", lap)
+        else:
+            self.__tracker.reset()
+            if self.__scene_gate is not None:
+                # the first frame after the activation is detected
+                self.__scene_gate.reset()
+
+        # __display_image shares the memory of __display_rgbx, Tk copies it into the photo image
+        cv2.cvtColor(display_bgra, cv2.COLOR_BGRA2RGBA, dst=self.__display_rgbx)
+        self.__photo_image.paste(self.__display_image)
+        if stats is not None:
+            stats.lap("presentation", lap)
+
+        self.displayed_frames += 1
+        self.frame_allocations += allocations
+        self.last_frame_allocations = allocations
+
+    def __prepare_display_buffers(self, display_size):
         """
-        frame_width = self.frame.winfo_width()
-        frame_height = self.frame.winfo_height()
-        scale = min(frame_width / self.width, frame_height / self.height)
-        return int(self.width * scale), int(self.height * scale)
+        Allocates the display buffers and the photo image shown by the label if the display size changed
+
+        :param display_size: width and height of the displayed image
+        :type display_size: tuple
+        :return: number of allocated frame sized buffers
+        """
+        display_size = max(1, display_size[0]), max(1, display_size[1])
+        if display_size == self.__display_size:
+            return 0
+        width, height = display_size
+        self.__display_size = display_size
+        self.__display_bgra = np.empty((height, width, 4), dtype=np.uint8)
+        self.__display_rgbx = np.zeros((height, width, 4), dtype=np.uint8)
+        self.__display_image = Image.frombuffer("RGBX", display_size, self.__display_rgbx, "raw", "RGBX", 0, 1)
+        self.__photo_image = ImageTk.PhotoImage(self.__display_image)
+        self.label.config(image=self.__photo_image)
+        self.label.image = self.__photo_image
+        return 2
+
+    def get_allocation_stats(self):
+        """
+        Returns the number of frame sized buffers the display callback allocated, to catch regressions of the frame
+        path which reuses its buffers across frames
+
+        :return: dictionary with the keys displayed_frames, frame_allocations, allocations_per_frame and
+        last_frame_allocations
+        """
+        return {"displayed_frames": self.displayed_frames, "frame_allocations": self.frame_allocations,
+                "allocations_per_frame": self.frame_allocations / max(1, self.displayed_frames),
+                "last_frame_allocations": self.last_frame_allocations}
+
+    def get_render_stats(self):
+        """
+        Returns the numbers of presented and dropped frames and the display frame rate over the latest presented frames
+
+        :return: dictionary with the keys presented_frames, dropped_frames and display_fps
+        """
+        times = self.__presentation_times
+        display_fps = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else 0.0
+        return {"presented_frames": self.displayed_frames, "dropped_frames": self.__buffer_pool.dropped_frames,
+                "display_fps": display_fps}
 
-    def __perform_face_detection(self, img):
+    def set_face_detector(self, face_recognition_model, face_detector=None):
+        """
+        Switches the face detector backend while the video is playing, the tracked faces are kept
+
+        :param face_recognition_model: name of the backend, one of video_player.FaceDetectors.DETECTOR_NAMES
+        :type face_recognition_model: str
+        :param face_detector: an already created backend of face_recognition_model, None to create it
+        """
+        if self.__recognizer is not None:
+            self.__recognizer.set_detector(face_recognition_model, face_detector)
+        self.__face_recognition_model = face_recognition_model
+        self.__face_detector = face_detector
+        if self.__detection_cache is not None:
+            self.__detection_settings = self.__detection_cache.settings_key(
+                face_recognition_model, self.__detection_max_size, self.__number_of_times_to_upsample)
+
+    def set_encoding_manager(self, encoding_manager):
+        """
+        Sets the encoding manager once the known encodings were loaded in the background
+
+        :param encoding_manager: a unit managing available encodings
+        :type encoding_manager: video_player.EncodingManager.EncodingManager
         """
-        Detects face locators in the input img and uses the discovered face locators (potentially for multiple faces)
-        an calculates the face encodings
+        self.enc_manager = encoding_manager
+        if self.__recognizer is not None:
+            self.__recognizer.enc_manager = encoding_manager
 
-        :param img: image to perform face recognition on
+    def get_detection_cadence(self):
+        """
+        Returns the current number of frames between two frames handed over to the face detection
         """
-        face_locations = fr.face_locations(img, model=self.__face_recognition_model, number_of_times_to_upsample=1)
-        face_encodings = fr.face_encodings(img, face_locations)
+        return self.__cadence_controller.cadence
 
-        return face_locations, face_encodings
+    def release(self):
+        """
+        Stops the rendering and the face detection thread of the frame handler and writes the cached detections to
+        disk
+        """
+        if self.__render_job is not None:
+            self.label.after_cancel(self.__render_job)
+            self.__render_job = None
+        self.__detection_worker.stop()
+        if self.__detection_cache is not None:
+            self.__detection_cache.commit()
+
+    def __detect_and_track(self, frame):
+        """
+        Detects the faces in the frame and associates them with the tracked faces, only faces which are not tracked yet
+        or are due for re-verification are encoded and identified. It is called by the detection worker thread.
 
-    def __draw_face_rectangle(self, img):
+        :param frame: tuple (RGB video frame or None if cached, playback time in milliseconds, cached detection or None,
+        tracker mark of the frame) to perform face detection on
+        :type frame: tuple
         """
-        Draws on the input image around the discovered faces a red box with a label on the bottom
+        start = time.perf_counter()
+        img, time_ms, cached, mark = frame
+        recognizer = self.__get_recognizer()
+        if self.__detection_cache is None:
+            face_locations = self.__timed("face_locations", recognizer.locate, img)
+            self.__tracker.associate(face_locations, lambda locations: self.__timed(
+                "matching", recognizer.identify,
+                self.__timed("face_encodings", recognizer.encode, img, locations)), mark)
+        else:
+            face_locations, identities = self.__detect_cached(img, time_ms, cached)
+            identity_by_location = dict(zip(face_locations, identities))
+            self.__tracker.associate(face_locations,
+                                     lambda locations: [identity_by_location[location] for location in locations], mark)
+        self.__cadence_controller.set_fps(self.vlc_player.get_fps())
+        if self.__detection_pool is not None:
+            # the more streams share the pool, the less often each of them is detected
+            self.__cadence_controller.set_detection_cpu_share(
+                self.__detection_pool.get_detection_cpu_share(self.__detection_cpu_share))
+        detection_time = time.perf_counter() - start
+        self.__cadence_controller.add_detection_time(detection_time)
+        if self.__stats is not None:
+            self.__stats.add("detection", detection_time)
+
+    def __get_recognizer(self):
         """
-        for (top, right, bottom, left), face_encoding in zip(self.__face_locations, self.__face_encodings):
-            # See if the face is a match for the known face(s)
-            matches = fr.compare_faces(self.enc_manager.known_face_encodings, face_encoding)
+        Returns the face recognizer, it is created on the first detection pass to keep the face stack out of the
+        playback start. It is called by the detection worker thread.
 
-            name = "unknown"
+        :rtype: video_player.FaceRecognizer.FaceRecognizer
+        """
+        if self.__recognizer is None:
+            from video_player.FaceRecognizer import FaceRecognizer
 
-            # Use known face with the smallest distance to the new face
-            face_distances = fr.face_distance(self.enc_manager.known_face_encodings, face_encoding)
-            best_match_index = np.argmin(face_distances)
-            if matches[best_match_index]:
-                name = self.enc_manager.known_face_names[best_match_index]
+            self.__recognizer = FaceRecognizer(self.enc_manager, self.__face_recognition_model,
+                                               self.__detection_max_size, self.__number_of_times_to_upsample,
+                                               detector=self.__face_detector)
+        return self.__recognizer
 
-            # Draw a box around the face
-            img = cv2.rectangle(img, (left, top), (right, bottom), (0, 0, 255), 2)
+    def __timed(self, stage, function, *args):
+        """
+        Calls the function with the arguments and adds its duration to the stage of the pipeline stats, if enabled
 
-            # Draw a label with a name below the face
-            (text_width, text_height), baseline = cv2.getTextSize(name, cv2.FONT_HERSHEY_PLAIN, 1, 2)
-            img = cv2.rectangle(img, (left, bottom - text_height), (right, bottom), (0, 0, 255), -1)
-            img = cv2.putText(img, name, (left + 6, bottom), cv2.FONT_HERSHEY_PLAIN, 1,
-                              (255, 255, 255), 2)
+        :param stage: name of the stage
+        :type stage: str
+        :return: the result of the function
+        """
+        if self.__stats is None:
+            return function(*args)
+        start = self.__stats.now()
+        result = function(*args)
+        self.__stats.lap(stage, start)
+        return result
+
+    def __detect_cached(self, img, time_ms, cached):
+        """
+        Returns the faces of the frame from the detection cache, the cached encodings are matched again if the known
+        encodings changed since. On a cache miss all faces are detected, encoded and identified and the result is
+        cached.
+
+        :param img: RGB video frame to perform face detection on, None if the frame was found in the cache
+        :type img: numpy.ndarray
+        :param time_ms: playback time of the frame in milliseconds
+        :type time_ms: int
+        :param cached: the cached detection of the frame as returned by DetectionCache.lookup, None on a cache miss
+        :type cached: tuple
+        :return: tuple (face locations, list of tuples (name, distance))
+        """
+        recognizer = self.__get_recognizer()
+        # the key is read before the matching, such that identities matched against a gallery reloaded in between are
+        # matched again on the next lookup
+        gallery_key = self.enc_manager.gallery_key
+        if cached is not None:
+            cached_time_ms, face_locations, face_encodings, identities, cached_gallery_key = cached
+            if cached_gallery_key != gallery_key:
+                identities = self.__timed("matching", recognizer.identify, face_encodings)
+                self.__detection_cache.store(self.__media_key, self.__detection_settings, cached_time_ms,
+                                             face_locations, face_encodings, identities, gallery_key)
+            return face_locations, identities
+
+        face_locations = self.__timed("face_locations", recognizer.locate, img)
+        face_encodings = self.__timed("face_encodings", recognizer.encode, img, face_locations)
+        identities = self.__timed("matching", recognizer.identify, face_encodings)
+        self.__detection_cache.store(self.__media_key, self.__detection_settings, time_ms, face_locations,
+                                     face_encodings, identities, gallery_key)
+        return face_locations, identities
+
+    def __scale_faces(self, faces, display_size):
+        """
+        Maps the face locations from the coordinates of the video frame to the displayed image
 
-        return img
+        :param faces: list of tuples (face location, name, distance) in video frame coordinates
+        :param display_size: width and height of the displayed image
+        :type display_size: tuple
+        """
+        scale_x = display_size[0] / self.width
+        scale_y = display_size[1] / self.height
+        return [((int(top * scale_y), int(right * scale_x), int(bottom * scale_y), int(left * scale_x)), name, distance)
+                for (top, right, bottom, left), name, distance in faces]
+
+    def __get_resize_size(self):
+        """
+        Get the resize size of the image such that it is centered in the root frame, (1, 1) while the size of the
+        video is not known
+        """
+        if self.width <= 0 or self.height <= 0:
+            return 1, 1
+        frame_width, frame_height = self.__target_size
+        scale = min(frame_width / self.width, frame_height / self.height)
+        return int(self.width * scale), int(self.height * scale)
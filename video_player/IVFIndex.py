@@ -0,0 +1,164 @@
+"""
+A script containing an inverted file index (IVF) to search large numbers of face encodings approximately
+"""
+import numpy as np
+
+
+class IVFIndex:
+
+    def __init__(self, n_probe=8, n_lists=None):
+        """
+        Constructor of the IVFIndex
+
+        Partitions the face encodings with k-means into lists around centroids. A search only compares a query
+        against the encodings in the n_probe lists with the closest centroids instead of against all encodings.
+
+        :param n_probe: number of lists searched per query, higher values increase recall but slow down the search
+        :type n_probe: int
+
+        :param n_lists: number of k-means partitions, None to use the square root of the number of encodings
+        :type n_lists: int
+        """
+        self.n_probe = n_probe
+        self.__n_lists = n_lists
+
+        self.centroids = None
+        """Matrix of the k-means centroids of shape (n_lists, 128)"""
+        self.__members = []
+        """For each list the indices of the encodings assigned to it"""
+        self.__member_arrays = []
+        """Cached numpy version of self.__members, None where a list changed since the last search"""
+        self.names = []
+        """Names of the indexed encodings, used to check if a persisted index matches the encodings"""
+
+    def __len__(self):
+        """
+        Returns the number of indexed encodings
+        """
+        return len(self.names)
+
+    def build(self, encodings, names, iterations=10, max_training_size=50_000):
+        """
+        Runs k-means on (a sample of) the encodings and assigns all encodings to their closest centroid
+
+        :param encodings: matrix of shape (N, 128) of the encodings to index
+        :type encodings: numpy.ndarray
+        :param names: names of the encodings
+        :type names: list
+        :param iterations: number of k-means iterations
+        :type iterations: int
+        :param max_training_size: maximal number of encodings used to train the centroids
+        :type max_training_size: int
+        """
+        n_lists = self.__n_lists or max(1, int(np.sqrt(len(encodings))))
+        n_lists = min(n_lists, len(encodings))
+
+        rng = np.random.default_rng(0)
+        training = encodings
+        if len(encodings) > max_training_size:
+            training = encodings[rng.choice(len(encodings), max_training_size, replace=False)]
+
+        centroids = training[rng.choice(len(training), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = self.__closest_centroids(training, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, training)
+            counts = np.bincount(assignments, minlength=n_lists)
+            # keep the previous centroid for empty clusters
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+        self.centroids = centroids
+
+        assignments = self.__closest_centroids(encodings, centroids)
+        self.__members = [[] for _ in range(n_lists)]
+        for index, list_nr in enumerate(assignments.tolist()):
+            self.__members[list_nr].append(index)
+        self.__member_arrays = [None] * n_lists
+        self.names = list(names)
+
+    def add(self, encoding, name):
+        """
+        Inserts an encoding into the list of its closest centroid, the encoding gets the next free index
+
+        :param encoding: the face encoding of length 128
+        :param name: name of the person the encoding belongs to
+        :type name: str
+        """
+        self.add_batch(np.asarray(encoding, dtype=np.float32)[np.newaxis], [name])
+
+    def add_batch(self, encodings, names):
+        """
+        Inserts several encodings into the lists of their closest centroids with one distance computation, the
+        encodings get the next free indices in their order
+
+        :param encodings: matrix of shape (N, 128) of the encodings to insert
+        :type encodings: numpy.ndarray
+        :param names: names of the persons the encodings belong to
+        :type names: list
+        """
+        assignments = self.__closest_centroids(np.asarray(encodings, dtype=np.float32), self.centroids)
+        for list_nr, name in zip(assignments.tolist(), names):
+            self.__members[list_nr].append(len(self.names))
+            self.__member_arrays[list_nr] = None
+            self.names.append(name)
+
+    def candidates(self, query):
+        """
+        Returns the indices of the encodings in the n_probe lists closest to the query
+
+        :param query: the face encoding of length 128 to search for
+        :rtype: numpy.ndarray
+        """
+        centroid_distances = np.sum((self.centroids - query) ** 2, axis=1)
+        n_probe = min(self.n_probe, len(self.centroids))
+        probed = np.argpartition(centroid_distances, n_probe - 1)[:n_probe]
+        arrays = []
+        for list_nr in probed:
+            if self.__member_arrays[list_nr] is None:
+                self.__member_arrays[list_nr] = np.array(self.__members[list_nr], dtype=np.int64)
+            arrays.append(self.__member_arrays[list_nr])
+        return np.concatenate(arrays)
+
+    def save(self, path):
+        """
+        Persists the index into a .npz file
+
+        :param path: the file to write to
+        :type path: str
+        """
+        assignments = np.empty(len(self.names), dtype=np.int32)
+        for list_nr, members in enumerate(self.__members):
+            assignments[members] = list_nr
+        np.savez(path, centroids=self.centroids, assignments=assignments, names=np.array(self.names, dtype=str),
+                 n_probe=self.n_probe)
+
+    @staticmethod
+    def load(path):
+        """
+        Loads an index persisted with IVFIndex.save
+
+        :param path: the .npz file to read from
+        :type path: str
+        :rtype: IVFIndex
+        """
+        with np.load(path) as data:
+            index = IVFIndex(n_probe=int(data["n_probe"]), n_lists=len(data["centroids"]))
+            index.centroids = data["centroids"]
+            index.__members = [[] for _ in range(len(index.centroids))]
+            for encoding_nr, list_nr in enumerate(data["assignments"].tolist()):
+                index.__members[list_nr].append(encoding_nr)
+            index.__member_arrays = [None] * len(index.centroids)
+            index.names = data["names"].tolist()
+        return index
+
+    @staticmethod
+    def __closest_centroids(encodings, centroids):
+        """
+        Returns for each encoding the index of its closest centroid
+
+        :param encodings: matrix of shape (N, 128)
+        :param centroids: matrix of shape (L, 128)
+        """
+        # the squared norm of the encodings is equal for all centroids and can be left out
+        distances = np.sum(centroids ** 2, axis=1)[np.newaxis, :] - 2 * (encodings @ centroids.T)
+        return np.argmin(distances, axis=1)
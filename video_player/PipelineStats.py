@@ -0,0 +1,171 @@
+"""
+This script contains a class collecting the durations of the stages of the video pipeline into rolling percentiles
+and throughput counters, which can be dumped to a file in the Prometheus text format or as JSON
+"""
+import collections
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class PipelineStats:
+
+    def __init__(self, window_size=1000):
+        """
+        Constructor of the PipelineStats
+
+        Stores the latest window_size durations of each stage, the percentiles are only calculated when the stats are
+        read. Code which is instrumented optionally holds None instead of a PipelineStats, such that disabled stats
+        cost nothing.
+
+        :param window_size: number of latest durations per stage the percentiles are calculated from
+        :type window_size: int
+        """
+        self.__window_size = window_size
+        self.__lock = threading.Lock()
+        """The stages are measured on the Tk main loop and the detection thread"""
+        self.__durations = {}
+        self.__counts = {}
+        self.__sums = {}
+        self.__start = time.perf_counter()
+
+        self.__dump_thread = None
+        self.__stop_event = threading.Event()
+
+    @staticmethod
+    def now():
+        """
+        Returns the current time of the clock the stages are measured with
+        """
+        return time.perf_counter()
+
+    def lap(self, stage, start):
+        """
+        Adds the duration from start until now to the stage
+
+        :param stage: name of the stage
+        :type stage: str
+        :param start: start of the stage as returned by now or a previous lap
+        :type start: float
+        :return: the current time, to be used as start of the next stage
+        """
+        end = time.perf_counter()
+        self.add(stage, end - start)
+        return end
+
+    def add(self, stage, seconds):
+        """
+        Adds a measured duration of the stage
+
+        :param stage: name of the stage
+        :type stage: str
+        :param seconds: duration of the stage
+        :type seconds: float
+        """
+        with self.__lock:
+            durations = self.__durations.get(stage)
+            if durations is None:
+                durations = self.__durations[stage] = collections.deque(maxlen=self.__window_size)
+                self.__counts[stage], self.__sums[stage] = 0, 0.0
+            durations.append(seconds)
+            self.__counts[stage] += 1
+            self.__sums[stage] += seconds
+
+    def snapshot(self):
+        """
+        Returns the current stats of all stages
+
+        :return: dictionary from stage name to a dictionary with the keys count, sum, per_second and the quantiles
+        p50, p95 and p99 in seconds
+        """
+        with self.__lock:
+            stages = {stage: (np.array(durations), self.__counts[stage], self.__sums[stage])
+                      for stage, durations in self.__durations.items()}
+        elapsed = max(time.perf_counter() - self.__start, 1e-9)
+
+        snapshot = {}
+        for stage, (durations, count, total) in sorted(stages.items()):
+            quantiles = np.quantile(durations, QUANTILES)
+            snapshot[stage] = {"count": count, "sum": total, "per_second": count / elapsed}
+            for quantile, value in zip(QUANTILES, quantiles):
+                snapshot[stage][f"p{int(quantile * 100)}"] = float(value)
+        return snapshot
+
+    def to_prometheus(self):
+        """
+        Returns the current stats in the Prometheus text exposition format
+
+        :rtype: str
+        """
+        snapshot = self.snapshot()
+        lines = ["# HELP video_player_stage_seconds Duration of the stages of the video pipeline",
+                 "# TYPE video_player_stage_seconds summary"]
+        for stage, stats in snapshot.items():
+            for quantile in QUANTILES:
+                lines.append(f'video_player_stage_seconds{{stage="{stage}",quantile="{quantile}"}} '
+                             f'{stats[f"p{int(quantile * 100)}"]:.9f}')
+            lines.append(f'video_player_stage_seconds_sum{{stage="{stage}"}} {stats["sum"]:.9f}')
+            lines.append(f'video_player_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines += ["# HELP video_player_stage_per_second Average number of passes of the stages per second",
+                  "# TYPE video_player_stage_per_second gauge"]
+        for stage, stats in snapshot.items():
+            lines.append(f'video_player_stage_per_second{{stage="{stage}"}} {stats["per_second"]:.3f}')
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        """
+        Returns the current stats as JSON
+
+        :rtype: str
+        """
+        return json.dumps(self.snapshot(), indent=2)
+
+    def dump(self, path, output_format="prometheus"):
+        """
+        Writes the current stats into the file, the file is replaced atomically such that readers never see a
+        partially written file
+
+        :param path: path of the file
+        :type path: str
+        :param output_format: either "prometheus" or "json"
+        :type output_format: str
+        """
+        text = self.to_json() if output_format == "json" else self.to_prometheus()
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as stats_file:
+            stats_file.write(text)
+        os.replace(temporary_path, path)
+
+    def start_dumping(self, path, interval=5.0, output_format="prometheus"):
+        """
+        Starts a thread writing the stats into the file every interval seconds
+
+        :param path: path of the file
+        :type path: str
+        :param interval: seconds between two dumps
+        :type interval: float
+        :param output_format: either "prometheus" or "json"
+        :type output_format: str
+        """
+        def _dump_periodically():
+            while not self.__stop_event.wait(interval):
+                self.dump(path, output_format)
+            self.dump(path, output_format)
+
+        self.__stop_event.clear()
+        self.__dump_thread = threading.Thread(target=_dump_periodically, daemon=True)
+        self.__dump_thread.start()
+
+    def stop_dumping(self):
+        """
+        Stops the dumping thread after a final dump
+        """
+        if self.__dump_thread is not None:
+            self.__stop_event.set()
+            self.__dump_thread.join()
+            self.__dump_thread = None
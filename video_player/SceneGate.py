@@ -0,0 +1,138 @@
+"""
+This script contains a class deciding whether a frame has to be handed over to the face detection at all. Frames of a
+static scene reuse the tracked faces, hard cuts force a new detection. The decision is based on a downsampled
+grayscale copy of the frame such that it costs a fraction of a millisecond.
+"""
+import cv2
+import numpy as np
+
+REUSE = "reuse"
+"""The scene did not change since the last detection, the tracked faces are kept"""
+DETECT = "detect"
+"""The scene changed since the last detection, the frame is handed over to the face detection"""
+REFRESH = "refresh"
+"""A hard cut, the tracked faces are dropped and the frame is detected immediately"""
+
+
+class SceneGate:
+
+    def __init__(self, roi=None, masks=(), size=(80, 45), pixel_threshold=20, motion_threshold=0.01,
+                 cut_threshold=0.4, max_reused_frames=250):
+        """
+        Constructor of the SceneGate
+
+        Compares each frame with the frame of the last detection (motion) and with the previous frame (hard cut). The
+        regions are given as fractions (x, y, width, height) of the frame, such that they do not depend on the
+        resolution of the video or the window.
+
+        :param roi: region of interest the comparison is restricted to, None for the whole frame
+        :type roi: tuple
+        :param masks: regions excluded from the comparison, e.g. news tickers, logos or timestamps of camera feeds
+        :type masks: list
+        :param size: width and height of the grayscale image the frames are compared on
+        :type size: tuple
+        :param pixel_threshold: minimal gray value difference of a pixel to count as changed
+        :type pixel_threshold: int
+        :param motion_threshold: share of changed pixels from which on the scene is detected again
+        :type motion_threshold: float
+        :param cut_threshold: Bhattacharyya distance between the histograms of two consecutive frames from which on
+        they are separated by a hard cut
+        :type cut_threshold: float
+        :param max_reused_frames: number of frames after which the scene is detected again even if it did not change,
+        such that slowly appearing faces are found
+        :type max_reused_frames: int
+        """
+        self.__size = size
+        self.__pixel_threshold = pixel_threshold
+        self.__motion_threshold = motion_threshold
+        self.__cut_threshold = cut_threshold
+        self.__max_reused_frames = max_reused_frames
+
+        width, height = size
+        mask = np.zeros((height, width), dtype=np.uint8)
+        x, y, roi_width, roi_height = roi if roi is not None else (0, 0, 1, 1)
+        mask[self.__rows(y, roi_height), self.__columns(x, roi_width)] = 255
+        for x, y, mask_width, mask_height in masks:
+            mask[self.__rows(y, mask_height), self.__columns(x, mask_width)] = 0
+        self.__mask = mask
+        """Pixels of the downsampled frame which are compared, 255 for compared pixels"""
+        self.__compared_pixels = max(1, cv2.countNonZero(mask))
+
+        self.__gray = np.empty((height, width), dtype=np.uint8)
+        self.__difference = np.empty((height, width), dtype=np.uint8)
+        self.__reference = None
+        """Downsampled frame of the last detection"""
+        self.__previous_histogram = None
+        self.__reused_frames = 0
+
+        self.decisions = {REUSE: 0, DETECT: 0, REFRESH: 0}
+        """Number of frames per decision"""
+
+    def reset(self):
+        """
+        Forgets the compared frames, e.g. when a new media file is opened, such that the next frame is detected
+        """
+        self.__reference = None
+        self.__previous_histogram = None
+        self.__reused_frames = 0
+
+    def decide(self, frame, is_detection_due):
+        """
+        Compares the frame with the last detected and the previous frame
+
+        :param frame: BGRA or BGR frame, e.g. the resized frame of the display
+        :type frame: numpy.ndarray
+        :param is_detection_due: whether the cadence of the detection allows a detection of the frame
+        :type is_detection_due: bool
+        :return: one of REUSE, DETECT or REFRESH
+        :rtype: str
+        """
+        small = cv2.resize(frame, self.__size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGRA2GRAY if small.shape[2] == 4 else cv2.COLOR_BGR2GRAY,
+                            dst=self.__gray)
+        # smoothing suppresses sensor noise and compression artefacts
+        cv2.GaussianBlur(gray, (3, 3), 0, dst=gray)
+
+        histogram = cv2.calcHist([gray], [0], self.__mask, [32], [0, 256])
+        cv2.normalize(histogram, histogram, 1, 0, cv2.NORM_L1)
+        is_cut = self.__previous_histogram is not None and cv2.compareHist(
+            self.__previous_histogram, histogram, cv2.HISTCMP_BHATTACHARYYA) > self.__cut_threshold
+        self.__previous_histogram = histogram
+
+        if self.__reference is None or is_cut:
+            decision = REFRESH
+        elif not is_detection_due:
+            decision = REUSE
+        elif self.__reused_frames >= self.__max_reused_frames or self.__motion() > self.__motion_threshold:
+            decision = DETECT
+        else:
+            decision = REUSE
+
+        if decision == REUSE:
+            self.__reused_frames += 1
+        else:
+            self.__reference = gray.copy()
+            self.__reused_frames = 0
+        self.decisions[decision] += 1
+        return decision
+
+    def __motion(self):
+        """
+        Returns the share of the compared pixels which changed between the reference and the current frame
+        """
+        cv2.absdiff(self.__gray, self.__reference, dst=self.__difference)
+        cv2.threshold(self.__difference, self.__pixel_threshold, 255, cv2.THRESH_BINARY, dst=self.__difference)
+        cv2.bitwise_and(self.__difference, self.__mask, dst=self.__difference)
+        return cv2.countNonZero(self.__difference) / self.__compared_pixels
+
+    def __rows(self, y, height):
+        """
+        Returns the slice of the rows of the downsampled frame covering the fractions y to y + height
+        """
+        return slice(int(round(y * self.__size[1])), int(round((y + height) * self.__size[1])))
+
+    def __columns(self, x, width):
+        """
+        Returns the slice of the columns of the downsampled frame covering the fractions x to x + width
+        """
+        return slice(int(round(x * self.__size[0])), int(round((x + width) * self.__size[0])))
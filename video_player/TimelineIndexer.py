@@ -0,0 +1,250 @@
+"""
+This script contains classes to analyse a video file ahead of the playhead in a background process. The results are
+written into the detection cache, such that the playback renders the faces without inline detection, and collected
+into a per person timeline of appearances.
+"""
+import bisect
+import logging
+import multiprocessing
+import queue
+
+import cv2
+
+from video_player.DetectionCache import DetectionCache
+from video_player.EncodingManager import EncodingManager, migrate_pickles
+
+
+class FaceTimeline:
+
+    def __init__(self, max_gap_ms):
+        """
+        Constructor of the FaceTimeline
+
+        Collects the times each person was seen at and merges them into segments of appearance
+
+        :param max_gap_ms: maximal time between two sightings of a person to belong to the same segment
+        :type max_gap_ms: int
+        """
+        self.__max_gap_ms = max_gap_ms
+        self.__times = {}
+        """Sorted list of the times in milliseconds each person was seen at"""
+
+    def add(self, time_ms, names):
+        """
+        Adds the persons seen in the frame at time_ms, unknown faces are ignored
+
+        :param time_ms: playback time of the frame in milliseconds
+        :type time_ms: int
+        :param names: names of the faces in the frame
+        :type names: list
+        """
+        for name in set(names):
+            if name != "unknown":
+                bisect.insort(self.__times.setdefault(name, []), time_ms)
+
+    def get_names(self):
+        """
+        Returns the sorted names of all persons seen so far
+        """
+        return sorted(self.__times)
+
+    def get_segments(self, name):
+        """
+        Returns the segments in which the person appears
+
+        :param name: name of the person
+        :type name: str
+        :return: list of tuples (start, end) in milliseconds
+        """
+        segments = []
+        for time_ms in self.__times.get(name, []):
+            if segments and time_ms - segments[-1][1] <= self.__max_gap_ms:
+                segments[-1][1] = time_ms
+            else:
+                segments.append([time_ms, time_ms])
+        return [tuple(segment) for segment in segments]
+
+
+def index_video(source, settings, start_ms, step_ms, results, playheads, stop_event):
+    """
+    Analyses every step_ms milliseconds of the video file starting at start_ms, wraps around at the end until the
+    whole video was analysed. Frames which are already in the detection cache are not decoded again.
+
+    :param source: path to the video file
+    :type source: str
+    :param settings: dictionary with the keys encodings_path, cache_path, face_recognition_model, detection_max_size
+    and number_of_times_to_upsample
+    :type settings: dict
+    :param start_ms: playback time to start at
+    :type start_ms: int
+    :param step_ms: time between two analysed frames
+    :type step_ms: int
+    :param results: queue the tuples (time of the decoded frame in milliseconds, names) of the analysed frames are put
+    into
+    :type results: multiprocessing.Queue
+    :param playheads: queue of playback times, the analysis jumps to a playhead which is ahead of it
+    :type playheads: multiprocessing.Queue
+    :param stop_event: event to stop the analysis
+    :type stop_event: multiprocessing.Event
+    """
+    # the face stack is only imported by the analysis process, not by the GUI importing this module
+    from video_player.FaceRecognizer import FaceRecognizer
+
+    logger = logging.getLogger()
+    enc_manager = EncodingManager(logger, settings["encodings_path"], migrate_pickles=False)
+    recognizer = FaceRecognizer(enc_manager, settings["face_recognition_model"], settings["detection_max_size"],
+                                settings["number_of_times_to_upsample"])
+    cache = DetectionCache(logger, settings["cache_path"], commit_interval=10)
+    media_key = DetectionCache.media_key(source)
+    cache_settings = DetectionCache.settings_key(settings["face_recognition_model"], settings["detection_max_size"],
+                                                 settings["number_of_times_to_upsample"])
+
+    capture = cv2.VideoCapture(source)
+    frame_count, fps = capture.get(cv2.CAP_PROP_FRAME_COUNT), capture.get(cv2.CAP_PROP_FPS) or 25
+    duration_ms = int(frame_count / fps * 1000)
+    times = list(range(0, duration_ms, step_ms))
+    position = bisect.bisect_left(times, start_ms)
+    remaining = len(times)
+    done = [False] * len(times)
+
+    while remaining > 0 and not stop_event.is_set():
+        # jump to the latest playhead if it is ahead of the analysis
+        try:
+            while True:
+                playhead = bisect.bisect_left(times, playheads.get_nowait())
+                if playhead > position:
+                    position = playhead
+        except queue.Empty:
+            pass
+
+        position = position % len(times)
+        if done[position]:
+            position += 1
+            continue
+        time_ms = times[position]
+        done[position] = True
+        remaining -= 1
+        position += 1
+
+        cached = cache.lookup(media_key, cache_settings, time_ms, tolerance_ms=step_ms // 2)
+        if cached is not None:
+            results.put((cached[0], [name for name, _ in cached[3]]))
+            continue
+
+        # seeking is expensive, close frames are reached by decoding forward
+        current_ms = capture.get(cv2.CAP_PROP_POS_MSEC)
+        if not 0 <= time_ms - current_ms <= 2000:
+            capture.set(cv2.CAP_PROP_POS_MSEC, time_ms)
+        while capture.get(cv2.CAP_PROP_POS_MSEC) < time_ms - 1000 / fps:
+            if not capture.grab():
+                break
+        success, frame = capture.read()
+        if not success:
+            continue
+        # seeking is not frame accurate, the results belong to the time of the decoded frame
+        decoded_ms = int(capture.get(cv2.CAP_PROP_POS_MSEC))
+
+        face_locations, face_encodings = recognizer.detect(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        gallery_key = enc_manager.gallery_key
+        identities = recognizer.identify(face_encodings)
+        cache.store(media_key, cache_settings, decoded_ms, face_locations, face_encodings, identities, gallery_key)
+        results.put((decoded_ms, [name for name, _ in identities]))
+
+    capture.release()
+    cache.close()
+
+
+class TimelineIndexer:
+
+    def __init__(self, source, logger, detection_cache, encodings_path=None, face_recognition_model="hog",
+                 detection_max_size=640, number_of_times_to_upsample=1, start_ms=0, step_ms=200):
+        """
+        Constructor of the TimelineIndexer
+
+        Starts a background process which analyses the video file ahead of the playhead and writes the results into
+        the detection cache. The appearances of each person are collected into a FaceTimeline.
+
+        :param source: path to the video file
+        :type source: str
+        :param logger: object used to perform logging
+        :type logger: logging.Logger
+        :param detection_cache: the detection cache the playback reads from
+        :type detection_cache: video_player.DetectionCache.DetectionCache
+        :param encodings_path: directory containing the encoding store, None to use the encodings directory of the
+        project
+        :type encodings_path: str
+        :param face_recognition_model: The face detector backend, one of video_player.FaceDetectors.DETECTOR_NAMES
+        :type face_recognition_model: str
+        :param detection_max_size: Maximal length of the longer image edge the face detection runs on
+        :type detection_max_size: int
+        :param number_of_times_to_upsample: How many times the detection image is upsampled to find smaller faces
+        :type number_of_times_to_upsample: int
+        :param start_ms: playback time to start the analysis at
+        :type start_ms: int
+        :param step_ms: time between two analysed frames, the playback finds a cached frame within step_ms / 2
+        :type step_ms: int
+        """
+        self.__logger = logger
+        self.timeline = FaceTimeline(max_gap_ms=2 * step_ms)
+        """Appearances of the persons in the frames analysed so far"""
+
+        # the analysing process only reads the encoding store
+        migrate_pickles(logger, encodings_path)
+        settings = {"encodings_path": encodings_path, "cache_path": detection_cache.path,
+                    "face_recognition_model": face_recognition_model, "detection_max_size": detection_max_size,
+                    "number_of_times_to_upsample": number_of_times_to_upsample}
+        # the process is spawned, forking would copy the state of the Tk, vlc and detection threads and of the open
+        # SQLite connection of this process
+        context = multiprocessing.get_context("spawn")
+        self.__results = context.Queue()
+        self.__playheads = context.Queue()
+        self.__stop_event = context.Event()
+        self.__process = context.Process(target=index_video, daemon=True,
+                                         args=(source, settings, start_ms, step_ms, self.__results, self.__playheads,
+                                               self.__stop_event))
+        self.__process.start()
+        self.__logger_info(f"Started analysing {source} in the background")
+
+    def set_playhead(self, time_ms):
+        """
+        Informs the background process about the current playback time, such that it stays ahead of it
+
+        :param time_ms: current playback time in milliseconds
+        :type time_ms: int
+        """
+        self.__playheads.put(time_ms)
+
+    def poll(self):
+        """
+        Adds the results of the background process into the timeline
+
+        :return: whether the timeline changed
+        """
+        changed = False
+        try:
+            while True:
+                time_ms, names = self.__results.get_nowait()
+                self.timeline.add(time_ms, names)
+                changed = True
+        except queue.Empty:
+            pass
+        return changed
+
+    def stop(self):
+        """
+        Stops the background process
+        """
+        self.__stop_event.set()
+        self.__process.join(timeout=2)
+        if self.__process.is_alive():
+            self.__process.terminate()
+        self.__logger_info("Stopped the background analysis")
+
+    def __logger_info(self, msg):
+        """
+        Adds a log info entry starting with TimelineIndexer
+
+        :param msg: the message to write
+        :type msg: str
+        """
+        self.__logger.info(f"TimelineIndexer: {msg}")
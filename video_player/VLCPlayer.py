@@ -6,16 +6,22 @@ in which the video should be displayed in
 import threading
 
 import vlc
-import time
 import tkinter as tk
 
-from video_player.FrameHandler import FrameHandler
+from video_player.FrameBufferPool import FrameBufferPool
 
 
 class VLCPlayer:
-    events = {"MediaPlayerTimeChanged": vlc.EventType.MediaPlayerTimeChanged}
+    events = {"MediaPlayerTimeChanged": vlc.EventType.MediaPlayerTimeChanged,
+              "MediaPlayerLengthChanged": vlc.EventType.MediaPlayerLengthChanged,
+              "MediaPlayerPlaying": vlc.EventType.MediaPlayerPlaying}
+    """Events of the media player commands can be registered for"""
+    parse_timeout_ms = 2000
+    """Time the asynchronous parsing of a media file may take before vlc gives up"""
 
-    def __init__(self, frame, logger, frames_to_skip, face_recognition_model):
+    def __init__(self, frame, logger, frames_to_skip, face_recognition_model, detection_max_size=640,
+                 number_of_times_to_upsample=1, detection_cpu_share=0.5, pipeline_stats=None, detection_pool=None,
+                 scene_gate=None):
         """
         Constructor of the VLCPlayer
 
@@ -27,21 +33,48 @@ class VLCPlayer:
         :param frame: the tkinter frame in which the video should be shown in
         :type frame: tkinter.Frame
 
-        :param frames_to_skip: Number of frames to skip, meaning if frames_to_skip=3 only every fourth frame is shown
+        :param frames_to_skip: Number of frames to skip, meaning if frames_to_skip=3 only every fourth frame is handed
+        over to the face detection, None to adapt the number to the measured detection time
         :type frames_to_skip: int
 
-        :param face_recognition_model: The model used for face recognition, either "cnn" which is accurate, slower and
-        used GPU or "hog" which is faster but not as precise
+        :param face_recognition_model: The face detector backend, either "cnn" which is accurate, slower and used GPU,
+        "hog" which is faster but not as precise, "haar" or "dnn" (OpenCV detectors, see video_player.FaceDetectors)
         :type face_recognition_model: str
+
+        :param detection_max_size: Maximal length of the longer image edge the face detection runs on,
+        None or 0 to detect on the full resolution
+        :type detection_max_size: int
+
+        :param number_of_times_to_upsample: How many times the detection image is upsampled to find smaller faces
+        :type number_of_times_to_upsample: int
+
+        :param detection_cpu_share: Share of the time between two frames the adaptive face detection should use
+        :type detection_cpu_share: float
+
+        :param pipeline_stats: collects the durations of the stages of the frame processing, None to not measure them
+        :type pipeline_stats: video_player.PipelineStats.PipelineStats
+
+        :param detection_pool: detection threads shared with other players, None to run the detection on an own thread
+        :type detection_pool: video_player.DetectionPool.DetectionPool
+
+        :param scene_gate: skips the detection of frames whose scene did not change, reused across media files, None to
+        detect every frame due for detection
+        :type scene_gate: video_player.SceneGate.SceneGate
         """
         self.__frames_to_skip, self.__face_recognition_model = frames_to_skip, face_recognition_model
+        self.__detection_max_size = detection_max_size
+        self.__number_of_times_to_upsample = number_of_times_to_upsample
+        self.__detection_cpu_share = detection_cpu_share
+        self.__pipeline_stats = pipeline_stats
+        self.__detection_pool = detection_pool
+        self.__scene_gate = scene_gate
 
         self.__instance = vlc.Instance()
         """VLC instance used to create the media player"""
         self.__player = self.__instance.media_player_new()
-        """VLC media player to play the video"""
+        """VLC media player to play the video, reused across media files"""
         self.__vlc_event_manager = self.__player.event_manager()
-        """VLC event manager used to catch changes in time"""
+        """VLC event manager used to catch changes in time, length and state"""
 
         self.__frame = frame
         """Frame where the vlc player should be shown in"""
@@ -54,45 +87,87 @@ class VLCPlayer:
         self.__frame.grid_columnconfigure(0, weight=1)
 
         self.__frame_handler = None
-
-        self.__events = {}
+        self.__face_detector = None
+        """Already created face detector backend which is handed to the next frame handler, e.g. by the warm-up"""
+        # the frame handler caches the size of the frame instead of querying it for every rendered frame
+        self.__frame.bind("<Configure>", self.__on_frame_configure, add="+")
+        self.__buffer_pool = FrameBufferPool()
+        """Frame buffers vlc decodes into, reused across media files"""
+
+        self.__media = None
+        """The current vlc media"""
+        self.__media_path = None
+        """Path of the current media file as passed to open_media, vlc only knows its media resource locator"""
+        self.__media_event_manager = None
+        """Event manager of the current media, referenced such that its ctypes callback is not garbage collected"""
+        self.__length_ms = 0
+        """Length of the current media as reported by the parsed and length changed events, 0 while unknown"""
+        self.__pending_time_ms = None
+        """Time to jump to once the current media is playing, None if no jump is pending"""
+        self.__stop_thread = None
+
+        # python-vlc keeps one callback per event type, hence the registered commands are called by one dispatcher
+        self.__events = {event_type: [] for event_type in VLCPlayer.events.values()}
+        for event_type in self.__events:
+            self.__vlc_event_manager.event_attach(event_type, self.__dispatch_event, event_type)
 
         self.__logger_info(f"Finished setting up the vlc media player")
 
     def register_event(self, event_type, command):
         """
-        Attached an event to the vlc event manager
-        :param event_type: vlc.EventType
+        Attached an event to the vlc event manager, the commands are kept across media files. The commands are called
+        on a vlc thread.
+
+        :param event_type: one of the keys of VLCPlayer.events
         :type event_type: str
-        :param command: a function to be called once the event is triggered
+        :param command: a function to be called once the event is triggered (one input param: the vlc event)
         """
         if event_type in VLCPlayer.events:
-            self.__events = {VLCPlayer.events[event_type]: command}
-            self.__vlc_event_manager.event_attach(VLCPlayer.events[event_type], command)
+            self.__events[VLCPlayer.events[event_type]].append(command)
 
-    def get_duration_in_sec(self):
+    def __dispatch_event(self, event, event_type):
         """
-        Returns the duration of the media file in seconds
+        Handles an event of the vlc event manager and calls the commands registered for it
 
-        :rtype int
+        :param event: the vlc event
+        :type event: vlc.Event
+        :param event_type: type of the event
+        :type event_type: vlc.EventType
+        """
+        if event_type == vlc.EventType.MediaPlayerLengthChanged:
+            self.__length_ms = max(0, event.u.new_length)
+        elif event_type == vlc.EventType.MediaPlayerPlaying and self.__pending_time_ms is not None:
+            # the jump was requested before the media was started, vlc ignores it until then. The event callback must
+            # not call back into the player, hence the jump is done by a helper thread as the stop.
+            threading.Thread(target=self.__player.set_time, args=(self.__pending_time_ms,), daemon=True).start()
+            self.__pending_time_ms = None
+        for command in self.__events[event_type]:
+            command(event)
+
+    def __on_media_parsed(self, event, media):
+        """
+        Takes the length of the media once vlc parsed it in the background, which is often before the media player
+        reports it
+
+        :param event: the vlc MediaParsedChanged event
+        :type event: vlc.Event
+        :param media: the parsed media
+        :type media: vlc.Media
         """
-        return self.__player.get_length() // 1000
+        if media is self.__media and self.__length_ms <= 0 and media.get_duration() > 0:
+            self.__length_ms = media.get_duration()
+            for command in self.__events[vlc.EventType.MediaPlayerLengthChanged]:
+                command(event)
 
-    def get_robust_duration_in_sec(self):
+    def get_duration_in_sec(self):
         """
-        Returns the duration of the media file in seconds.
-        It makes sure that the time was already updated and is not 0 or less.
-        It waits at most 2 seconds and probes for the duration 1000 times.
+        Returns the duration of the media file in seconds, 0 while it is not known yet (see the
+        MediaPlayerLengthChanged event)
 
         :rtype int
         """
-        length = 0
-        i = 0
-        while length <= 0 and i < 1000:
-            length = self.__player.get_length()
-            i = i + 1
-            time.sleep(0.002)
-        return length // 1000
+        length_ms = self.__length_ms if self.__length_ms > 0 else self.__player.get_length()
+        return max(0, length_ms) // 1000
 
     def get_current_time_in_sec(self):
         """
@@ -127,8 +202,8 @@ class VLCPlayer:
             # VLC stop creates deadlock if called from the same thread as the player was created from
             # reason here:  video callback locks itself and waits until main thread finished but
             #               main thread waits until stop was completed
-            stop_thread = threading.Thread(target=lambda: self.__player.stop(), daemon=True)
-            stop_thread.start()
+            self.__stop_thread = threading.Thread(target=lambda: self.__player.stop(), daemon=True)
+            self.__stop_thread.start()
             self.__logger_info(f"Current media file stopped")
         else:
             self.__logger_info(f"No current media file to stop")
@@ -157,19 +232,11 @@ class VLCPlayer:
         else:
             self.__logger_info(f"Media file was already running")
 
-    def __new_player(self):
+    def open_media(self, media_path, is_detection_activated, enc_manager, detection_cache=None, media_options=(),
+                   is_cache_only=False):
         """
-        Creates a new media player and registers all currently used events on its event manager
-        """
-        self.__player = self.__instance.media_player_new()
-        self.__vlc_event_manager = self.__player.event_manager()
-
-        for event in self.__events:
-            self.__vlc_event_manager.event_attach(event, self.__events[event])
-
-    def open_media(self, media_path, is_detection_activated, enc_manager):
-        """
-        Opens the media file and starts playing it
+        Opens the media file and starts playing it. The media player is reused and the media is parsed in the
+        background, hence the duration is 0 until the MediaPlayerLengthChanged event arrives.
 
         :param media_path: path of the media file to open
         :type media_path: str
@@ -177,34 +244,66 @@ class VLCPlayer:
         :param is_detection_activated: tk.BooleanVar showing whether face should be detected
         :type is_detection_activated: tkinter.BooleanVar
 
-        :param enc_manager: a manager object to access and write face encodings on disk
+        :param enc_manager: a manager object to access and write face encodings on disk, None while the encodings are
+        still loaded (see set_encoding_manager)
         :type enc_manager: video_player.EncodingManager.EncodingManager
+
+        :param detection_cache: cache of the detection results of previously analysed frames, None to always detect
+        :type detection_cache: video_player.DetectionCache.DetectionCache
+
+        :param media_options: vlc options of the media, e.g. "input-repeat=65535" to play it in a loop
+        :type media_options: tuple
+
+        :param is_cache_only: whether the faces are only taken from the detection cache, e.g. while a background
+        analysis fills it, such that the playback does not run the face detection
+        :type is_cache_only: bool
+
+        :return: dictionary with the duration in seconds, 0 if it is not known yet
         """
         # Open media source
         self.__logger_info(f"Start opening media file {media_path}")
 
         self.__logger_info(f"Set new media in player")
+        if self.__stop_thread is not None:
+            # a stop running in the background would otherwise stop the new media
+            self.__stop_thread.join()
+            self.__stop_thread = None
         if self.__frame_handler is not None:
-            self.__new_player()
+            self.__frame_handler.release()
 
-        media = self.__instance.media_new(media_path)
+        media = self.__instance.media_new(media_path, *media_options)
+        self.__media = media
+        self.__media_path = media_path
+        self.__length_ms = 0
+        self.__pending_time_ms = None
+        self.__media_event_manager = media.event_manager()
+        self.__media_event_manager.event_attach(vlc.EventType.MediaParsedChanged, self.__on_media_parsed, media)
 
         self.__player.set_media(media)
 
         self.__logger_info(f"New media was set in player")
 
-        media.parse()
+        media.parse_with_options(vlc.MediaParseFlag.local, VLCPlayer.parse_timeout_ms)
 
         self.__logger_info(f"Activate FrameHandler for the media")
+        # OpenCV and the frame processing are imported once the first media file is opened
+        from video_player.FrameHandler import FrameHandler
+
         self.__frame_handler = FrameHandler(self, self.__img_label, is_detection_activated,
-                                            enc_manager, self.__frames_to_skip, self.__face_recognition_model)
+                                            enc_manager, self.__frames_to_skip, self.__face_recognition_model,
+                                            self.__detection_max_size, self.__number_of_times_to_upsample,
+                                            self.__detection_cpu_share, detection_cache, media_path,
+                                            self.__buffer_pool, self.__pipeline_stats, self.__detection_pool,
+                                            self.__scene_gate, self.__face_detector, is_cache_only)
+        # a detector is used by one frame handler only, as the detection thread of the previous one may still run
+        self.__face_detector = None
         self.__logger_info(f"Successfully activated FrameHandler for the media")
 
         self.__player.play()
 
         self.__logger_info(f"Successfully opened the media file")
 
-        media_info = {"duration_in_sec": self.get_robust_duration_in_sec()}
+        media_info = {"duration_in_sec": self.get_duration_in_sec()}
 
         return media_info
 
@@ -217,19 +316,64 @@ class VLCPlayer:
         :param update_gui_command: function to call to update surrounding gui
         (two input params: duration and current time)
         :param state_end_command: function to call to handle the case that the media file already ended
-        (function has the media resource locator as the input param)
+        (function has the path of the media file as passed to open_media as the input param)
         """
         media = self.__player.get_media()
         if media is None:
             return
         if vlc.State.Ended == media.get_state():
             self.__logger_info(f"Media file already ended, therefore restart it")
-            state_end_command(media.get_mrl())
-        new_position = time_in_sec / self.get_duration_in_sec()
-        self.__player.set_position(new_position)
-        update_gui_command(self.get_duration_in_sec(), self.get_current_time_in_sec())
-        pos_str = "{:.2f}".format(new_position)
-        self.__logger_info(f"Go to position {pos_str} of the media file")
+            state_end_command(self.__media_path)
+        time_in_ms = max(0, int(time_in_sec * 1000))
+        if self.__player.get_state() in (vlc.State.Playing, vlc.State.Paused):
+            self.__player.set_time(time_in_ms)
+        else:
+            # the media is still opening, the jump is done by the MediaPlayerPlaying event
+            self.__pending_time_ms = time_in_ms
+        # the jump is asynchronous, hence the gui shows the target instead of the current time
+        update_gui_command(self.get_duration_in_sec(), time_in_ms // 1000)
+        self.__logger_info(f"Go to {time_in_ms} ms of the media file")
+
+    def set_face_detector(self, face_recognition_model, face_detector=None):
+        """
+        Switches the face detector backend of the current and of all following media files
+
+        :param face_recognition_model: name of the backend, one of video_player.FaceDetectors.DETECTOR_NAMES
+        :type face_recognition_model: str
+        :param face_detector: an already created backend of face_recognition_model (e.g. prepared by the warm-up),
+        None to create it
+        """
+        if self.__frame_handler is not None:
+            self.__frame_handler.set_face_detector(face_recognition_model, face_detector)
+        elif face_detector is None:
+            from video_player.FaceDetectors import create_detector
+
+            # raises the error of a backend which cannot be created before it is used for a media file
+            self.__face_detector = create_detector(face_recognition_model, self.__number_of_times_to_upsample)
+        else:
+            self.__face_detector = face_detector
+        self.__face_recognition_model = face_recognition_model
+        self.__logger_info(f"Switched the face detector to {face_recognition_model}")
+
+    def set_encoding_manager(self, enc_manager):
+        """
+        Passes the encoding manager to the current media file once the known encodings were loaded in the background
+
+        :param enc_manager: a manager object to access and write face encodings on disk
+        :type enc_manager: video_player.EncodingManager.EncodingManager
+        """
+        if self.__frame_handler is not None:
+            self.__frame_handler.set_encoding_manager(enc_manager)
+
+    def __on_frame_configure(self, event):
+        """
+        Passes the new size of the frame the video is shown in to the frame handler
+
+        :param event: the <Configure> event of the frame
+        :type event: tkinter.Event
+        """
+        if self.__frame_handler is not None:
+            self.__frame_handler.set_target_size(event.width, event.height)
 
     def get_fps(self):
         """
@@ -243,6 +387,12 @@ class VLCPlayer:
         """
         return self.__player
 
+    def get_logger(self):
+        """
+        Returns the logger of the player, used by the frame handler and its detection thread
+        """
+        return self.__logger
+
     def __logger_info(self, msg):
         """
         Adds a log info entry starting with VLCPlayer:
@@ -0,0 +1,223 @@
+"""
+Script to analyse video files without the GUI. The video is decoded with OpenCV, split into time segments which are
+processed in parallel and the detected faces of each frame are written into a JSONL or CSV file.
+"""
+import csv
+import json
+import logging
+import multiprocessing
+import sys
+
+import cv2
+
+from video_player.EncodingManager import EncodingManager, migrate_pickles
+
+RECORD_FIELDS = ["frame", "timestamp", "top", "right", "bottom", "left", "name", "distance"]
+"""Fields of a single detection record in the order they are written"""
+
+_recognizer = None
+"""Face recognizer of an analysing process, created once per process by _init_worker"""
+
+
+def _init_worker(settings):
+    """
+    Creates the face recognizer of an analysing process, such that the encoding store is opened once per process
+    instead of once per segment
+    """
+    # the face stack is only imported by the analysing processes
+    from video_player.FaceRecognizer import FaceRecognizer
+
+    global _recognizer
+    enc_manager = EncodingManager(logging.getLogger(), settings["encodings_path"], migrate_pickles=False)
+    _recognizer = FaceRecognizer(enc_manager, settings["face_recognition_model"], settings["detection_max_size"],
+                                 settings["number_of_times_to_upsample"])
+
+
+def get_video_info(source):
+    """
+    Returns the number of frames and the fps of a video file
+
+    :param source: path to the video file
+    :type source: str
+    :rtype: tuple
+    """
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise IOError(f"Could not open video file {source}")
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25
+    capture.release()
+    return frame_count, fps
+
+
+def split_into_segments(frame_count, segment_count):
+    """
+    Splits the frames of a video into consecutive segments of similar length
+
+    :param frame_count: number of frames of the video
+    :type frame_count: int
+    :param segment_count: number of segments to create
+    :type segment_count: int
+    :return: list of tuples (first frame, end frame) with the end frame being exclusive
+    """
+    segment_count = max(1, min(segment_count, frame_count))
+    bounds = [frame_count * i // segment_count for i in range(segment_count + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(segment_count) if bounds[i] < bounds[i + 1]]
+
+
+def seek_frame(capture, frame_nr):
+    """
+    Positions the capture in front of the given frame. Seeking by frame number is not frame accurate for every
+    container, hence the position the capture landed on is read back and the remaining frames are decoded forward,
+    seeking further back whenever the capture overshot the frame.
+
+    :param capture: opened video capture
+    :type capture: cv2.VideoCapture
+    :param frame_nr: number of the frame to decode next
+    :type frame_nr: int
+    :return: number of the frame the capture decodes next, smaller than frame_nr if the video ended before
+    """
+    position = 0
+    target = frame_nr
+    while target > 0:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, target)
+        position = int(capture.get(cv2.CAP_PROP_POS_FRAMES))
+        if 0 <= position <= frame_nr:
+            break
+        # the capture overshot the frame or does not know its position, seek twice as far back
+        target = max(0, 2 * target - frame_nr - 1) if target < frame_nr else frame_nr - 1
+        if target == 0:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            position = 0
+
+    while position < frame_nr and capture.grab():
+        position += 1
+    return position
+
+
+def analyze_segment(source, first_frame, end_frame, settings):
+    """
+    Decodes the frames [first_frame, end_frame) of the video file and runs the face recognition on them
+
+    :param source: path to the video file
+    :type source: str
+    :param first_frame: number of the first frame of the segment
+    :type first_frame: int
+    :param end_frame: number of the first frame after the segment
+    :type end_frame: int
+    :param settings: dictionary with the keys encodings_path, frames_to_skip, face_recognition_model,
+    detection_max_size and number_of_times_to_upsample
+    :type settings: dict
+    :return: list of detection records (dictionaries with the keys RECORD_FIELDS)
+    """
+    if _recognizer is None:
+        _init_worker(settings)
+
+    capture = cv2.VideoCapture(source)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25
+    position = seek_frame(capture, first_frame)
+
+    records = []
+    for frame_nr in range(position, end_frame):
+        # skipped frames are only grabbed but not retrieved and converted into an image
+        if frame_nr % (settings["frames_to_skip"] + 1) != 0:
+            if not capture.grab():
+                break
+            continue
+        success, frame = capture.read()
+        if not success:
+            break
+        # the timestamp of the decoded frame, the frame number only approximates it for a variable frame rate
+        timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000 or frame_nr / fps
+        for (top, right, bottom, left), name, distance in _recognizer.recognize(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)):
+            records.append({"frame": frame_nr, "timestamp": round(timestamp, 3), "top": top, "right": right,
+                            "bottom": bottom, "left": left, "name": name, "distance": round(distance, 4)})
+    capture.release()
+    return records
+
+
+def _analyze_segment(arguments):
+    """
+    Unpacks the arguments of analyze_segment, used as target of the process pool
+    """
+    return analyze_segment(*arguments)
+
+
+def analyze_video(source, output, logger, output_format="jsonl", processes=None, segments=None, encodings_path=None,
+                  frames_to_skip=0, face_recognition_model="hog", detection_max_size=640,
+                  number_of_times_to_upsample=1):
+    """
+    Analyses a video file and writes the detected faces of each frame into the output file
+
+    :param source: path to the video file
+    :type source: str
+
+    :param output: path to the file to write the detections to
+    :type output: str
+
+    :param logger: object used to perform logging
+    :type logger: logging.Logger
+
+    :param output_format: either "jsonl" (one JSON object per detection) or "csv"
+    :type output_format: str
+
+    :param processes: number of processes decoding and analysing in parallel, None to use all cores
+    :type processes: int
+
+    :param segments: number of time segments the video is split into, None to use four per process
+    :type segments: int
+
+    :param encodings_path: directory containing the encoding store, None to use the encodings directory of the project
+    :type encodings_path: str
+
+    :param frames_to_skip: Number of frames to skip, meaning if frames_to_skip=3 only every fourth frame is analysed
+    :type frames_to_skip: int
+
+    :param face_recognition_model: The face detector backend, one of video_player.FaceDetectors.DETECTOR_NAMES
+    :type face_recognition_model: str
+
+    :param detection_max_size: Maximal length of the longer image edge the face detection runs on
+    :type detection_max_size: int
+
+    :param number_of_times_to_upsample: How many times the detection image is upsampled to find smaller faces
+    :type number_of_times_to_upsample: int
+
+    :return: number of written detections
+    """
+    frame_count, fps = get_video_info(source)
+    processes = processes or multiprocessing.cpu_count()
+    # the analysing processes only read the encoding store
+    migrate_pickles(logger, encodings_path)
+    if frame_count > 0:
+        segment_bounds = split_into_segments(frame_count, segments or 4 * processes)
+    else:
+        # the container does not know its number of frames, hence it is decoded as a whole until the end
+        segment_bounds = [(0, sys.maxsize)]
+    logger.info(f"VideoAnalyzer: Analysing {frame_count} frames ({fps:.2f} fps) of {source} in "
+                f"{len(segment_bounds)} segments with {processes} processes")
+
+    settings = {"encodings_path": encodings_path, "frames_to_skip": frames_to_skip,
+                "face_recognition_model": face_recognition_model, "detection_max_size": detection_max_size,
+                "number_of_times_to_upsample": number_of_times_to_upsample}
+    tasks = [(source, first_frame, end_frame, settings) for first_frame, end_frame in segment_bounds]
+
+    count = 0
+    with open(output, "w", newline="", encoding="utf-8") as output_file:
+        if output_format == "csv":
+            writer = csv.DictWriter(output_file, fieldnames=RECORD_FIELDS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            def write(record):
+                output_file.write(json.dumps(record) + "\n")
+
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(settings,)) as pool:
+            # imap keeps the order of the segments, such that the output is sorted by time
+            for segment_nr, records in enumerate(pool.imap(_analyze_segment, tasks)):
+                for record in records:
+                    write(record)
+                count += len(records)
+                logger.info(f"VideoAnalyzer: Finished segment {segment_nr + 1}/{len(tasks)}")
+
+    logger.info(f"VideoAnalyzer: Wrote {count} detections into {output}")
+    return count
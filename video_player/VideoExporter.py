@@ -0,0 +1,214 @@
+"""
+Script to export an annotated copy of a video file without the GUI. Decoding, face detection and encoding run
+pipelined: a thread decodes the frames, a process pool detects the faces on every (frames_to_skip + 1)-th frame, the
+calling thread tracks and draws the faces as the player does and a thread encodes the annotated frames. The stages are
+connected by bounded queues, such that a slow stage holds back the others instead of filling the memory.
+"""
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+
+import cv2
+
+from video_player.EncodingManager import EncodingManager, migrate_pickles
+from video_player.FaceDrawing import draw_face_rectangles
+from video_player.FaceTracker import FaceTracker
+from video_player.VideoAnalyzer import get_video_info
+
+_recognizer = None
+"""Face recognizer of a detection process, created by _init_worker"""
+
+
+def _init_worker(settings):
+    """
+    Creates the face recognizer of a detection process
+    """
+    from video_player.FaceRecognizer import FaceRecognizer
+
+    global _recognizer
+    enc_manager = EncodingManager(logging.getLogger(), settings["encodings_path"], migrate_pickles=False)
+    _recognizer = FaceRecognizer(enc_manager, settings["face_recognition_model"], settings["detection_max_size"],
+                                 settings["number_of_times_to_upsample"])
+
+
+def detect_frame(frame):
+    """
+    Detects and identifies the faces of a frame in a detection process
+
+    :param frame: BGR video frame
+    :type frame: numpy.ndarray
+    :return: list of tuples (face location, name, distance) in coordinates of the frame
+    """
+    return _recognizer.recognize(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+def _decode(capture, frames, pool, detection_interval, errors):
+    """
+    Decodes the frames of the capture and puts tuples (frame, pending detection or None) into the frames queue, the
+    detection of every detection_interval-th frame is submitted to the pool. None marks the end of the video.
+    """
+    try:
+        frame_nr = 0
+        while True:
+            success, frame = capture.read()
+            if not success:
+                break
+            detection = pool.apply_async(detect_frame, (frame,)) if frame_nr % detection_interval == 0 else None
+            frames.put((frame, detection))
+            frame_nr += 1
+    except Exception as error:
+        errors.append(error)
+    finally:
+        frames.put(None)
+
+
+def _encode(writer, annotated_frames, errors):
+    """
+    Writes the annotated frames of the queue into the video writer until it gets None
+    """
+    while True:
+        frame = annotated_frames.get()
+        if frame is None:
+            return
+        if not errors:
+            try:
+                writer.write(frame)
+            except Exception as error:
+                # the queue is still drained, such that the annotating thread is not blocked
+                errors.append(error)
+
+
+def export_video(source, output, logger, encodings_path=None, frames_to_skip=2, face_recognition_model="hog",
+                 detection_max_size=640, number_of_times_to_upsample=1, processes=None, codec="mp4v",
+                 queue_size=32, progress_interval=2.0, progress_command=None):
+    """
+    Writes a copy of the video file with the recognized faces drawn in, the faces are marked as in the video player.
+    The audio track is not copied.
+
+    :param source: path to the video file
+    :type source: str
+
+    :param output: path of the annotated video file, its extension has to fit the codec (e.g. .mp4 for mp4v)
+    :type output: str
+
+    :param logger: object used to perform logging
+    :type logger: logging.Logger
+
+    :param encodings_path: directory containing the encoding store, None to use the encodings directory of the project
+    :type encodings_path: str
+
+    :param frames_to_skip: Number of frames between two detected frames, the faces are tracked in between
+    :type frames_to_skip: int
+
+    :param face_recognition_model: The face detector backend, one of video_player.FaceDetectors.DETECTOR_NAMES
+    :type face_recognition_model: str
+
+    :param detection_max_size: Maximal length of the longer image edge the face detection runs on
+    :type detection_max_size: int
+
+    :param number_of_times_to_upsample: How many times the detection image is upsampled to find smaller faces
+    :type number_of_times_to_upsample: int
+
+    :param processes: number of detection processes, None to use all cores but the ones decoding and encoding
+    :type processes: int
+
+    :param codec: four character code of the video codec of the output
+    :type codec: str
+
+    :param queue_size: maximal number of frames waiting between two stages
+    :type queue_size: int
+
+    :param progress_interval: seconds between two progress reports
+    :type progress_interval: float
+
+    :param progress_command: function called with the number of written frames and the total number of frames (0 if
+    unknown) on every progress report, None to only log the progress
+
+    :return: dictionary with the number of written frames, the elapsed seconds, the throughput in frames per second and
+    the realtime factor (throughput divided by the frame rate of the video)
+    """
+    frame_count, fps = get_video_info(source)
+    capture = cv2.VideoCapture(source)
+    width, height = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*codec), fps, (width, height))
+    if not writer.isOpened():
+        capture.release()
+        raise IOError(f"Could not open {output} for writing with codec {codec}")
+
+    processes = processes or max(1, multiprocessing.cpu_count() - 2)
+    # the detection processes only read the encoding store
+    migrate_pickles(logger, encodings_path)
+    settings = {"encodings_path": encodings_path, "face_recognition_model": face_recognition_model,
+                "detection_max_size": detection_max_size, "number_of_times_to_upsample": number_of_times_to_upsample}
+    logger.info(f"VideoExporter: Exporting {frame_count} frames ({width}x{height}, {fps:.2f} fps) of {source} to "
+                f"{output} with {processes} detection processes")
+
+    frames = queue.Queue(maxsize=queue_size)
+    """Decoded frames with their pending detection, the detections of the queued frames run in the meantime"""
+    annotated_frames = queue.Queue(maxsize=queue_size)
+    errors = []
+    tracker = FaceTracker()
+
+    start = time.perf_counter()
+    last_report = start
+    written = 0
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(settings,)) as pool:
+        decoder = threading.Thread(target=_decode, args=(capture, frames, pool, frames_to_skip + 1, errors),
+                                   daemon=True)
+        encoder = threading.Thread(target=_encode, args=(writer, annotated_frames, errors), daemon=True)
+        decoder.start()
+        encoder.start()
+        try:
+            while True:
+                item = frames.get()
+                if item is None:
+                    break
+                frame, detection = item
+                # the tracker only compares consecutive frames, hence the channel order of the frame does not matter
+                tracker.track(frame)
+                if detection is not None:
+                    # the frame was sent to the detection process before get returns, hence it can be drawn on
+                    faces = detection.get()
+                    identities = {location: (name, distance) for location, name, distance in faces}
+                    tracker.associate([location for location, _, _ in faces],
+                                      lambda locations: [identities[location] for location in locations])
+                annotated_frames.put(draw_face_rectangles(frame, tracker.get_faces()))
+                written += 1
+
+                now = time.perf_counter()
+                if now - last_report >= progress_interval:
+                    last_report = now
+                    _report_progress(logger, written, frame_count, now - start, fps)
+                    if progress_command is not None:
+                        progress_command(written, frame_count)
+        finally:
+            annotated_frames.put(None)
+            encoder.join()
+            decoder.join(timeout=1)
+            capture.release()
+            writer.release()
+    if errors:
+        raise errors[0]
+
+    elapsed = time.perf_counter() - start
+    _report_progress(logger, written, frame_count, elapsed, fps)
+    if progress_command is not None:
+        progress_command(written, frame_count)
+    throughput = written / elapsed if elapsed > 0 else 0.0
+    return {"frames": written, "seconds": elapsed, "fps": throughput, "realtime_factor": throughput / fps}
+
+
+def _report_progress(logger, written, frame_count, elapsed, fps):
+    """
+    Logs the number of written frames, the throughput and the estimated remaining time
+    """
+    throughput = written / elapsed if elapsed > 0 else 0.0
+    if frame_count > 0 and throughput > 0:
+        remaining = f", {max(0, frame_count - written) / throughput:.0f}s remaining"
+        total = f"/{frame_count} ({written / frame_count:.0%})"
+    else:
+        remaining, total = "", ""
+    logger.info(f"VideoExporter: Wrote {written}{total} frames, {throughput:.1f} fps "
+                f"({throughput / fps:.2f}x realtime){remaining}")
@@ -0,0 +1,300 @@
+"""
+Script which opens a tkinter window showing several video streams in a grid, e.g. to monitor several camera feeds.
+All streams submit their frames to one shared detection pool, such that adding a stream does not add detection
+threads.
+"""
+
+import logging
+import math
+import multiprocessing
+import os
+import tkinter as tk
+from tkinter import filedialog
+
+from video_player.DetectionCache import DetectionCache
+from video_player.DetectionPool import DetectionPool
+from video_player.EncodingManager import EncodingManager
+from video_player.FaceDetectors import DETECTOR_NAMES
+from video_player.SceneGate import SceneGate
+from video_player.VLCPlayer import VLCPlayer
+
+
+class VideoGridWindow:
+    """
+    Class which opens and manages several video players in a grid of a tkinter window
+    """
+
+    def __init__(self, logger, sources, columns, detection_workers, loop, frames_to_skip, face_recognition_model,
+                 detection_max_size=640, number_of_times_to_upsample=1, detection_cpu_share=0.5,
+                 use_detection_cache=True, use_scene_gate=True, scene_gate_masks=()):
+        """
+        Constructor of the VideoGridWindow
+
+        :param logger: object used to perform logging
+        :type logger: logging.Logger
+
+        :param sources: paths or URLs (e.g. udp://@127.0.0.1:5000 of a loopback stream) of the streams to show
+        :type sources: list
+
+        :param columns: number of columns of the grid, None for a square grid
+        :type columns: int
+
+        :param detection_workers: number of detection threads shared by all streams
+        :type detection_workers: int
+
+        :param loop: whether the streams are restarted once they ended, such that files act as camera stand-ins
+        :type loop: bool
+
+        :param frames_to_skip: The number of frames to skip when face detection is activated, None to adapt it to the
+        measured detection time and the number of streams
+        :type frames_to_skip: int
+
+        :param face_recognition_model: The face detector backend, one of video_player.FaceDetectors.DETECTOR_NAMES
+        :type face_recognition_model: str
+
+        :param detection_max_size: Maximal length of the longer image edge the face detection runs on,
+        None or 0 to detect on the full resolution
+        :type detection_max_size: int
+
+        :param number_of_times_to_upsample: How many times the detection image is upsampled to find smaller faces
+        :type number_of_times_to_upsample: int
+
+        :param detection_cpu_share: Share of a CPU core each detection thread should use, the streams split it
+        :type detection_cpu_share: float
+
+        :param use_detection_cache: whether detection results of local files are cached on disk
+        :type use_detection_cache: bool
+
+        :param use_scene_gate: whether the faces of a stream are only detected again if its scene changed
+        :type use_scene_gate: bool
+
+        :param scene_gate_masks: regions (x, y, width, height) as fractions of the frame which are ignored when looking
+        for scene changes, e.g. the timestamp overlay of a camera
+        :type scene_gate_masks: list
+        """
+        self.__logger = logger
+        self.__use_scene_gate = use_scene_gate
+        self.__scene_gate_masks = scene_gate_masks
+        self.__columns = columns
+        self.__loop = loop
+        self.__player_settings = (frames_to_skip, face_recognition_model, detection_max_size,
+                                  number_of_times_to_upsample, detection_cpu_share)
+
+        root = tk.Tk()
+        root.title("Video Face Recognition - Grid")
+        root.bind("<Escape>", lambda event: self.__close_window())
+        root.protocol("WM_DELETE_WINDOW", lambda: self.__close_window())
+        root.configure(bg="grey")
+        root.grid_rowconfigure(0, weight=1)
+        root.grid_columnconfigure(0, weight=1)
+        self.__root = root
+        """The root window containing the grid of video players"""
+
+        self.__enc_manager = EncodingManager(self.__logger)
+        # encodings added by other tools are loaded while the streams are running
+        self.__enc_manager.start_watching()
+        self.__detection_cache = DetectionCache(self.__logger) if use_detection_cache else None
+        self.__detection_pool = DetectionPool(self.__logger, detection_workers, detection_cpu_share)
+        """Detection threads shared by all streams"""
+
+        # setup menubar
+        menubar = tk.Menu(root, tearoff=0)
+        file = tk.Menu(menubar, tearoff=0)
+        file.add_command(label="Add stream", command=self.__open_stream)
+        menubar.add_cascade(label="File", menu=file)
+        detector = tk.Menu(menubar, tearoff=0)
+        self.__is_activated = tk.BooleanVar()
+        self.__is_activated.set(False)
+        detector.add_radiobutton(label=f"Activate ({len(self.__enc_manager.known_face_names)} face encodings)",
+                                 variable=self.__is_activated, value=True,
+                                 state=tk.NORMAL if len(self.__enc_manager.known_face_names) else tk.DISABLED)
+        detector.add_radiobutton(label="Deactivate", variable=self.__is_activated, value=False)
+        menubar.add_cascade(label="Detector", menu=detector)
+        root.config(menu=menubar)
+        self.__detector_menu = detector
+
+        self.__grid = tk.Frame(root, bg="black")
+        """Frame containing one cell per stream"""
+        self.__grid.grid(row=0, column=0, sticky="NESW")
+        self.__status_label = tk.Label(root, bg="grey", anchor="w", justify="left")
+        """Label showing the detection cadence of each stream and the load of the detection pool"""
+        self.__status_label.grid(row=1, column=0, sticky="EW")
+
+        self.__streams = []
+        """List of tuples (source, VLCPlayer, cell frame) of the shown streams"""
+        for source in sources:
+            self.__add_stream(source)
+        self.__update_status()
+
+        self.__logger_info(f"Finished setting up the grid with {len(self.__streams)} streams")
+        root.geometry("960x600")
+        root.lift()
+        root.mainloop()
+
+    def __add_stream(self, source):
+        """
+        Adds a cell with a video player for the source to the grid and starts playing it
+
+        :param source: path or URL of the stream
+        :type source: str
+        """
+        cell = tk.Frame(self.__grid, bg="black", highlightthickness=1, highlightbackground="grey")
+        cell.grid_rowconfigure(0, weight=1)
+        frames_to_skip, model, detection_max_size, upsample, detection_cpu_share = self.__player_settings
+        scene_gate = SceneGate(masks=self.__scene_gate_masks) if self.__use_scene_gate else None
+        player = VLCPlayer(cell, self.__logger, frames_to_skip, model, detection_max_size, upsample,
+                           detection_cpu_share, detection_pool=self.__detection_pool, scene_gate=scene_gate)
+        # only local files can be identified by their content
+        detection_cache = self.__detection_cache if os.path.isfile(source) else None
+        media_options = ("input-repeat=65535",) if self.__loop else ()
+        player.open_media(source, self.__is_activated, self.__enc_manager, detection_cache, media_options)
+        player.set_audio_volume(0)
+        self.__streams.append((source, player, cell))
+        self.__layout()
+
+    def __layout(self):
+        """
+        Arranges the cells of all streams in a grid with equally sized cells
+        """
+        count = len(self.__streams)
+        columns = self.__columns or max(1, math.ceil(math.sqrt(count)))
+        rows = max(1, math.ceil(count / columns))
+        for stream_nr, (_, _, cell) in enumerate(self.__streams):
+            cell.grid(row=stream_nr // columns, column=stream_nr % columns, sticky="NESW")
+        for row in range(rows):
+            self.__grid.grid_rowconfigure(row, weight=1, uniform="cell")
+        for column in range(columns):
+            self.__grid.grid_columnconfigure(column, weight=1, uniform="cell")
+
+    def __open_stream(self):
+        """
+        Opens a dialog to select a video file which is added to the grid
+        """
+        source = filedialog.askopenfilename(title="Select video file")
+        if len(source) != 0:
+            self.__logger_info(f"Add stream {source}")
+            self.__add_stream(source)
+
+    def __update_status(self):
+        """
+        Shows the detection cadence and display frame rate of each stream, the load of the detection pool and the
+        number of known face encodings, repeats itself every second
+        """
+        parts = []
+        for source, player, _ in self.__streams:
+            frame_handler = player.get_frame_handler()
+            if frame_handler is not None:
+                render_stats = frame_handler.get_render_stats()
+                parts.append(f"{os.path.basename(source)}: every {frame_handler.get_detection_cadence()}. frame, "
+                             f"{render_stats['display_fps']:.0f} fps")
+        pool_stats = self.__detection_pool.get_stats()
+        parts.append(f"pool: {pool_stats['workers']} threads, {pool_stats['processed_frames']} detected, "
+                     f"{pool_stats['dropped_frames']} dropped")
+        self.__status_label.configure(text=" | ".join(parts))
+        len_known_encodings = len(self.__enc_manager.known_face_names)
+        self.__detector_menu.entryconfigure(0, label=f"Activate ({len_known_encodings} face encodings)",
+                                            state=tk.NORMAL if len_known_encodings else tk.DISABLED)
+        self.__root.after(1000, self.__update_status)
+
+    def __close_window(self):
+        """
+        Closes the root window, all video players and the detection pool
+        """
+        self.__logger_info("Start releasing the streams and close root frame")
+        for _, player, _ in self.__streams:
+            player.stop_media()
+        self.__detection_pool.stop()
+        self.__enc_manager.stop_watching()
+        self.__enc_manager.save_index()
+        self.__root.destroy()
+        if self.__detection_cache is not None:
+            self.__detection_cache.close()
+        self.__logger_info("Streams were released and the root frame closed")
+
+    def __logger_info(self, msg):
+        """
+        Adds a log info entry starting with VideoGridWindow:
+
+        :param msg: the message to write
+        :type msg: str
+        """
+        self.__logger.info(f"VideoGridWindow: {msg}")
+
+
+def open_grid(sources, columns=None, detection_workers=None, loop=True, frames_to_skip=None,
+              face_recognition_model="hog", detection_max_size=640, number_of_times_to_upsample=1,
+              detection_cpu_share=0.5, use_detection_cache=True, use_scene_gate=True, scene_gate_masks=()):
+    """
+    Open a window showing several video streams in a grid with one shared detection pool
+
+    :param sources: paths or URLs of the streams to show
+    :type sources: list
+
+    :param columns: number of columns of the grid, None for a square grid
+    :type columns: int
+
+    :param detection_workers: number of detection threads shared by all streams, None to use half of the cores
+    :type detection_workers: int
+
+    :param loop: whether the streams are restarted once they ended
+    :type loop: bool
+
+    :param frames_to_skip: The number of frames to skip when face detection is activated, None to adapt it to the
+    measured detection time and the number of streams
+    :type frames_to_skip: int
+
+    :param face_recognition_model: The face detector backend, one of video_player.FaceDetectors.DETECTOR_NAMES
+    :type face_recognition_model: str
+
+    :param detection_max_size: Maximal length of the longer image edge the face detection runs on
+    :type detection_max_size: int
+
+    :param number_of_times_to_upsample: How many times the detection image is upsampled to find smaller faces
+    :type number_of_times_to_upsample: int
+
+    :param detection_cpu_share: Share of a CPU core each detection thread should use, the streams split it among each
+    other such that the detection cadence of each stream degrades with the number of streams
+    :type detection_cpu_share: float
+
+    :param use_detection_cache: whether detection results of local files are cached on disk
+    :type use_detection_cache: bool
+
+    :param use_scene_gate: whether the faces of a stream are only detected again if its scene changed (motion or a hard
+    cut), which saves most detections of static camera feeds
+    :type use_scene_gate: bool
+
+    :param scene_gate_masks: regions (x, y, width, height) as fractions of the frame which are ignored when looking for
+    scene changes, e.g. [(0, 0, 0.3, 0.06)] for the timestamp overlay of a camera
+    :type scene_gate_masks: list
+    """
+    logging.basicConfig(filename="../video_face_recognition.log",
+                        format='%(asctime)s %(levelname)s %(message)s',
+                        filemode='w')
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+
+    if detection_workers is None or detection_workers < 1:
+        detection_workers = max(1, multiprocessing.cpu_count() // 2)
+
+    if frames_to_skip is not None and frames_to_skip > 20:
+        frames_to_skip = 20
+    elif frames_to_skip is not None and frames_to_skip < 0:
+        frames_to_skip = 0
+
+    if detection_cpu_share > 1:
+        detection_cpu_share = 1
+    elif detection_cpu_share < 0.05:
+        detection_cpu_share = 0.05
+
+    if face_recognition_model not in DETECTOR_NAMES:
+        face_recognition_model = "hog"
+
+    if detection_max_size is None or detection_max_size <= 0:
+        detection_max_size = None
+    elif detection_max_size < 160:
+        detection_max_size = 160
+
+    logger.info(f"Open VideoGridWindow with {len(sources)} streams and {detection_workers} detection threads")
+    VideoGridWindow(logger, list(sources), columns, detection_workers, loop, frames_to_skip, face_recognition_model,
+                    detection_max_size, number_of_times_to_upsample, detection_cpu_share, use_detection_cache,
+                    use_scene_gate, scene_gate_masks)
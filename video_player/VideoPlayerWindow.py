@@ -7,22 +7,27 @@ the frame is opened without any initial video file loaded.
 import logging
 import os
 import tkinter as tk
-from tkinter import font, filedialog
+from tkinter import font, filedialog, messagebox
 
 from PIL import Image
 from PIL.ImageTk import PhotoImage
 
-from video_player.EncodingManager import EncodingManager
-from video_player.VLCPlayer import VLCPlayer
-import face_recognition as fr
+from video_player.WarmUp import WarmUp
 
 
 class VideoPlayerWindow:
     """
     Class which opens and manages a video player in a tkinter frame using the python-vlc library
     """
-
-    def __init__(self, logger, initial_source, num_jitters, frames_to_skip, face_recognition_model):
+    detector_labels = {"hog": "dlib HOG (CPU)", "cnn": "dlib CNN (GPU)", "haar": "OpenCV Haar cascade (fast CPU)",
+                       "dnn": "OpenCV DNN (models directory)"}
+    """Labels of the face detector backends, kept in sync with video_player.FaceDetectors without importing OpenCV"""
+
+    def __init__(self, logger, initial_source, num_jitters, frames_to_skip, face_recognition_model,
+                 detection_max_size=640, number_of_times_to_upsample=1, detection_cpu_share=0.5,
+                 use_detection_cache=True, use_timeline_indexer=False, stats_path=None, stats_interval=5.0,
+                 stats_format="prometheus", show_stats_overlay=False, encodings_poll_interval=2.0, use_scene_gate=True,
+                 scene_gate_roi=None, scene_gate_masks=()):
         """
         Constructor of the VideoPlayerWindow
 
@@ -38,20 +43,70 @@ class VideoPlayerWindow:
         :param num_jitters: How many times to re-sample the face when calculating encoding
         :type num_jitters: int
 
-        :param frames_to_skip: The number of frames to skip when face detection is activated
+        :param frames_to_skip: The number of frames to skip when face detection is activated, None to adapt it to the
+        measured detection time
         :type frames_to_skip: int
 
-        :param face_recognition_model: The model used for face recognition, either "cnn" which is accurate, slower and
-        used GPU or "hog" which is faster but not as precise
+        :param face_recognition_model: The face detector backend, either "cnn" which is accurate, slower and used GPU,
+        "hog" which is faster but not as precise, "haar" or "dnn" (OpenCV detectors, see video_player.FaceDetectors)
         :type face_recognition_model: str
 
+        :param detection_max_size: Maximal length of the longer image edge the face detection runs on,
+        None or 0 to detect on the full resolution
+        :type detection_max_size: int
+
+        :param number_of_times_to_upsample: How many times the detection image is upsampled to find smaller faces
+        :type number_of_times_to_upsample: int
+
+        :param detection_cpu_share: Share of the time between two frames the adaptive face detection should use
+        :type detection_cpu_share: float
+
+        :param use_detection_cache: whether detection results are cached on disk and reused when a video is replayed
+        :type use_detection_cache: bool
+
+        :param use_timeline_indexer: whether opened videos are analysed ahead of the playhead in the background to fill
+        the detection cache and show the appearances of each person on the time bar (requires the detection cache)
+        :type use_timeline_indexer: bool
+
+        :param stats_path: file the durations of the pipeline stages are written to, None to not write them
+        :type stats_path: str
+
+        :param stats_interval: seconds between two writes of the pipeline stats
+        :type stats_interval: float
+
+        :param stats_format: format of the pipeline stats file, either "prometheus" or "json"
+        :type stats_format: str
+
+        :param show_stats_overlay: whether the durations of the pipeline stages are shown on top of the video
+        :type show_stats_overlay: bool
+
+        :param encodings_poll_interval: seconds between two checks of the encodings directory for encodings added by
+        other tools, None or 0 to not check it
+        :type encodings_poll_interval: float
+
+        :param use_scene_gate: whether frames of an unchanged scene keep the tracked faces instead of being detected
+        :type use_scene_gate: bool
+
+        :param scene_gate_roi: region (x, y, width, height) as fractions of the frame the scene changes are looked for
+        in, None for the whole frame
+        :type scene_gate_roi: tuple
+
+        :param scene_gate_masks: regions (x, y, width, height) as fractions of the frame ignored when looking for scene
+        changes, e.g. news tickers or logos
+        :type scene_gate_masks: list
+
         """
         self.__num_jitters = num_jitters
+        self.__encodings_poll_interval = encodings_poll_interval
+        self.__detection_settings = {"face_recognition_model": face_recognition_model,
+                                     "detection_max_size": detection_max_size,
+                                     "number_of_times_to_upsample": number_of_times_to_upsample}
+        """Settings of the face detection, used by the background analysis"""
 
         self.__logger = logger
 
         # path where images for pictures are stored
-        resource_path = os.path.join(os.path.abspath(__file__), "..", "..", "resources")
+        resource_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resources")
 
         # create root window and bind ways to close the window
         root = tk.Tk()
@@ -63,8 +118,32 @@ class VideoPlayerWindow:
         self.__root = root
         """The root window containing all the video player and the widgets"""
 
-        # Create encoding manager
-        self.__enc_manager = EncodingManager(self.__logger)
+        # the encoding manager is created by the warm-up, which loads the face stack once the first frame is shown
+        self.__enc_manager = None
+        self.__warm_up = WarmUp(self.__logger, face_recognition_model, number_of_times_to_upsample)
+        """Background task loading the face models, the known encodings and the face detector"""
+
+        # NumPy, OpenCV and vlc are imported by the code paths using them, such that the window appears without them
+        # the pipeline stages are only measured if their stats are used
+        self.__pipeline_stats = None
+        if stats_path is not None or show_stats_overlay:
+            from video_player.PipelineStats import PipelineStats
+
+            self.__pipeline_stats = PipelineStats()
+            if stats_path is not None:
+                self.__pipeline_stats.start_dumping(stats_path, stats_interval, stats_format)
+
+        # Create cache of detection results
+        self.__detection_cache = None
+        if use_detection_cache:
+            from video_player.DetectionCache import DetectionCache
+
+            self.__detection_cache = DetectionCache(self.__logger)
+
+        self.__use_timeline_indexer = use_timeline_indexer and use_detection_cache
+        self.__timeline_indexer = None
+        """Background analysis of the current video, only set if use_timeline_indexer is True"""
+        self.__duration_in_sec = 0
 
         # setup menubar
         self.__menubar = tk.Menu(self.__root, tearoff=0)
@@ -77,20 +156,37 @@ class VideoPlayerWindow:
         self.__menubar.add_cascade(label="Encoding", menu=encoding)
 
         detector = tk.Menu(self.__menubar, tearoff=0)
-        encoding.add_command(label="Add face encoding", command=lambda: self.__open_encoding_creation_dialog(detector))
+        encoding.add_command(label="Add face encoding", command=self.__open_encoding_creation_dialog)
         self.__is_activated = tk.BooleanVar()
         self.__is_activated.set(False)
         self.__is_activated.trace_add("write", lambda *args: self.__switch_activation_state(2))
 
-        len_known_encodings = len(self.__enc_manager.known_face_encodings)
-        if len_known_encodings == 0:
-            detector.add_radiobutton(label="Activate (no known encodings)", variable=self.__is_activated,
-                                     value=True, state=tk.DISABLED)
-        else:
-            detector.add_radiobutton(label=f"Activate ({len_known_encodings} face encodings)",
-                                     variable=self.__is_activated, value=True)
+        detector.add_radiobutton(label="Activate (loading face encodings)", variable=self.__is_activated,
+                                 value=True, state=tk.DISABLED)
         detector.add_radiobutton(label="Deactivate", variable=self.__is_activated, value=False)
-        self.__menubar.add_cascade(label="Detector (deactivated)", menu=detector)
+
+        # the face detector backend can be switched while a video is playing
+        detector.add_separator()
+        self.__face_detector = tk.StringVar()
+        self.__face_detector.set(face_recognition_model)
+        for detector_name, detector_label in VideoPlayerWindow.detector_labels.items():
+            detector.add_radiobutton(label=detector_label, variable=self.__face_detector, value=detector_name,
+                                     command=self.__switch_face_detector)
+        self.__menubar.add_cascade(label="Detector (loading)", menu=detector)
+        self.__detector_menu = detector
+        """Menu to activate the face detection, enabled once the warm-up finished"""
+        # the face encodings and the face detection need the face stack
+        self.__menubar.entryconfigure(1, state=tk.DISABLED)
+        self.__menubar.entryconfigure(2, state=tk.DISABLED)
+
+        self.__timeline_menu = tk.Menu(self.__menubar, tearoff=0)
+        """Menu to select the person whose appearances are highlighted below the time bar"""
+        self.__timeline_person = tk.StringVar()
+        self.__timeline_person.set("")
+        self.__timeline_person.trace_add("write", lambda *args: self.__draw_timeline())
+        self.__timeline_menu.add_radiobutton(label="Everyone", variable=self.__timeline_person, value="")
+        if self.__use_timeline_indexer:
+            self.__menubar.add_cascade(label="Timeline", menu=self.__timeline_menu)
         self.__root.config(menu=self.__menubar)
 
         # setting default font
@@ -104,11 +200,24 @@ class VideoPlayerWindow:
         self.__frame = frame
         """The main frame of the application, contains the video player"""
 
-        # Creating VLC player manager
-        self.__vlc_player = VLCPlayer(self.__frame, logger, frames_to_skip, face_recognition_model)
-        self.__vlc_player.register_event("MediaPlayerTimeChanged",
-                                         lambda event: self.__update_time(self.__vlc_player.get_duration_in_sec(),
-                                                                          self.__vlc_player.get_current_time_in_ms()))
+        self.__scene_gate = None
+        """Decides whether the scene changed enough to detect the faces again"""
+        if use_scene_gate:
+            from video_player.SceneGate import SceneGate
+
+            self.__scene_gate = SceneGate(scene_gate_roi, scene_gate_masks)
+
+        # Creating VLC player manager, the frame processing is imported once the first media file is opened
+        from video_player.VLCPlayer import VLCPlayer
+
+        self.__vlc_player = VLCPlayer(self.__frame, logger, frames_to_skip, face_recognition_model,
+                                      detection_max_size, number_of_times_to_upsample, detection_cpu_share,
+                                      self.__pipeline_stats, scene_gate=self.__scene_gate)
+        # the media is parsed in the background, hence the time bar gets its length from the length changed event
+        for event_type in ("MediaPlayerTimeChanged", "MediaPlayerLengthChanged"):
+            self.__vlc_player.register_event(
+                event_type, lambda event: self.__update_time(self.__vlc_player.get_duration_in_sec(),
+                                                             self.__vlc_player.get_current_time_in_ms()))
 
         # play button
         button_size = (30, 30)
@@ -142,6 +251,14 @@ class VideoPlayerWindow:
                                                                             self.__play_video))
         root.grid_columnconfigure(1, weight=1)
 
+        # strip below the time bar highlighting the segments in which the selected persons appear
+        self.__timeline_canvas = tk.Canvas(root, height=6, bg="grey", highlightthickness=0, bd=0)
+        """Canvas showing the appearances of the persons collected by the background analysis"""
+        if self.__use_timeline_indexer:
+            self.__timeline_canvas.grid(row=2, column=1, sticky="EW")
+            self.__timeline_canvas.bind("<Configure>", lambda event: self.__draw_timeline())
+            self.__timeline_canvas.bind("<Button-1>", lambda event: self.__jump_to_timeline_position(event.x))
+
         self.__rest_time_label = tk.Label(root, text="00:00:00", bd=-2, bg="grey")
         """Label showing the rest duration of the video file in the format hh:mm:ss"""
         self.__rest_time_label.grid(row=1, column=2, sticky="NSE")
@@ -171,6 +288,14 @@ class VideoPlayerWindow:
 
         self.__volume.trace_add("write", lambda *event: __change_audio())
 
+        # overlay showing the durations of the pipeline stages
+        self.__stats_label = None
+        if show_stats_overlay:
+            self.__stats_label = tk.Label(frame, bg="black", fg="white", justify="left", anchor="nw",
+                                          font=("Courier", 9))
+            self.__stats_label.place(x=5, y=5)
+            self.__update_stats_overlay()
+
         self.__logger_info("Finished setting up the root frame and its widgets")
 
         self.source = initial_source
@@ -178,6 +303,7 @@ class VideoPlayerWindow:
         if initial_source is not None:
             self.__logger_info("Path to initial video file was given")
             self.__play_video(initial_source)
+        self.__root.after(100, self.__start_warm_up)
         self.__open_window()
 
     def __open_window(self):
@@ -192,8 +318,17 @@ class VideoPlayerWindow:
         Closes the root window and related components such as the vlc video player
         """
         self.__logger_info("Start releasing media files and close root frame")
+        if self.__timeline_indexer is not None:
+            self.__timeline_indexer.stop()
         self.__vlc_player.stop_media()
         self.__root.destroy()
+        if self.__enc_manager is not None:
+            self.__enc_manager.stop_watching()
+            self.__enc_manager.save_index()
+        if self.__pipeline_stats is not None:
+            self.__pipeline_stats.stop_dumping()
+        if self.__detection_cache is not None:
+            self.__detection_cache.close()
         self.__logger_info("Media files were released and the root frame closed")
 
     def __open_video(self):
@@ -234,13 +369,20 @@ class VideoPlayerWindow:
         self.__logger_info(f"Starting opening the video file {source}")
         self.source = source
 
-        media_info = self.__vlc_player.open_media(source, self.__is_activated, self.__enc_manager)
+        # streams and URLs cannot be analysed ahead of the playhead, otherwise the playback only renders the faces the
+        # background analysis cached and does not detect itself
+        is_analysed = self.__use_timeline_indexer and os.path.isfile(source)
+        media_info = self.__vlc_player.open_media(source, self.__is_activated, self.__enc_manager,
+                                                  self.__detection_cache, is_cache_only=is_analysed)
 
         self.__play_button.configure(state="normal")
 
         self.__init_time_bar(media_info["duration_in_sec"])
         self.__time_bar.configure(state="normal")
 
+        if is_analysed:
+            self.__start_timeline_indexer(source)
+
         self.__logger_info("Successfully opened the video file and updated related widgets")
         self.__resume_video()
 
@@ -274,6 +416,7 @@ class VideoPlayerWindow:
 
         # number of overall seconds to make time scroll bar work in units of seconds
         self.__time_bar.configure(to=length_in_sec)
+        self.__duration_in_sec = length_in_sec
         self.__time.set(0)
 
         self.__update_time(length_in_sec, 0)
@@ -333,8 +476,188 @@ class VideoPlayerWindow:
         :param current_time_in_ms: current time in the video file in milliseconds
         :type current_time_in_ms: int
         """
+        if length_in_sec != self.__duration_in_sec:
+            self.__time_bar.configure(to=length_in_sec)
+            self.__duration_in_sec = length_in_sec
+        current_time_in_ms = max(0, current_time_in_ms)
         self.__update_rest_time_label(length_in_sec, current_time_in_ms // 1000)
         self.__time.set(current_time_in_ms // 1000)
+        if self.__timeline_indexer is not None:
+            self.__timeline_indexer.set_playhead(current_time_in_ms)
+
+    def __start_timeline_indexer(self, source):
+        """
+        Starts the background analysis of the video file and periodically collects its results
+
+        :param source: the path to the video file to analyse
+        :type source: str
+        """
+        from video_player.TimelineIndexer import TimelineIndexer
+
+        if self.__timeline_indexer is not None:
+            self.__timeline_indexer.stop()
+        self.__timeline_indexer = TimelineIndexer(source, self.__logger, self.__detection_cache,
+                                                  **self.__detection_settings)
+        self.__timeline_person.set("")
+        self.__timeline_menu.delete(1, tk.END)
+        self.__draw_timeline()
+        self.__root.after(500, lambda: self.__poll_timeline_indexer(self.__timeline_indexer))
+
+    def __poll_timeline_indexer(self, indexer):
+        """
+        Adds the results of the background analysis to the timeline and redraws it, repeats itself every 500ms as long
+        as the analysis belongs to the current video
+
+        :param indexer: the background analysis to poll
+        :type indexer: video_player.TimelineIndexer.TimelineIndexer
+        """
+        if indexer is not self.__timeline_indexer:
+            return
+        if indexer.poll():
+            known_names = {self.__timeline_menu.entrycget(index, "value")
+                           for index in range(1, self.__timeline_menu.index(tk.END) + 1)}
+            for name in indexer.timeline.get_names():
+                if name not in known_names:
+                    self.__timeline_menu.add_radiobutton(label=name, variable=self.__timeline_person, value=name)
+            self.__draw_timeline()
+        self.__root.after(500, lambda: self.__poll_timeline_indexer(indexer))
+
+    def __draw_timeline(self):
+        """
+        Draws the segments in which the selected person (or everyone) appears below the time bar
+        """
+        canvas = self.__timeline_canvas
+        canvas.delete("all")
+        if self.__timeline_indexer is None or self.__duration_in_sec <= 0:
+            return
+        timeline = self.__timeline_indexer.timeline
+        selected = self.__timeline_person.get()
+        names = [selected] if selected else timeline.get_names()
+        colors = ["red", "yellow", "cyan", "lime", "orange", "magenta", "white"]
+
+        width = canvas.winfo_width()
+        duration_in_ms = self.__duration_in_sec * 1000
+        for name_nr, name in enumerate(names):
+            for start, end in timeline.get_segments(name):
+                x_start = start / duration_in_ms * width
+                x_end = max(x_start + 1, end / duration_in_ms * width)
+                canvas.create_rectangle(x_start, 0, x_end, 6, width=0, fill=colors[name_nr % len(colors)])
+
+    def __jump_to_timeline_position(self, x):
+        """
+        Jumps to the time of the video matching the clicked position on the timeline
+
+        :param x: horizontal position on the timeline canvas
+        :type x: int
+        """
+        width = self.__timeline_canvas.winfo_width()
+        if self.__duration_in_sec <= 0 or width <= 0:
+            return
+        self.__vlc_player.go_to_position(int(x / width * self.__duration_in_sec), self.__update_rest_time_label,
+                                         self.__play_video)
+
+    def __start_warm_up(self, waited_ms=0):
+        """
+        Starts loading the face stack once the first frame of the initial video was shown (at most 3 seconds later),
+        such that the loading does not compete with the start of the playback
+
+        :param waited_ms: time waited for the first frame so far
+        :type waited_ms: int
+        """
+        frame_handler = self.__vlc_player.get_frame_handler()
+        if frame_handler is not None and frame_handler.displayed_frames == 0 and waited_ms < 3000:
+            self.__root.after(100, lambda: self.__start_warm_up(waited_ms + 100))
+            return
+        self.__warm_up.start()
+        self.__poll_warm_up()
+
+    def __poll_warm_up(self):
+        """
+        Shows the progress of the warm-up in the Detector menu and enables the face detection once it finished,
+        repeats itself every 200ms until then
+        """
+        warm_up = self.__warm_up
+        if not warm_up.is_finished:
+            self.__menubar.entryconfigure(2, label=f"Detector ({warm_up.message.lower()} {warm_up.progress:.0%})")
+            self.__root.after(200, self.__poll_warm_up)
+            return
+
+        if warm_up.enc_manager is None:
+            self.__menubar.entryconfigure(2, label="Detector (unavailable)")
+            messagebox.showerror("Face recognition", warm_up.error)
+            return
+
+        self.__enc_manager = warm_up.enc_manager
+        self.__vlc_player.set_encoding_manager(self.__enc_manager)
+        if warm_up.detector is not None:
+            # the first detection uses the detector the warm-up prepared instead of creating it again
+            self.__vlc_player.set_face_detector(self.__detection_settings["face_recognition_model"], warm_up.detector)
+        self.__update_activation_entry()
+        self.__menubar.entryconfigure(1, state=tk.NORMAL)
+        self.__menubar.entryconfigure(2, state=tk.NORMAL)
+        self.__switch_activation_state(2)
+        if self.__encodings_poll_interval:
+            self.__enc_manager.start_watching(self.__encodings_poll_interval)
+            self.__root.after(1000, self.__poll_encodings)
+        self.__logger_info(f"Face recognition is ready with {len(self.__enc_manager.known_face_encodings)} encodings")
+        if warm_up.error is not None:
+            messagebox.showwarning("Face detector", warm_up.error)
+
+    def __poll_encodings(self):
+        """
+        Updates the number of known face encodings in the Detector menu, such that encodings reloaded in the background
+        become visible, repeats itself every second
+        """
+        self.__update_activation_entry()
+        self.__root.after(1000, self.__poll_encodings)
+
+    def __update_activation_entry(self):
+        """
+        Shows the number of known face encodings in the Activate entry of the Detector menu, the entry is only enabled
+        if there are known encodings
+        """
+        len_known_encodings = len(self.__enc_manager.known_face_encodings)
+        if len_known_encodings == 0:
+            self.__detector_menu.entryconfigure(0, label="Activate (no known encodings)", state=tk.DISABLED)
+        else:
+            self.__detector_menu.entryconfigure(0, label=f"Activate ({len_known_encodings} face encodings)",
+                                                state=tk.NORMAL)
+
+    def __update_stats_overlay(self):
+        """
+        Shows the median and 95th percentile of the pipeline stages and the display frame rate on top of the video,
+        repeats itself every second
+        """
+        lines = []
+        frame_handler = self.__vlc_player.get_frame_handler()
+        if frame_handler is not None:
+            render_stats = frame_handler.get_render_stats()
+            lines.append(f"display {render_stats['display_fps']:5.1f} fps, "
+                         f"{render_stats['dropped_frames']} dropped")
+        if self.__scene_gate is not None:
+            decisions = self.__scene_gate.decisions
+            lines.append(f"scene gate {decisions['detect']} detected, {decisions['reuse']} reused, "
+                         f"{decisions['refresh']} cuts")
+        for stage, stats in self.__pipeline_stats.snapshot().items():
+            lines.append(f"{stage:<16} p50 {stats['p50'] * 1000:6.1f}ms p95 {stats['p95'] * 1000:6.1f}ms")
+        self.__stats_label.configure(text="\n".join(lines))
+        self.__root.after(1000, self.__update_stats_overlay)
+
+    def __switch_face_detector(self):
+        """
+        Switches the face detector backend to the one selected in the Detector menu, if the backend cannot be created
+        (e.g. its model file is missing) the previous one is kept
+        """
+        detector_name = self.__face_detector.get()
+        previous_name = self.__detection_settings["face_recognition_model"]
+        try:
+            self.__vlc_player.set_face_detector(detector_name)
+        except (IOError, ValueError) as error:
+            self.__logger_info(f"Face detector {detector_name} could not be created: {error}")
+            messagebox.showerror("Face detector", str(error))
+            self.__face_detector.set(previous_name)
+            return
+        self.__detection_settings["face_recognition_model"] = detector_name
 
     def __switch_activation_state(self, index):
         """
@@ -351,13 +674,10 @@ class VideoPlayerWindow:
             self.__logger_info("Face detector/recognizer was deactivated")
             self.__menubar.entryconfigure(index, label="Detector (deactivated)")
 
-    def __open_encoding_creation_dialog(self, menu):
+    def __open_encoding_creation_dialog(self):
         """
         Opens first a dialog to choose a picture to derive the encoding from
         and then forwards it to the encoding manager which stores it in a file
-
-        :param: the menu the submenu should be updated
-        :type: tk.Menu
         """
         self.__logger_info("Menubar Encoding-> 'Add face encoding' was clicked")
         self.__pause_video()
@@ -370,14 +690,16 @@ class VideoPlayerWindow:
                                                 filetypes=file_types)
 
         if len(new_source) != 0:
+            # already imported by the warm-up, the Encoding menu is enabled once it finished
+            import face_recognition as fr
+
             img = fr.load_image_file(new_source)
             encoding = fr.face_encodings(img, model="large", num_jitters=self.__num_jitters)[0]
 
-            name = os.path.basename(new_source).split(".")[0]
+            name = os.path.splitext(os.path.basename(new_source))[0]
             self.__enc_manager.add_encoding(name, encoding)
 
-            menu.entryconfigure(0, label=f"Activate ({len(self.__enc_manager.known_face_encodings)} face encodings)",
-                                state=tk.NORMAL)
+            self.__update_activation_entry()
 
     def __logger_info(self, msg):
         """
@@ -389,7 +711,11 @@ class VideoPlayerWindow:
         self.__logger.info(f"VideoPlayerWindow: {msg}")
 
 
-def open_window(initial_source=None, num_jitters=20, frames_to_skip=3, face_recognition_model="hog"):
+def open_window(initial_source=None, num_jitters=20, frames_to_skip=3, face_recognition_model="hog",
+                detection_max_size=640, number_of_times_to_upsample=1, detection_cpu_share=0.5,
+                use_detection_cache=True, use_timeline_indexer=False, stats_path=None, stats_interval=5.0,
+                stats_format="prometheus", show_stats_overlay=False, encodings_poll_interval=2.0, use_scene_gate=True,
+                scene_gate_roi=None, scene_gate_masks=()):
     """
     Open the video player window
 
@@ -399,12 +725,63 @@ def open_window(initial_source=None, num_jitters=20, frames_to_skip=3, face_reco
     :param num_jitters: How many times to re-sample the face when calculating encoding
     :type num_jitters: int
 
-    :param frames_to_skip: The number of frames to skip when face detection is activated
+    :param frames_to_skip: The number of frames to skip when face detection is activated, None to adapt it to the
+    measured detection time
     :type frames_to_skip: int
 
-    :param face_recognition_model: The model used for face recognition, either "cnn" which is accurate, slower and used GPU or
-    "hog" which is faster but not as precise
+    :param face_recognition_model: The face detector backend, either "cnn" which is accurate, slower and used GPU,
+    "hog" which is faster but not as precise, "haar" (OpenCV Haar cascade) which is several times faster than "hog" on
+    the CPU or "dnn" (OpenCV single shot detector from the models directory), it can be switched in the Detector menu
     :type face_recognition_model: str
+
+    :param detection_max_size: Maximal length of the longer image edge the face detection runs on, larger frames are
+    downscaled independently of the window size, None or 0 to detect on the full resolution
+    :type detection_max_size: int
+
+    :param number_of_times_to_upsample: How many times the detection image is upsampled to find smaller faces
+    :type number_of_times_to_upsample: int
+
+    :param detection_cpu_share: If frames_to_skip is None, the frames handed over to the face detection are chosen such
+    that the detection uses this share of the time between two frames
+    :type detection_cpu_share: float
+
+    :param use_detection_cache: whether detection results are cached on disk, such that replaying or seeking in an
+    already analysed video reuses them instead of running the face detection again
+    :type use_detection_cache: bool
+
+    :param use_timeline_indexer: whether opened videos are analysed ahead of the playhead in a background process, such
+    that the playback shows the faces without inline detection and the time bar highlights where each person appears
+    (requires the detection cache)
+    :type use_timeline_indexer: bool
+
+    :param stats_path: file the durations of the pipeline stages (rolling percentiles and throughput) are written to,
+    None to not write them
+    :type stats_path: str
+
+    :param stats_interval: seconds between two writes of the pipeline stats
+    :type stats_interval: float
+
+    :param stats_format: format of the pipeline stats file, either "prometheus" (text exposition format) or "json"
+    :type stats_format: str
+
+    :param show_stats_overlay: whether the durations of the pipeline stages are shown on top of the video
+    :type show_stats_overlay: bool
+
+    :param encodings_poll_interval: seconds between two checks of the encodings directory, encodings added by other
+    tools (e.g. python -m video_player enroll) are loaded without restarting the window, None or 0 to not check it
+    :type encodings_poll_interval: float
+
+    :param use_scene_gate: whether the faces are only detected again if the scene changed (motion in the frame or a
+    hard cut), frames of a static scene keep the tracked faces
+    :type use_scene_gate: bool
+
+    :param scene_gate_roi: region (x, y, width, height) as fractions of the frame the scene changes are looked for in,
+    e.g. (0, 0.2, 1, 0.8) to ignore the top fifth, None for the whole frame
+    :type scene_gate_roi: tuple
+
+    :param scene_gate_masks: regions (x, y, width, height) as fractions of the frame which are ignored when looking for
+    scene changes, e.g. [(0, 0.9, 1, 0.1)] for a news ticker at the bottom
+    :type scene_gate_masks: list
     """
 
     # starting VideoPlayerWindow with initial video path if given
@@ -421,17 +798,44 @@ def open_window(initial_source=None, num_jitters=20, frames_to_skip=3, face_reco
     elif num_jitters < 1:
         num_jitters = 1
 
-    if frames_to_skip > 20:
+    if frames_to_skip is not None and frames_to_skip > 20:
         frames_to_skip = 20
-    elif frames_to_skip < 0:
+    elif frames_to_skip is not None and frames_to_skip < 0:
         frames_to_skip = 0
 
-    if face_recognition_model not in ["cnn", "hog"]:
+    if detection_cpu_share > 1:
+        detection_cpu_share = 1
+    elif detection_cpu_share < 0.05:
+        detection_cpu_share = 0.05
+
+    if face_recognition_model not in VideoPlayerWindow.detector_labels:
         face_recognition_model = "hog"
 
+    if detection_max_size is None or detection_max_size <= 0:
+        detection_max_size = None
+    elif detection_max_size < 160:
+        detection_max_size = 160
+
+    if number_of_times_to_upsample > 3:
+        number_of_times_to_upsample = 3
+    elif number_of_times_to_upsample < 0:
+        number_of_times_to_upsample = 0
+
+    if stats_format not in ["prometheus", "json"]:
+        stats_format = "prometheus"
+
+    if stats_interval < 0.5:
+        stats_interval = 0.5
+
+    if encodings_poll_interval is not None and 0 < encodings_poll_interval < 0.5:
+        encodings_poll_interval = 0.5
+
     if initial_source is not None:
         logger.info(f"Open VideoPlayerWindow with initial video {initial_source}")
     else:
         logger.info(f"Open VideoPlayerWindow without initial video")
 
-    VideoPlayerWindow(logger, initial_source, num_jitters, frames_to_skip, face_recognition_model)
\ No newline at end of file
+    VideoPlayerWindow(logger, initial_source, num_jitters, frames_to_skip, face_recognition_model,
+                      detection_max_size, number_of_times_to_upsample, detection_cpu_share, use_detection_cache,
+                      use_timeline_indexer, stats_path, stats_interval, stats_format, show_stats_overlay,
+                      encodings_poll_interval, use_scene_gate, scene_gate_roi, scene_gate_masks)
\ No newline at end of file
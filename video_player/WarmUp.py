@@ -0,0 +1,108 @@
+"""
+This script contains a background task loading the face stack (the dlib models of face_recognition, the known face
+encodings and the face detector backend), such that the window and the first video frame do not wait for it.
+"""
+import threading
+
+
+class WarmUp:
+
+    def __init__(self, logger, face_recognition_model="hog", number_of_times_to_upsample=1, encodings_path=None):
+        """
+        Constructor of the WarmUp
+
+        Starts a daemon thread which imports face_recognition (loading the dlib models), loads the known face
+        encodings and creates the face detector, which runs once on a blank image and is handed to the playback
+        afterwards. Its progress can be polled from the GUI thread. NumPy, OpenCV and the face stack are only imported
+        by the thread.
+
+        :param logger: object used to perform logging
+        :type logger: logging.Logger
+
+        :param face_recognition_model: The face detector backend to prepare, one of
+        video_player.FaceDetectors.DETECTOR_NAMES
+        :type face_recognition_model: str
+
+        :param number_of_times_to_upsample: How many times the detection image is upsampled to find smaller faces
+        :type number_of_times_to_upsample: int
+
+        :param encodings_path: directory containing the encoding store, None to use the encodings directory of the
+        project
+        :type encodings_path: str
+        """
+        self.__logger = logger
+        self.__face_recognition_model = face_recognition_model
+        self.__number_of_times_to_upsample = number_of_times_to_upsample
+        self.__encodings_path = encodings_path
+
+        self.progress = 0.0
+        """Share of the warm-up which is done, between 0 and 1"""
+        self.message = "Waiting"
+        """Description of the running step"""
+        self.enc_manager = None
+        """The encoding manager with the loaded encodings, set once the encodings are loaded"""
+        self.detector = None
+        """The prepared face detector backend, see video_player.FaceDetectors, None if it could not be created"""
+        self.error = None
+        """Message of the error which ended the warm-up or prevented the detector from being prepared, None if none"""
+        self.is_finished = False
+
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def start(self):
+        """
+        Starts the warm-up thread
+        """
+        self.__logger_info("Start loading the face stack in the background")
+        self.__thread.start()
+
+    def __run(self):
+        """
+        Runs the steps of the warm-up, the steps are ordered by their share of the loading time
+        """
+        try:
+            self.__step(0.05, "Loading face models")
+            import face_recognition  # noqa: F401, the import loads the dlib models
+            import numpy as np
+
+            from video_player.EncodingManager import EncodingManager
+            from video_player.FaceDetectors import create_detector
+
+            self.__step(0.6, "Loading face encodings")
+            self.enc_manager = EncodingManager(self.__logger, self.__encodings_path)
+
+            self.__step(0.9, "Preparing face detector")
+            try:
+                detector = create_detector(self.__face_recognition_model, self.__number_of_times_to_upsample)
+                detector.locate(np.zeros((64, 64, 3), dtype=np.uint8))
+                self.detector = detector
+            except (IOError, ValueError) as error:
+                # the encodings are usable with another backend, which can be selected in the Detector menu
+                self.error = f"Face detector {self.__face_recognition_model} could not be created: {error}"
+                self.__logger_info(self.error)
+            self.__step(1.0, "Ready")
+        except Exception as error:
+            self.error = f"Face recognition could not be loaded: {error}"
+            self.__logger.exception(f"WarmUp: {self.error}")
+        self.is_finished = True
+
+    def __step(self, progress, message):
+        """
+        Reports the start of the next step
+
+        :param progress: share of the warm-up which is done before the step
+        :type progress: float
+        :param message: description of the step
+        :type message: str
+        """
+        self.progress, self.message = progress, message
+        self.__logger_info(f"{message} ({progress:.0%})")
+
+    def __logger_info(self, msg):
+        """
+        Adds a log info entry starting with WarmUp:
+
+        :param msg: the message to write
+        :type msg: str
+        """
+        self.__logger.info(f"WarmUp: {msg}")
@@ -1,4 +1,22 @@
 __author__ = """Florian Ebert"""
 __version__ = "1.0.0"
 
-from .VideoPlayerWindow import open_window
+
+def open_window(*args, **kwargs):
+    """
+    Open the video player window, see video_player.VideoPlayerWindow.open_window for the parameters
+
+    The GUI (tkinter, vlc) is only imported once the window is opened, such that the headless parts of the
+    package can be used without them
+    """
+    from .VideoPlayerWindow import open_window as _open_window
+    _open_window(*args, **kwargs)
+
+
+def open_grid(*args, **kwargs):
+    """
+    Open a window showing several video streams in a grid, see video_player.VideoGridWindow.open_grid for the
+    parameters
+    """
+    from .VideoGridWindow import open_grid as _open_grid
+    _open_grid(*args, **kwargs)
@@ -0,0 +1,193 @@
+"""
+Command line interface of the video_player package
+
+    python -m video_player                       opens the video player window
+    python -m video_player analyze VIDEO         analyses a video file without the GUI
+    python -m video_player enroll DIRECTORY      enrols the faces of all pictures in a directory tree
+    python -m video_player grid SOURCE...        shows several streams in a grid with a shared detection pool
+    python -m video_player index add PATH...     indexes the persons appearing in video files or directories
+    python -m video_player index find NAME       lists the files and times a person appears at
+"""
+import argparse
+import logging
+
+DETECTOR_NAMES = ["hog", "cnn", "haar", "dnn"]
+"""Names of the face detector backends, kept in sync with video_player.FaceDetectors without importing OpenCV"""
+
+
+def main(argv=None):
+    """
+    Parses the command line arguments and runs the selected command
+
+    :param argv: the command line arguments, None to use sys.argv
+    :type argv: list
+    """
+    parser = argparse.ArgumentParser(prog="python -m video_player", description="Video face recognition")
+    commands = parser.add_subparsers(dest="command")
+
+    window = commands.add_parser("window", help="open the video player window (default)")
+    window.add_argument("source", nargs="?", default=None, help="path to the initial video file")
+
+    analyze = commands.add_parser("analyze", help="analyse a video file without the GUI")
+    analyze.add_argument("source", help="path to the video file")
+    analyze.add_argument("-o", "--output", help="file to write the detections to (default: SOURCE.faces.FORMAT)")
+    analyze.add_argument("-f", "--format", choices=["jsonl", "csv"], default="jsonl", help="format of the output file")
+    analyze.add_argument("-p", "--processes", type=int, default=None,
+                         help="number of parallel processes (default: number of cores)")
+    analyze.add_argument("-s", "--segments", type=int, default=None,
+                         help="number of time segments (default: four per process)")
+    analyze.add_argument("--encodings", default=None, help="directory containing the face encodings")
+    analyze.add_argument("--frames-to-skip", type=int, default=0, help="number of frames skipped between analysed ones")
+    analyze.add_argument("--model", choices=DETECTOR_NAMES, default="hog", help="face detector backend")
+    analyze.add_argument("--detection-max-size", type=int, default=640,
+                         help="maximal length of the longer image edge the detection runs on, 0 for full resolution")
+    analyze.add_argument("--upsample", type=int, default=1, help="number of times the detection image is upsampled")
+
+    export = commands.add_parser("export", help="write a copy of a video file with the recognized faces drawn in")
+    export.add_argument("source", help="path to the video file")
+    export.add_argument("-o", "--output", help="annotated video file to write (default: SOURCE.annotated.mp4)")
+    export.add_argument("-p", "--processes", type=int, default=None,
+                        help="number of detection processes (default: all cores but two)")
+    export.add_argument("--codec", default="mp4v", help="four character code of the output codec")
+    export.add_argument("--encodings", default=None, help="directory containing the face encodings")
+    export.add_argument("--frames-to-skip", type=int, default=2,
+                        help="number of frames between two detected frames, the faces are tracked in between")
+    export.add_argument("--model", choices=DETECTOR_NAMES, default="hog", help="face detector backend")
+    export.add_argument("--detection-max-size", type=int, default=640,
+                        help="maximal length of the longer image edge the detection runs on, 0 for full resolution")
+    export.add_argument("--upsample", type=int, default=1, help="number of times the detection image is upsampled")
+
+    enroll = commands.add_parser("enroll", help="enrol the faces of all pictures in a directory tree")
+    enroll.add_argument("directory", help="directory of pictures named after the person or of one sub directory per "
+                                          "person")
+    enroll.add_argument("--encodings", default=None, help="directory containing the face encodings")
+    enroll.add_argument("-p", "--processes", type=int, default=None,
+                        help="number of parallel processes (default: number of cores)")
+    enroll.add_argument("--num-jitters", type=int, default=20,
+                        help="how many times the face is re-sampled when calculating the encoding")
+    enroll.add_argument("--model", choices=DETECTOR_NAMES, default="hog", help="face detector backend")
+    enroll.add_argument("--batch-size", type=int, default=100, help="number of encodings written at once")
+    enroll.add_argument("--report", default=None, help="JSON file listing the pictures which were not enrolled")
+
+    grid = commands.add_parser("grid", help="show several streams in a grid with a shared detection pool")
+    grid.add_argument("sources", nargs="+", help="paths or URLs of the streams")
+    grid.add_argument("-c", "--columns", type=int, default=None, help="number of columns (default: square grid)")
+    grid.add_argument("-w", "--workers", type=int, default=None,
+                      help="number of shared detection threads (default: half of the cores)")
+    grid.add_argument("--no-loop", action="store_true", help="do not restart streams once they ended")
+    grid.add_argument("--model", choices=DETECTOR_NAMES, default="hog", help="face detector backend")
+    grid.add_argument("--detection-max-size", type=int, default=640,
+                      help="maximal length of the longer image edge the detection runs on, 0 for full resolution")
+    grid.add_argument("--no-scene-gate", action="store_true",
+                      help="detect every due frame instead of only frames whose scene changed")
+
+    index = commands.add_parser("index", help="maintain and query the index of persons appearing in video files")
+    index.add_argument("--db", default=None, help="SQLite file of the index (default: appearance_index.sqlite3)")
+    index.add_argument("--encodings", default=None, help="directory containing the face encodings")
+    index_commands = index.add_subparsers(dest="index_command", required=True)
+    index_add = index_commands.add_parser("add", help="index video files and the video files of directories")
+    index_add.add_argument("paths", nargs="+", help="video files or directories")
+    index_add.add_argument("-p", "--processes", type=int, default=None,
+                           help="number of parallel processes (default: number of cores)")
+    index_add.add_argument("--step-ms", type=int, default=500, help="milliseconds between two analysed frames")
+    index_add.add_argument("--model", choices=DETECTOR_NAMES, default="hog", help="face detector backend")
+    index_add.add_argument("--detection-max-size", type=int, default=640,
+                           help="maximal length of the longer image edge the detection runs on, 0 for full resolution")
+    index_add.add_argument("--upsample", type=int, default=1, help="number of times the detection image is upsampled")
+    index_find = index_commands.add_parser("find", help="list the segments a person appears in")
+    index_find.add_argument("name", help="name of the person")
+    index_find.add_argument("--min-confidence", type=float, default=0.0,
+                            help="minimal confidence (1 - face distance) of the listed segments")
+    index_commands.add_parser("names", help="list the persons appearing in the indexed files")
+    index_commands.add_parser("update", help="match the indexed faces against new encodings without decoding again")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "analyze":
+        from video_player.VideoAnalyzer import analyze_video
+
+        logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
+        output = args.output or f"{args.source}.faces.{args.format}"
+        analyze_video(args.source, output, logging.getLogger(), output_format=args.format, processes=args.processes,
+                      segments=args.segments, encodings_path=args.encodings, frames_to_skip=args.frames_to_skip,
+                      face_recognition_model=args.model, detection_max_size=args.detection_max_size,
+                      number_of_times_to_upsample=args.upsample)
+    elif args.command == "export":
+        from video_player.VideoExporter import export_video
+
+        logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
+        output = args.output or f"{args.source}.annotated.mp4"
+        export_video(args.source, output, logging.getLogger(), encodings_path=args.encodings,
+                     frames_to_skip=max(0, args.frames_to_skip), face_recognition_model=args.model,
+                     detection_max_size=args.detection_max_size, number_of_times_to_upsample=args.upsample,
+                     processes=args.processes, codec=args.codec)
+    elif args.command == "enroll":
+        from video_player.BulkEnrolment import enrol_directory
+        from video_player.EncodingManager import EncodingManager
+
+        logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
+        logger = logging.getLogger()
+        enrol_directory(args.directory, EncodingManager(logger, args.encodings), logger, processes=args.processes,
+                        num_jitters=min(100, max(1, args.num_jitters)), face_recognition_model=args.model,
+                        batch_size=args.batch_size, report_path=args.report)
+    elif args.command == "grid":
+        from video_player.VideoGridWindow import open_grid
+
+        open_grid(args.sources, columns=args.columns, detection_workers=args.workers, loop=not args.no_loop,
+                  face_recognition_model=args.model, detection_max_size=args.detection_max_size,
+                  use_scene_gate=not args.no_scene_gate)
+    elif args.command == "index":
+        _run_index_command(args)
+    else:
+        from video_player.VideoPlayerWindow import open_window
+
+        open_window(initial_source=getattr(args, "source", None))
+
+
+def _run_index_command(args):
+    """
+    Runs a sub command of the index command, queries print their result as tab separated lines
+
+    :param args: the parsed command line arguments
+    :type args: argparse.Namespace
+    """
+    from video_player.AppearanceIndex import AppearanceIndex
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
+                        level=logging.INFO if args.index_command in ("add", "update") else logging.WARNING)
+    logger = logging.getLogger()
+    index = AppearanceIndex(logger, args.db)
+    try:
+        if args.index_command == "find":
+            for segment in index.find(args.name, args.min_confidence):
+                print(f"{segment['path']}\t{_format_ms(segment['start_ms'])}\t{_format_ms(segment['end_ms'])}\t"
+                      f"{segment['confidence']:.2f}\t{segment['sightings']}")
+        elif args.index_command == "names":
+            for name, file_count, duration_ms in index.get_names():
+                print(f"{name}\t{file_count}\t{_format_ms(duration_ms)}")
+        else:
+            from video_player.EncodingManager import EncodingManager
+
+            enc_manager = EncodingManager(logger, args.encodings)
+            if args.index_command == "add":
+                index.add_files(args.paths, enc_manager, step_ms=max(1, args.step_ms), processes=args.processes,
+                                face_recognition_model=args.model, detection_max_size=args.detection_max_size,
+                                number_of_times_to_upsample=args.upsample)
+            else:
+                index.update_identities(enc_manager)
+    finally:
+        index.close()
+
+
+def _format_ms(time_ms):
+    """
+    Formats milliseconds as H:MM:SS.mmm
+    """
+    seconds, milliseconds = divmod(int(time_ms), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+if __name__ == "__main__":
+    main()